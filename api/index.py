@@ -6,17 +6,49 @@ import os
 import re
 import asyncio
 import uuid
-import urllib.request
-from datetime import datetime
-from urllib.parse import urlparse
+import zlib
+import gzip
+import base64
+import hashlib
+import time
+import random
+import math
+import sys
+import queue
+import threading
+import contextvars
+import importlib.util
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
 from collections import defaultdict
 
-# Try to import httpx, handle if not available
+# Heavy optional dependencies are only located here and imported on first
+# use, so cold starts serving /api or /api/models never pay for them
+HTTPX_AVAILABLE = importlib.util.find_spec("httpx") is not None
+BROTLI_AVAILABLE = importlib.util.find_spec("brotli") is not None
+_httpx = None
+
+def get_httpx():
+    global _httpx
+    if _httpx is None:
+        import httpx
+        _httpx = httpx
+    return _httpx
+
+# Fast JSON path when orjson is installed, compact stdlib encoding otherwise
 try:
-    import httpx
-    HTTPX_AVAILABLE = True
+    import orjson
+
+    def json_bytes(obj):
+        return orjson.dumps(obj)
+
+    json_parse = orjson.loads
 except ImportError:
-    HTTPX_AVAILABLE = False
+    def json_bytes(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    json_parse = json.loads
 
 # ============== CONFIG ==============
 
@@ -52,38 +84,523 @@ COUNCIL_MODELS = [
 ]
 
 CHAIRMAN_MODEL = "google/gemini-3-pro-preview"
+# Chairman failover: ordered fallbacks, stage 3 gets what is left of the request
+# SLO (at least CHAIRMAN_MIN_DEADLINE), each non-final attempt a share of it
+CHAIRMAN_FALLBACK_MODELS = [m for m in os.getenv(
+    "CHAIRMAN_FALLBACK_MODELS", "anthropic/claude-opus-4.5,openai/gpt-5.2").split(",") if m]
+REQUEST_SLO_SECONDS = float(os.getenv("REQUEST_SLO_SECONDS", "180"))
+CHAIRMAN_MIN_DEADLINE = 20.0
+CHAIRMAN_ATTEMPT_SHARE = 0.6
+CHAIRMAN_RACE = os.getenv("CHAIRMAN_RACE", "0") == "1"
+RANKING_MODE = os.getenv("RANKING_MODE", "text")  # "text" or "structured"
+RANKING_CRITERIA = ["accuracy", "insight", "clarity"]
+# Answers each stage 2 reviewer ranks (0 = all); keeps stage 2 linear in council size
+REVIEW_SAMPLE_SIZE = int(os.getenv("REVIEW_SAMPLE_SIZE", "0"))
+# Per-stage generation limits (a request's "generation" overrides them per stage);
+# None = no limit. Stage 2 thinks at low effort but is not capped: a cut would
+# lose the FINAL RANKING block, which comes last.
+GENERATION_PROFILES = {
+    "stage1": {"max_tokens": None, "reasoning_effort": None, "include_reasoning": True},
+    "stage2": {"max_tokens": None, "reasoning_effort": "low", "include_reasoning": False},
+    "stage3": {"max_tokens": None, "reasoning_effort": "medium", "include_reasoning": False},
+    "retrieval": {"max_tokens": 200, "reasoning_effort": None, "include_reasoning": False},
+}
+# Near-identical stage 1 answers (word 3-gram Jaccard >= threshold) are reviewed once, as one cluster
+DEDUPE_ENABLED = os.getenv("LLM_COUNCIL_DEDUPE", "1") == "1"
+DEDUPE_THRESHOLD = 0.8
+GENERATION_FIELDS = {"max_tokens": int, "reasoning_effort": str, "reasoning_max_tokens": int, "include_reasoning": bool, "stop": list}
 OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
 
+# Static responses serialized once at import
+HEALTH_BODY = json_bytes({"status": "ok", "service": "LLM Council API"})
+MODELS_BODY = json_bytes({
+    "available_models": AVAILABLE_MODELS,
+    "default_council_models": COUNCIL_MODELS,
+    "default_chairman_model": CHAIRMAN_MODEL
+})
+
+# ============== TRACING ==============
+
+# One trace per council run with child spans per stage, model call and KV
+# operation. Sampled per trace; exported as JSON lines (TRACING_PATH) or
+# OTLP/HTTP JSON (OTEL_EXPORTER_OTLP_TRACES_ENDPOINT) when the trace ends.
+TRACING_ENABLED = os.getenv("LLM_COUNCIL_TRACING", "0") == "1"
+TRACING_SAMPLE_RATE = float(os.getenv("LLM_COUNCIL_TRACING_SAMPLE_RATE", "0.1"))
+TRACING_EXPORTER = os.getenv("LLM_COUNCIL_TRACING_EXPORTER", "json")
+TRACING_PATH = os.getenv("LLM_COUNCIL_TRACING_PATH", "/tmp/traces.jsonl")
+TRACING_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT", "http://localhost:4318/v1/traces")
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class _NoopSpan(dict):
+    def __setitem__(self, key, value):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+@contextmanager
+def span(name, **attributes):
+    """Child span of the current one; yields a dict of attributes (no-op outside a sampled trace)."""
+    parent = _current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+    record = {"trace_id": parent["trace_id"], "span_id": os.urandom(8).hex(), "parent_id": parent["span_id"],
+              "name": name, "start_ns": time.time_ns(), "end_ns": None, "attributes": attributes,
+              "error": None, "_spans": parent["_spans"]}
+    parent["_spans"].append(record)
+    token = _current_span.set(record)
+    try:
+        yield attributes
+    except BaseException as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record["end_ns"] = time.time_ns()
+        _current_span.reset(token)
+
+def off_loop(fn, *args):
+    """Call blocking fn now, or in the default executor when on an event loop (it does not wait)."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return fn(*args)
+    loop.run_in_executor(None, fn, *args)
+
+@contextmanager
+def start_trace(name, **attributes):
+    if _current_span.get() is not None or not TRACING_ENABLED or random.random() >= TRACING_SAMPLE_RATE:
+        with span(name, **attributes) as attrs:
+            yield attrs
+        return
+    spans = []
+    root = {"trace_id": os.urandom(16).hex(), "span_id": None, "_spans": spans}
+    token = _current_span.set(root)
+    try:
+        with span(name, **attributes) as attrs:
+            yield attrs
+    finally:
+        _current_span.reset(token)
+        off_loop(export_trace, spans)
+
+def export_trace(spans):
+    records = [{k: v for k, v in s.items() if k != "_spans"} for s in spans]
+    try:
+        if TRACING_EXPORTER == "otlp":
+            import urllib.request
+            otlp = [{"traceId": r["trace_id"], "spanId": r["span_id"], "name": r["name"], "kind": 1,
+                     **({"parentSpanId": r["parent_id"]} if r["parent_id"] else {}),
+                     "startTimeUnixNano": str(r["start_ns"]), "endTimeUnixNano": str(r["end_ns"] or r["start_ns"]),
+                     "attributes": [{"key": k, "value": {"boolValue": v} if isinstance(v, bool) else
+                                     {"intValue": str(v)} if isinstance(v, int) else
+                                     {"doubleValue": v} if isinstance(v, float) else {"stringValue": str(v)}}
+                                    for k, v in r["attributes"].items() if v is not None],
+                     "status": {"code": 2, "message": r["error"]} if r["error"] else {"code": 1}} for r in records]
+            body = {"resourceSpans": [{"resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "llm-council"}}]},
+                                       "scopeSpans": [{"scope": {"name": "llm-council"}, "spans": otlp}]}]}
+            req = urllib.request.Request(TRACING_OTLP_ENDPOINT, data=json_bytes(body), method="POST",
+                                         headers={"Content-Type": "application/json"})
+            urllib.request.urlopen(req, timeout=2).close()
+        else:
+            with open(TRACING_PATH, 'ab') as f:
+                for r in records:
+                    f.write(json_bytes(r) + b"\n")
+    except Exception as e:
+        print(f"Trace export failed: {e}")
+
+# ============== PROFILING ==============
+
+# Opt-in flight recorder: samples the handler thread's stack while a council
+# runs, dumps pending asyncio tasks once it passes PROFILING_SLOW_SECONDS, and
+# keeps the last PROFILING_RING_SIZE slow councils in KV (admin endpoint)
+PROFILING_ENABLED = os.getenv("LLM_COUNCIL_PROFILING", "0") == "1"
+PROFILING_SLOW_SECONDS = float(os.getenv("LLM_COUNCIL_PROFILING_SLOW_SECONDS", "30"))
+PROFILING_SAMPLE_INTERVAL = 0.01
+PROFILING_RING_SIZE = 20
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+_profiles = {}
+_profiles_lock = threading.Lock()
+_profile_current = contextvars.ContextVar("profile_current", default=None)
+_sampler = None
+
+def _frame_name(f):
+    return f"{f.f_code.co_name} ({f.f_code.co_filename.rsplit('/', 1)[-1]}:{f.f_lineno})"
+
+def _dump_tasks(rec, requested_at):
+    rec["task_dumps"].append({"at": round(time.monotonic() - rec["start"], 3),
+                              "loop_lag": round(time.monotonic() - requested_at, 4),
+                              "tasks": [{"task": t.get_name(), "stack": [_frame_name(f) for f in t.get_stack(limit=8)]}
+                                        for t in asyncio.all_tasks(rec["loop"])]})
+
+def _sample_loop():
+    while True:
+        time.sleep(PROFILING_SAMPLE_INTERVAL)
+        with _profiles_lock:
+            recs = list(_profiles.values())
+        frames = sys._current_frames() if recs else {}
+        for rec in recs:
+            frame, names = frames.get(rec["thread"]), []
+            while frame is not None and len(names) < 64:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                stack = ";".join(reversed(names))
+                rec["samples"][stack] = rec["samples"].get(stack, 0) + 1
+            if not rec["dumped"] and time.monotonic() - rec["start"] >= PROFILING_SLOW_SECONDS:
+                rec["dumped"] = True
+                try:
+                    rec["loop"].call_soon_threadsafe(_dump_tasks, rec, time.monotonic())
+                except RuntimeError:
+                    pass
+
+@contextmanager
+def profile_request(name, **attributes):
+    """Record a council run (from inside its event loop); slow ones are pushed to KV."""
+    global _sampler
+    if not PROFILING_ENABLED:
+        yield None
+        return
+    rec = {"id": uuid.uuid4().hex[:12], "name": name, "attributes": attributes, "started_at": datetime.utcnow().isoformat(),
+           "start": time.monotonic(), "thread": threading.get_ident(), "loop": asyncio.get_running_loop(),
+           "samples": {}, "stages": [], "task_dumps": [], "dumped": False}
+    if _sampler is None:
+        _sampler = threading.Thread(target=_sample_loop, name="profiling-sampler", daemon=True)
+        _sampler.start()
+    with _profiles_lock:
+        _profiles[rec["id"]] = rec
+    token = _profile_current.set(rec)
+    try:
+        yield rec
+    finally:
+        _profile_current.reset(token)
+        with _profiles_lock:
+            _profiles.pop(rec["id"], None)
+        duration = time.monotonic() - rec["start"]
+        if duration >= PROFILING_SLOW_SECONDS:
+            top = sorted(rec["samples"].items(), key=lambda kv: -kv[1])[:50]
+            entry = {k: rec[k] for k in ("id", "name", "attributes", "started_at", "stages", "task_dumps")}
+            entry.update(duration=round(duration, 3), sample_interval=PROFILING_SAMPLE_INTERVAL,
+                         profile=[{"stack": st, "count": c} for st, c in top])
+            off_loop(kv_pipeline, ["LPUSH", "slow_requests", json_bytes(entry).decode()],
+                     ["LTRIM", "slow_requests", 0, PROFILING_RING_SIZE - 1])
+
+@contextmanager
+def profile_stage(name):
+    rec = _profile_current.get()
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        if rec is not None:
+            rec["stages"].append({"stage": name, "start": round(start - rec["start"], 3),
+                                  "duration": round(time.monotonic() - start, 3)})
+
 # ============== VERCEL KV ==============
 
+# Values are stored as "z1:" + base64(zlib(json, preset dictionary)); values
+# without the marker are legacy plain JSON and are still read as such.
+KV_COMPRESSION = os.getenv("KV_COMPRESSION", "zlib")  # "zlib" or "none"
+KV_COMPRESSED_PREFIX = "z1:"
+# Never edit in place: values written with it can only be read with the same bytes
+KV_ZDICT_V1 = "".join([
+    "FINAL RANKING:\\n1. Response A\\n2. Response B\\n3. Response C\\n4. Response D",
+    "anthropic/claude-opus-4.5", "openai/gpt-5.2", "x-ai/grok-4", "google/gemini-3-pro-preview",
+    '"created_at":"', '"title":"', '"messages":[', '"version":', '"average_rank":',
+    '"metadata":{"label_to_model":{"Response A":"', '"aggregate_rankings":[{"model":"',
+    '"parsed_ranking":["Response A","Response B","Response C","Response D"]',
+    '"parse_method":"numbered"', '","ranking":"', '"stage3":{"model":"', '"stage2":[{"model":"',
+    '{"role":"user","content":"', '{"role":"assistant","stage1":[{"model":"', '","response":"',
+]).encode()
+
+def encode_kv_value(value):
+    raw = json_bytes(value)
+    if KV_COMPRESSION != "zlib":
+        return raw
+    c = zlib.compressobj(6, zdict=KV_ZDICT_V1)
+    return KV_COMPRESSED_PREFIX.encode() + base64.b64encode(c.compress(raw) + c.flush())
+
+def decode_kv_value(result):
+    if result.startswith(KV_COMPRESSED_PREFIX):
+        d = zlib.decompressobj(zdict=KV_ZDICT_V1)
+        packed = base64.b64decode(result[len(KV_COMPRESSED_PREFIX):])
+        return json_parse(d.decompress(packed) + d.flush())
+    return json_parse(result)
+
+_kv_local = threading.local()
+
+# Commands that must not run twice: they are only resent when sending failed
+KV_UNSAFE_COMMANDS = {"INCR", "INCRBY", "DECR", "DECRBY", "HINCRBY", "ZINCRBY", "APPEND",
+                      "LPUSH", "RPUSH", "LPOP", "RPOP", "SPOP", "GETDEL", "EVAL"}
+
+def kv_request(method, path, body=None, retry_safe=True):
+    """One Upstash REST call over a kept-alive per-thread connection; returns the parsed reply.
+
+    A stale kept-alive connection is replaced and the call resent once. When the
+    request went out but the reply was lost, it is only resent if retry_safe.
+    """
+    import http.client
+    url = urlparse(KV_URL)
+    headers = {"Authorization": f"Bearer {KV_TOKEN}", "Content-Type": "application/json"}
+    for attempt in (1, 2):
+        conn = getattr(_kv_local, "conn", None)
+        if conn is None:
+            conn_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+            conn = _kv_local.conn = conn_class(url.netloc, timeout=10)
+        sent = False
+        try:
+            conn.request(method, url.path.rstrip("/") + path, body=body, headers=headers)
+            sent = True
+            resp = conn.getresponse()
+            data = resp.read()
+            if resp.status != 200:
+                raise RuntimeError(f"HTTP {resp.status}: {data[:200]!r}")
+            return json_parse(data)
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            _kv_local.conn = None
+            if attempt == 2 or (sent and not retry_safe):
+                raise
+
 def kv_get(key):
     if not KV_URL or not KV_TOKEN:
         return None
-    try:
-        req = urllib.request.Request(f"{KV_URL}/get/{key}")
-        req.add_header("Authorization", f"Bearer {KV_TOKEN}")
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = json.loads(resp.read())
-            result = data.get("result")
-            return json.loads(result) if result else None
-    except Exception as e:
-        print(f"KV get error: {e}")
-        return None
+    with span("kv.get", key=key.split(":")[0]):
+        try:
+            result = kv_request("GET", f"/get/{key}").get("result")
+            return decode_kv_value(result) if result else None
+        except Exception as e:
+            print(f"KV get error: {e}")
+            return None
 
 def kv_set(key, value):
     if not KV_URL or not KV_TOKEN:
         return False
-    try:
-        url = f"{KV_URL}/set/{key}"
-        data = json.dumps(value).encode()
-        req = urllib.request.Request(url, data=data, method="POST")
-        req.add_header("Authorization", f"Bearer {KV_TOKEN}")
-        req.add_header("Content-Type", "application/json")
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            return resp.status == 200
-    except Exception as e:
-        print(f"KV set error: {e}")
-        return False
+    with span("kv.set", key=key.split(":")[0]) as attrs:
+        try:
+            data = encode_kv_value(value)
+            attrs["bytes"] = len(data)
+            return kv_request("POST", f"/set/{key}", data).get("result") == "OK"
+        except Exception as e:
+            print(f"KV set error: {e}")
+            return False
+
+def kv_incr(key):
+    """Atomically increment an integer key; returns the new value or None."""
+    if not KV_URL or not KV_TOKEN:
+        return None
+    with span("kv.incr", key=key.split(":")[0]):
+        try:
+            return kv_request("POST", f"/incr/{key}", retry_safe=False).get("result")
+        except Exception as e:
+            print(f"KV incr error: {e}")
+            return None
+
+def kv_get_raw(key):
+    """Get a scalar (non-JSON-encoded) value such as a counter."""
+    if not KV_URL or not KV_TOKEN:
+        return None
+    with span("kv.get", key=key.split(":")[0]):
+        try:
+            return kv_request("GET", f"/get/{key}").get("result")
+        except Exception as e:
+            print(f"KV get error: {e}")
+            return None
+
+def kv_command(*args):
+    """Run one raw Redis command (e.g. LPUSH, LRANGE); returns its result or None."""
+    if not KV_URL or not KV_TOKEN:
+        return None
+    with span(f"kv.{str(args[0]).lower()}", key=str(args[1]).split(":")[0] if len(args) > 1 else ""):
+        try:
+            return kv_request("POST", "", json_bytes([str(a) for a in args]),
+                              retry_safe=str(args[0]).upper() not in KV_UNSAFE_COMMANDS).get("result")
+        except Exception as e:
+            print(f"KV {args[0]} error: {e}")
+            return None
+
+def kv_pipeline(*commands):
+    """Run several raw Redis commands in one round trip; returns their results or None."""
+    if not KV_URL or not KV_TOKEN:
+        return None
+    with span("kv.pipeline", commands=len(commands)):
+        try:
+            replies = kv_request("POST", "/pipeline", json_bytes([[str(a) for a in c] for c in commands]),
+                                 retry_safe=not any(str(c[0]).upper() in KV_UNSAFE_COMMANDS for c in commands))
+            return [reply.get("result") for reply in replies]
+        except Exception as e:
+            print(f"KV pipeline error: {e}")
+            return None
+
+# ============== ADMISSION ==============
+
+# Per-user in-flight limit plus one queue shared by all invocations, ordered
+# by virtual finish time (arrival + expected council time / lane weight) so
+# interactive requests overtake batch ones without starving them. Running
+# slots, queue entries and per-user tickets are KV sorted sets; entries left
+# by crashed invocations age out. Without KV every request is admitted.
+ADMISSION_ENABLED = os.getenv("LLM_COUNCIL_ADMISSION", "1") == "1"
+ADMISSION_MAX_CONCURRENT = int(os.getenv("LLM_COUNCIL_MAX_CONCURRENT", "8"))
+ADMISSION_PER_USER_LIMIT = int(os.getenv("LLM_COUNCIL_PER_USER_LIMIT", "2"))
+ADMISSION_LANE_WEIGHTS = {"interactive": 4, "batch": 1}
+# Queue-time SLOs; waiting holds the function open, so keep them under its max duration
+ADMISSION_QUEUE_SLO_SECONDS = {"interactive": 20.0, "batch": 60.0}
+ADMISSION_SERVICE_SECONDS = float(os.getenv("LLM_COUNCIL_SERVICE_SECONDS", "60"))
+ADMISSION_POLL_SECONDS = 0.5
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+def admission_release(ticket):
+    """Leave the queue / free the running slot (safe to call twice)."""
+    if ticket:
+        kv_pipeline(["ZREM", "admission:running", ticket["id"]], ["ZREM", "admission:queue", ticket["id"]],
+                    ["ZREM", ticket["user_key"], ticket["id"]])
+
+def admission_enqueue(email, lane):
+    """Join the council queue; returns a ticket (None when admission is off) or raises AdmissionRejected."""
+    if not ADMISSION_ENABLED:
+        return None
+    now = time.time()
+    slo = ADMISSION_QUEUE_SLO_SECONDS[lane]
+    # Member ids carry the queue deadline so any invocation can drop abandoned entries
+    ticket = {"id": f"{lane}:{int(now + slo)}:{uuid.uuid4().hex[:12]}", "lane": lane,
+              "user_key": f"admission:user:{email.lower()}", "deadline": now + slo}
+    stale = now - REQUEST_SLO_SECONDS - slo - 60
+    replies = kv_pipeline(
+        ["ZREMRANGEBYSCORE", ticket["user_key"], "-inf", stale],
+        ["ZADD", ticket["user_key"], now, ticket["id"]],
+        ["ZCARD", ticket["user_key"]],
+        ["ZREMRANGEBYSCORE", "admission:running", "-inf", now - REQUEST_SLO_SECONDS - 60],
+        ["ZCARD", "admission:running"],
+        ["ZADD", "admission:queue", now + ADMISSION_SERVICE_SECONDS / ADMISSION_LANE_WEIGHTS[lane], ticket["id"]],
+        ["ZRANK", "admission:queue", ticket["id"]],
+    )
+    if replies is None or replies[6] is None:
+        return None
+    if replies[2] > ADMISSION_PER_USER_LIMIT:
+        admission_release(ticket)
+        raise AdmissionRejected("user_limit", max(1, int(ADMISSION_SERVICE_SECONDS / 2)))
+    ahead = max(0, replies[6] + 1 - (ADMISSION_MAX_CONCURRENT - replies[4]))
+    wait = ahead * ADMISSION_SERVICE_SECONDS / ADMISSION_MAX_CONCURRENT
+    if wait > slo:
+        admission_release(ticket)
+        raise AdmissionRejected("queue_full", max(1, int(wait - slo + 0.999)))
+    return ticket
+
+# Drops expired queue entries, then claims a running slot for ARGV[1] if one is
+# free for its queue position, in one atomic step so concurrent invocations
+# cannot all see the same free slot. Returns 0 once admitted, else the position.
+ADMISSION_CLAIM_SCRIPT = """
+local now, limit = tonumber(ARGV[2]), tonumber(ARGV[3])
+local running = redis.call('ZCARD', KEYS[1])
+local position, live = nil, 0
+for _, member in ipairs(redis.call('ZRANGE', KEYS[2], 0, -1)) do
+  local deadline = tonumber(string.match(member, '^[^:]+:(%d+):'))
+  if member ~= ARGV[1] and deadline and deadline < now then
+    redis.call('ZREM', KEYS[2], member)
+  else
+    live = live + 1
+    if member == ARGV[1] then position = live end
+  end
+end
+position = position or 1
+if position <= limit - running then
+  redis.call('ZADD', KEYS[1], now, ARGV[1])
+  redis.call('ZREM', KEYS[2], ARGV[1])
+  return 0
+end
+return position
+"""
+
+def admission_wait(ticket, on_status):
+    """Poll until a slot is free, calling on_status(status) whenever the queue position changes."""
+    last_position = None
+    while ticket:
+        now = time.time()
+        position = kv_command("EVAL", ADMISSION_CLAIM_SCRIPT, 2, "admission:running", "admission:queue",
+                              ticket["id"], now, ADMISSION_MAX_CONCURRENT)
+        if position is None or position == 0:
+            return
+        if now >= ticket["deadline"]:
+            admission_release(ticket)
+            raise AdmissionRejected("queue_timeout", max(1, int(ADMISSION_SERVICE_SECONDS / ADMISSION_MAX_CONCURRENT)))
+        if position != last_position:
+            last_position = position
+            on_status({"position": position, "lane": ticket["lane"],
+                       "estimated_wait": round(position * ADMISSION_SERVICE_SECONDS / ADMISSION_MAX_CONCURRENT, 1)})
+        time.sleep(ADMISSION_POLL_SECONDS)
+
+# ============== DEGRADATION ==============
+
+# Under load a council runs at a reduced, reported level instead of everything
+# slowing down together. Pressure is the larger of queue pressure ((running +
+# queued) / ADMISSION_MAX_CONCURRENT) and latency pressure (EWMA of stage 1
+# answer times in KV / DEGRADATION_LATENCY_TARGET). Level n applies above
+# DEGRADATION_THRESHOLDS[n - 1] and is left below DEGRADATION_RECOVERY times
+# that; the level and the latency EWMA expire in KV when traffic stops.
+DEGRADATION_ENABLED = os.getenv("LLM_COUNCIL_DEGRADATION", "1") == "1"
+DEGRADATION_THRESHOLDS = [1.0, 1.5, 2.5]
+DEGRADATION_RECOVERY = 0.8
+DEGRADATION_LATENCY_TARGET = 30.0
+DEGRADATION_LATENCY_STALE_SECONDS = 300
+# Per level: max council size, stage 2 sample size (0 skips stage 2), chairman override
+DEGRADATION_LEVELS = [
+    {"name": "full", "max_models": None, "review_sample_size": None, "chairman": None},
+    {"name": "reduced", "max_models": 3, "review_sample_size": 2, "chairman": None},
+    {"name": "lean", "max_models": 2, "review_sample_size": 0, "chairman": "google/gemini-2.5-flash"},
+    {"name": "minimal", "max_models": 1, "review_sample_size": 0, "chairman": "google/gemini-2.5-flash"},
+]
+
+def degradation_level():
+    """(level, signals) from the shared queue and latency state, with hysteresis on the way down."""
+    replies = kv_pipeline(["ZCARD", "admission:running"], ["ZCARD", "admission:queue"],
+                          ["GET", "degradation:latency"], ["GET", "degradation:level"]) or [0, 0, None, None]
+    queue = ((replies[0] or 0) + (replies[1] or 0)) / ADMISSION_MAX_CONCURRENT
+    latency = float(replies[2]) / DEGRADATION_LATENCY_TARGET if replies[2] else 0.0
+    pressure = max(queue, latency)
+    previous = int(replies[3] or 0)
+    target = min(sum(1 for t in DEGRADATION_THRESHOLDS if pressure > t), len(DEGRADATION_LEVELS) - 1)
+    level = max(target, min(previous, len(DEGRADATION_LEVELS) - 1))
+    while level > target and pressure < DEGRADATION_THRESHOLDS[level - 1] * DEGRADATION_RECOVERY:
+        level -= 1
+    if level or previous:
+        kv_command("SET", "degradation:level", level, "EX", DEGRADATION_LATENCY_STALE_SECONDS)
+    return level, {"queue": round(queue, 2), "latency": round(latency, 2), "pressure": round(pressure, 2)}
+
+def degradation_plan(council_models, chairman, review_sample_size):
+    """Fit one run to the load: (council models, chairman, review sample size, skip review, metadata report)."""
+    level, signals = degradation_level() if DEGRADATION_ENABLED else (0, {"pressure": 0.0})
+    policy = DEGRADATION_LEVELS[level]
+    models = council_models
+    if policy["max_models"] is not None and len(models) > policy["max_models"]:
+        # Fastest known routes first (untried ones count as PROVIDER_DEFAULT_LATENCY), in council order
+        def latency(model):
+            routes = MODEL_ROUTES.get(model) or [("openrouter", model)]
+            # Routes from LLM_COUNCIL_MODEL_ROUTES are JSON lists; route_stats keys are tuples
+            return min(route_stats.get(tuple(r), {}).get("latency") or PROVIDER_DEFAULT_LATENCY for r in routes)
+        keep = set(sorted(models, key=latency)[:policy["max_models"]])
+        models = [m for m in models if m in keep]
+    sample = review_sample_size
+    if policy["review_sample_size"] is not None:
+        sample = min(sample or policy["review_sample_size"], policy["review_sample_size"])
+    skip_review = sample == 0
+    chairman = policy["chairman"] or chairman
+    report = {"level": level, "name": policy["name"], **signals}
+    if level:
+        report.update(council_size=len(models), review="skipped" if skip_review else f"sample of {sample}", chairman=chairman)
+    return models, chairman, None if skip_review else sample, skip_review, report
+
+def degradation_record(durations):
+    """Fold one run's stage 1 answer times (timeouts included) into the shared latency EWMA."""
+    if not DEGRADATION_ENABLED or not durations:
+        return
+    ewma = kv_command("GET", "degradation:latency")
+    ewma = float(ewma) if ewma else None
+    for d in durations:
+        ewma = d if ewma is None else ewma + 0.2 * (d - ewma)
+    kv_command("SET", "degradation:latency", round(ewma, 3), "EX", DEGRADATION_LATENCY_STALE_SECONDS)
 
 # ============== AUTH ==============
 
@@ -109,14 +626,26 @@ def get_user_sessions(email):
 
 def save_user_sessions(email, sessions):
     key = f"sessions:{email.lower()}"
-    return kv_set(key, sessions)
+    saved = kv_set(key, sessions)
+    if saved:
+        kv_incr(f"sessions_version:{email.lower()}")
+    return saved
+
+def get_sessions_version(email):
+    """Version counter of a user's session list (None if unknown)."""
+    value = kv_get_raw(f"sessions_version:{email.lower()}")
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
 
 def create_session(email, title="New Conversation"):
-    sessions = get_user_sessions(email)
+    sessions = archive_idle_sessions(email, get_user_sessions(email))
     new_session = {
         "id": str(uuid.uuid4()),
         "created_at": datetime.utcnow().isoformat() + "Z",
         "title": title,
+        "version": 1,
         "messages": []
     }
     sessions.insert(0, new_session)  # Newest first
@@ -124,105 +653,643 @@ def create_session(email, title="New Conversation"):
     return new_session
 
 def get_session(email, session_id):
-    sessions = get_user_sessions(email)
+    sessions = sessions_with(email, session_id)
     for s in sessions:
         if s["id"] == session_id:
             return s
     return None
 
 def update_session(email, session_id, updates):
-    sessions = get_user_sessions(email)
+    sessions = sessions_with(email, session_id)
     for i, s in enumerate(sessions):
         if s["id"] == session_id:
             sessions[i].update(updates)
+            sessions[i]["version"] = s.get("version", 0) + 1
+            sessions[i]["updated_at"] = datetime.utcnow().isoformat() + "Z"
             save_user_sessions(email, sessions)
             return sessions[i]
     return None
 
+TITLE_LEAD_RE = re.compile(
+    r"^(?:(?:hi|hey|hello|please|ok|okay|so)[,!.]?\s+)*"
+    r"(?:(?:can|could|would|will) you\s+(?:please\s+)?|i (?:want|need|would like) (?:you )?to\s+|"
+    r"help me\s+(?:to\s+)?|tell me\s+|explain\s+(?:to me\s+)?|describe\s+|"
+    r"what(?:'s| is| are| was| were)\s+|how (?:do|does|can|should|would|to)\s+(?:i\s+|you\s+|we\s+)?|"
+    r"why (?:do|does|is|are)\s+|when (?:did|does|is)\s+|who (?:is|was)\s+)?", re.IGNORECASE)
+TITLE_WORD_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9+#.'-]*")
+TITLE_FILLER = set("""a an the is are was were be to of in on at for and or it its this that these those me i you
+my your we our do does did can could would should please about some any with between into from by as
+there their them they what which how why really just""".split())
+
+def extractive_title(text):
+    """Short title from the first message's key words (local, no model call)."""
+    first = re.split(r"(?<=[.?!])\s+|\n", text.strip(), maxsplit=1)[0]
+    words = []
+    for word in TITLE_WORD_RE.findall(TITLE_LEAD_RE.sub("", first, count=1)):
+        word = word.strip(".'-")
+        if not word or word.lower() in TITLE_FILLER:
+            continue
+        if not (word.isupper() or any(c.isupper() for c in word[1:])):
+            word = word[0].upper() + word[1:]
+        words.append(word)
+        if len(words) == 5:
+            break
+    title = " ".join(words) or "New Conversation"
+    return title if len(title) <= 50 else title[:47].rstrip() + "..."
+
 def add_message_to_session(email, session_id, message):
+    with span("session.append", role=message.get("role")):
+        sessions = sessions_with(email, session_id)
+        for i, s in enumerate(sessions):
+            if s["id"] == session_id:
+                version = s.get("version", 0) + 1
+                sessions[i]["version"] = version
+                sessions[i]["updated_at"] = datetime.utcnow().isoformat() + "Z"
+                sessions[i]["messages"].append({**message, "version": version})
+                # Update title from first user message if still default
+                if sessions[i]["title"] == "New Conversation" and message.get("role") == "user":
+                    sessions[i]["title"] = extractive_title(message.get("content", ""))
+                save_user_sessions(email, sessions)
+                search_index_message(email, session_id, len(sessions[i]["messages"]) - 1, message)
+                return True
+        return False
+
+# ============== ARCHIVE ==============
+
+# Sessions untouched for ARCHIVE_AFTER_DAYS leave the hot per-user list (which
+# every request loads whole) for append-only segment strings in KV:
+# archive:{email}:seg:{n} gets each session APPENDed in its stored encoding,
+# and the hash archive:{email}:index maps session id -> segment, offset,
+# length and list metadata. Reads are one GETRANGE. Touching an archived
+# session restores it to the hot list. The sweep runs when a session is
+# created, at most once per ARCHIVE_CHECK_INTERVAL per user.
+ARCHIVE_AFTER_DAYS = float(os.getenv("LLM_COUNCIL_ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_SEGMENT_MAX_BYTES = 512 * 1024
+ARCHIVE_CHECK_INTERVAL = 86400
+
+def archive_idle_sessions(email, sessions):
+    """Move idle sessions into archive segments (rate-limited per user); returns the hot sessions left."""
+    user = email.lower()
+    cutoff = (datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)).isoformat() + "Z"
+    cold = [s for s in sessions if (s.get("updated_at") or s["created_at"]) < cutoff]
+    if not cold or kv_command("SET", f"archive:{user}:checked", "1", "NX", "EX", ARCHIVE_CHECK_INTERVAL) != "OK":
+        return sessions
+    with span("archive.run", sessions=len(cold)) as attrs:
+        segment = int(kv_get_raw(f"archive:{user}:segment") or 0)
+        entries = []
+        for s in cold:
+            record = encode_kv_value(s)
+            end = kv_command("APPEND", f"archive:{user}:seg:{segment}", record.decode())
+            if end is None:
+                break  # KV error: whatever is not indexed stays hot
+            entries += [s["id"], json.dumps({"seg": segment, "offset": end - len(record), "length": len(record),
+                                             "title": s["title"], "created_at": s["created_at"],
+                                             "message_count": len(s["messages"])})]
+            if end >= ARCHIVE_SEGMENT_MAX_BYTES:
+                segment = kv_incr(f"archive:{user}:segment") or segment + 1
+        if not entries or kv_command("HSET", f"archive:{user}:index", *entries) is None:
+            return sessions
+        archived = set(entries[::2])
+        attrs["archived"] = len(archived)
+        hot = [s for s in sessions if s["id"] not in archived]
+        save_user_sessions(email, hot)
+        return hot
+
+def read_archived_session(email, session_id):
+    """An archived session read in place (None if not archived)."""
+    user = email.lower()
+    entry = kv_command("HGET", f"archive:{user}:index", session_id)
+    if not entry:
+        return None
+    entry = json.loads(entry)
+    with span("archive.read", bytes=entry["length"]):
+        record = kv_command("GETRANGE", f"archive:{user}:seg:{entry['seg']}", entry["offset"], entry["offset"] + entry["length"] - 1)
+    return decode_kv_value(record) if record else None
+
+def sessions_with(email, session_id):
+    """The hot session list, with session_id restored into it first if it was archived."""
     sessions = get_user_sessions(email)
-    for i, s in enumerate(sessions):
-        if s["id"] == session_id:
-            sessions[i]["messages"].append(message)
-            # Update title from first user message if still default
-            if sessions[i]["title"] == "New Conversation" and message.get("role") == "user":
-                content = message.get("content", "")
-                sessions[i]["title"] = content[:50] + ("..." if len(content) > 50 else "")
-            save_user_sessions(email, sessions)
-            return True
-    return False
+    if any(s["id"] == session_id for s in sessions):
+        return sessions
+    session = read_archived_session(email, session_id)
+    if session is not None:
+        # Segments are append-only; restoring only drops the index entry
+        session["updated_at"] = datetime.utcnow().isoformat() + "Z"
+        sessions.append(session)
+        sessions.sort(key=lambda s: s["created_at"], reverse=True)
+        save_user_sessions(email, sessions)
+        kv_command("HDEL", f"archive:{email.lower()}:index", session_id)
+    return sessions
+
+def archived_session_summaries(email, hot_ids):
+    """List entries of archived sessions (from the index only, no segment reads)."""
+    flat = kv_command("HGETALL", f"archive:{email.lower()}:index") or []
+    summaries = []
+    for session_id, entry in zip(flat[::2], flat[1::2]):
+        if session_id not in hot_ids:
+            entry = json.loads(entry)
+            summaries.append({"id": session_id, "title": entry["title"], "created_at": entry["created_at"],
+                              "message_count": entry["message_count"]})
+    return summaries
+
+# ============== SEARCH ==============
+
+# Per-user inverted index in KV, written when a message is appended (never by
+# rescanning sessions): one sorted set per term, search:{email}:t:{term},
+# scoring each document ("{session_id}:{message_index}:{kind}") by term
+# frequency. Queries fetch the postings in one pipeline, rank documents
+# containing every term by TF-IDF and cut snippets from the session texts.
+# Postings of deleted sessions are skipped at query time.
+SEARCH_ENABLED = os.getenv("LLM_COUNCIL_SEARCH", "1") == "1"
+SEARCH_INDEX_STAGE1 = os.getenv("LLM_COUNCIL_SEARCH_STAGE1", "1") == "1"
+SEARCH_MAX_TERMS = 300  # distinct terms indexed per document
+SEARCH_MAX_POSTINGS = 500  # highest-frequency documents read per query term
+SEARCH_KIND_WEIGHTS = {"query": 1.0, "answer": 1.0, "stage1": 0.5}
+SEARCH_STOPWORDS = set("""a an the is are was were be been to of in on at for and or it its this that these
+those i you he she we they me my your our their what which who how why when where do does did can could
+would should will with from by as not no but if then than so there here about into also just""".split())
+SEARCH_WORD_RE = re.compile(r"\w+")
+
+def search_terms(text):
+    """Lowercased, lightly stemmed index terms of a text."""
+    terms = []
+    for word in SEARCH_WORD_RE.findall(text.lower()):
+        if len(word) < 2 or word in SEARCH_STOPWORDS:
+            continue
+        for suffix in ("ing", "ed", "es", "s"):
+            if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+                word = word[:-len(suffix)]
+                break
+        terms.append(word)
+    return terms
+
+def search_documents(message):
+    """(kind, text) of each searchable part of a message; stage 1 kinds carry the response index."""
+    if message.get("role") == "user":
+        return [("query", message.get("content") or "")]
+    docs = [("answer", (message.get("stage3") or {}).get("response") or "")]
+    if SEARCH_INDEX_STAGE1:
+        docs += [(f"stage1.{n}", r.get("response") or "") for n, r in enumerate(message.get("stage1") or [])]
+    return [(kind, text) for kind, text in docs if text]
+
+def search_index_message(email, session_id, index, message):
+    if not SEARCH_ENABLED:
+        return
+    with span("search.index", role=message.get("role")):
+        prefix = f"search:{email.lower()}"
+        commands = []
+        for kind, text in search_documents(message):
+            doc_id = f"{session_id}:{index}:{kind}"
+            counts = defaultdict(int)
+            for term in search_terms(text):
+                counts[term] += 1
+            for term, tf in sorted(counts.items(), key=lambda kv: -kv[1])[:SEARCH_MAX_TERMS]:
+                commands.append(["ZADD", f"{prefix}:t:{term}", tf, doc_id])
+            commands.append(["INCR", f"{prefix}:docs"])
+        if commands:
+            kv_pipeline(*commands)
+
+def search_snippet(text, terms, width=80):
+    """Window of text around the first matching term, matches in **bold**."""
+    pattern = re.compile(r"\b(" + "|".join(re.escape(t) for t in terms) + r")\w*", re.IGNORECASE)
+    match = pattern.search(text)
+    start = max(0, match.start() - width) if match else 0
+    snippet = text[start:start + 2 * width]
+    snippet = pattern.sub(lambda m: f"**{m.group(0)}**", snippet)
+    return ("…" if start > 0 else "") + snippet + ("…" if start + 2 * width < len(text) else "")
+
+def search_sessions(email, query, limit=20, include_stage1=True):
+    """Ranked hits (session, message index, kind, model, snippet) for every term of the query."""
+    terms = list(dict.fromkeys(search_terms(query)))[:10]
+    if not SEARCH_ENABLED or not terms:
+        return []
+    prefix = f"search:{email.lower()}"
+    with span("search.query", terms=len(terms)) as attrs:
+        replies = kv_pipeline(["GET", f"{prefix}:docs"], *[
+            ["ZRANGE", f"{prefix}:t:{t}", 0, SEARCH_MAX_POSTINGS - 1, "REV", "WITHSCORES"] for t in terms])
+        if not replies:
+            return []
+        total_docs = max(1, int(replies[0] or 1))
+        scores, matched = defaultdict(float), defaultdict(int)
+        for postings in replies[1:]:
+            postings = postings or []
+            pairs = list(zip(postings[::2], postings[1::2]))
+            idf = math.log(1 + total_docs / max(1, len(pairs)))
+            for doc_id, tf in pairs:
+                kind = doc_id.split(":")[2].split(".")[0]
+                if kind == "stage1" and not include_stage1:
+                    continue
+                scores[doc_id] += (1 + math.log(float(tf))) * idf * SEARCH_KIND_WEIGHTS.get(kind, 1.0)
+                matched[doc_id] += 1
+        ranked = sorted((d for d in scores if matched[d] == len(terms)), key=lambda d: -scores[d])
+        sessions = {s["id"]: s for s in get_user_sessions(email)} if ranked else {}
+        results = []
+        for doc_id in ranked:
+            session_id, index, kind = doc_id.split(":")
+            if session_id not in sessions:
+                # Archived (read in place, not restored) or deleted
+                sessions[session_id] = read_archived_session(email, session_id)
+            session = sessions[session_id]
+            if session is None or int(index) >= len(session["messages"]):
+                continue
+            message = session["messages"][int(index)]
+            if kind.startswith("stage1."):
+                stage1 = (message.get("stage1") or [])[int(kind.split(".")[1]):][:1]
+                model, text = (stage1[0].get("model"), stage1[0].get("response") or "") if stage1 else (None, "")
+            elif kind == "answer":
+                model, text = (message.get("stage3") or {}).get("model"), (message.get("stage3") or {}).get("response") or ""
+            else:
+                model, text = None, message.get("content") or ""
+            results.append({"session_id": session_id, "title": session["title"], "created_at": session["created_at"],
+                            "message_index": int(index), "kind": kind.split(".")[0], "model": model,
+                            "snippet": search_snippet(text, terms), "score": round(scores[doc_id], 4)})
+            if len(results) >= limit:
+                break
+        attrs["results"] = len(results)
+        return results
+
+def slim_message(message):
+    """Assistant message without Stage 1 / Stage 2 payloads (fetched on demand)."""
+    if message.get("role") != "assistant":
+        return message
+    slim = {
+        "role": "assistant",
+        "stage3": message.get("stage3"),
+        "stage1_count": len(message.get("stage1") or []),
+        "stage2_count": len(message.get("stage2") or []),
+        "details_omitted": True,
+    }
+    if "version" in message:
+        slim["version"] = message["version"]
+    if "metadata" in message:
+        slim["metadata"] = message["metadata"]
+    return slim
+
+def session_view(session, view="full", offset=0, limit=None):
+    """Session with an optional message range (negative offset counts from the end) and slim messages."""
+    messages = session["messages"]
+    total = len(messages)
+    start = max(0, total + offset) if offset < 0 else min(offset, total)
+    end = total if limit is None else min(total, start + max(0, limit))
+    selected = messages[start:end]
+    if view == "slim":
+        selected = [slim_message(m) for m in selected]
+    return {**session, "messages": selected, "total_messages": total, "offset": start}
+
+def session_delta(session, since_version):
+    """Title plus messages appended after since_version (full list with reset=True if the version is unknown)."""
+    version = session.get("version", 0)
+    messages = session["messages"]
+    reset = since_version > version
+    offset = 0 if reset else next(
+        (i for i, m in enumerate(messages) if m.get("version", 0) > since_version), len(messages))
+    return {"id": session["id"], "version": version, "since_version": since_version, "title": session["title"],
+            "message_offset": offset, "messages": messages[offset:], "reset": reset}
 
 def delete_session(email, session_id):
     sessions = get_user_sessions(email)
     sessions = [s for s in sessions if s["id"] != session_id]
     save_user_sessions(email, sessions)
+    kv_command("HDEL", f"archive:{email.lower()}:index", session_id)
     return True
 
 # ============== OPENROUTER ==============
 
-async def query_model(model, messages, timeout=120.0, web_search=False):
+# Council coroutines run on one long-lived event loop so a warm instance keeps
+# its pooled (keep-alive) OpenRouter connections between requests
+_loop = None
+_loop_lock = threading.Lock()
+_client = None
+
+def get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="council-loop", daemon=True).start()
+    return _loop
+
+def run_async(coro):
+    """Run a coroutine on the shared loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result()
+
+def run_streaming(make_coro, send):
+    """Run make_coro(emit) on the shared loop; the calling thread send()s what it emits.
+
+    Socket writes to a slow client then block only this request's thread, never
+    the loop every in-flight council shares. If sending fails, the run is cancelled.
+    """
+    events = queue.Queue()
+    future = asyncio.run_coroutine_threadsafe(make_coro(lambda *event: events.put(event)), get_loop())
+    future.add_done_callback(lambda _: events.put(None))
+    try:
+        while True:
+            event = events.get()
+            if event is None:
+                break
+            send(*event)
+    except BaseException:
+        future.cancel()
+        raise
+    return future.result()
+
+def get_client():
+    """Shared AsyncClient (must be called on the shared loop)."""
+    global _client
+    if _client is None:
+        httpx = get_httpx()
+        _client = httpx.AsyncClient(timeout=120.0, limits=httpx.Limits(max_keepalive_connections=20))
+    return _client
+
+# ============== CASSETTE (record / replay) ==============
+
+# "record" appends every OpenRouter call to a gzip JSON-lines cassette, "replay"
+# serves calls from it offline (sleeping for the recorded latency / CASSETTE_SPEED)
+CASSETTE_MODE = os.getenv("LLM_COUNCIL_CASSETTE", "off")
+CASSETTE_PATH = os.getenv("LLM_COUNCIL_CASSETTE_PATH", "/tmp/openrouter.jsonl.gz")
+CASSETTE_SPEED = float(os.getenv("LLM_COUNCIL_CASSETTE_SPEED", "1.0"))  # 0 = no delay
+_cassette = None
+
+def cassette_key(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()).hexdigest()[:32]
+
+def cassette_interactions():
+    global _cassette
+    if _cassette is None:
+        _cassette = defaultdict(list)
+        if os.path.exists(CASSETTE_PATH):
+            with gzip.open(CASSETTE_PATH, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        rec = json_parse(line)
+                        _cassette[rec["key"]].append(rec)
+    return _cassette
+
+def cassette_record(payload, response, latency, error=None):
+    rec = {"key": cassette_key(payload), "model": payload.get("model"), "request": payload,
+           "response": response, "error": error, "latency": round(latency, 4), "recorded_at": time.time()}
+    with gzip.open(CASSETTE_PATH, 'ab') as f:
+        f.write(json_bytes(rec) + b"\n")
+
+async def cassette_replay(payload):
+    recorded = cassette_interactions().get(cassette_key(payload))
+    if not recorded:
+        print(f"[{payload.get('model')}] Cassette miss")
+        return None
+    # Identical requests replay in recorded order; the last one repeats
+    rec = recorded.pop(0) if len(recorded) > 1 else recorded[0]
+    if CASSETTE_SPEED > 0:
+        await asyncio.sleep(rec["latency"] / CASSETTE_SPEED)
+    return rec["response"]
+
+# ============== PROVIDERS ==============
+
+# OpenAI-compatible endpoints: name -> (url, API key). A provider without a key
+# is skipped (the local server's key may be empty).
+PROVIDERS = {
+    "openrouter": (OPENROUTER_API_URL, OPENROUTER_API_KEY),
+    "openai": ("https://api.openai.com/v1/chat/completions", os.getenv("OPENAI_API_KEY")),
+    "xai": ("https://api.x.ai/v1/chat/completions", os.getenv("XAI_API_KEY")),
+    "local": (os.getenv("LOCAL_LLM_URL", "http://localhost:8080/v1/chat/completions"), os.getenv("LOCAL_LLM_API_KEY", "")),
+}
+# Council model -> [(provider, provider's model id)]; unlisted models go to OpenRouter.
+# LLM_COUNCIL_MODEL_ROUTES adds entries as JSON, e.g. {"local/llama-3.3-70b": [["local", "llama-3.3-70b"]]}
+MODEL_ROUTES = {
+    "openai/gpt-5.2": [("openrouter", "openai/gpt-5.2"), ("openai", "gpt-5.2")],
+    "openai/gpt-4.1": [("openrouter", "openai/gpt-4.1"), ("openai", "gpt-4.1")],
+    "x-ai/grok-4": [("openrouter", "x-ai/grok-4"), ("xai", "grok-4")],
+    **json.loads(os.getenv("LLM_COUNCIL_MODEL_ROUTES", "{}")),
+}
+# Untried routes' latency, error-rate cost multiplier, failures in a row that
+# bench a route for the cooldown, and how often the runner-up goes first
+PROVIDER_DEFAULT_LATENCY = 10.0
+PROVIDER_ERROR_PENALTY = 4.0
+PROVIDER_FAILURE_THRESHOLD = 3
+PROVIDER_COOLDOWN_SECONDS = 30.0
+PROVIDER_EXPLORE_RATE = 0.05
+route_stats = {}  # (provider, model) -> {"latency": EWMA or None, "errors": EWMA, "fails": in a row, "cooldown": until}
+
+def ranked_routes(model, web_search=False):
+    """A model's usable routes, cheapest expected latency (inflated by error rate) first."""
+    now = time.monotonic()
+    routes = [(p, m) for p, m in MODEL_ROUTES.get(model) or [("openrouter", model)]
+              if p in PROVIDERS and PROVIDERS[p][1] is not None and (p == "openrouter" or not web_search)]
+    routes = routes or [("openrouter", model)]
+
+    def cost(i):
+        st = route_stats.get(routes[i], {})
+        latency = st.get("latency") or PROVIDER_DEFAULT_LATENCY
+        return (now < st.get("cooldown", 0), latency * (1 + PROVIDER_ERROR_PENALTY * st.get("errors", 0.0)), i)
+
+    ranked = [routes[i] for i in sorted(range(len(routes)), key=cost)]
+    if len(ranked) > 1 and random.random() < PROVIDER_EXPLORE_RATE:
+        ranked[0], ranked[1] = ranked[1], ranked[0]
+    return ranked
+
+def record_route(route, latency, success):
+    st = route_stats.setdefault(route, {"latency": None, "errors": 0.0, "fails": 0, "cooldown": 0})
+    st["errors"] += 0.3 * ((0.0 if success else 1.0) - st["errors"])
+    if success:
+        st["fails"] = 0
+        st["latency"] = latency if st["latency"] is None else st["latency"] + 0.3 * (latency - st["latency"])
+    else:
+        st["fails"] += 1
+        if st["fails"] >= PROVIDER_FAILURE_THRESHOLD:
+            st["cooldown"] = time.monotonic() + PROVIDER_COOLDOWN_SECONDS
+
+def generation_profiles(overrides):
+    """Per-stage profiles: GENERATION_PROFILES plus request overrides (ValueError if invalid)."""
+    overrides = overrides or {}
+    if not isinstance(overrides, dict) or any(stage not in GENERATION_PROFILES for stage in overrides):
+        raise ValueError(f"generation stages must be among {', '.join(GENERATION_PROFILES)}")
+    profiles = {}
+    for stage, defaults in GENERATION_PROFILES.items():
+        override = overrides.get(stage) or {}
+        profile = {**defaults, **override}
+        # Overriding one kind of reasoning limit replaces the default of the other
+        if "reasoning_max_tokens" in override and "reasoning_effort" not in override:
+            profile["reasoning_effort"] = None
+        for field, value in profile.items():
+            if field not in GENERATION_FIELDS or (value is not None and (
+                    not isinstance(value, GENERATION_FIELDS[field]) or isinstance(value, bool) != (field == "include_reasoning"))):
+                raise ValueError(f"Invalid generation setting {stage}.{field}")
+        if profile.get("reasoning_effort") not in (None, "minimal", "low", "medium", "high"):
+            raise ValueError(f"Invalid generation setting {stage}.reasoning_effort")
+        profiles[stage] = {"stage": stage, **profile}
+    return profiles
+
+def generation_params(profile):
+    """OpenRouter payload fields for a profile: max_tokens, stop and the reasoning object."""
+    if not profile:
+        return {}
+    params = {k: profile[k] for k in ("max_tokens", "stop") if profile.get(k)}
+    reasoning = {}
+    if profile.get("reasoning_effort"):
+        reasoning["effort"] = profile["reasoning_effort"]
+    elif profile.get("reasoning_max_tokens"):
+        reasoning["max_tokens"] = profile["reasoning_max_tokens"]
+    if profile.get("include_reasoning") is False:
+        reasoning["exclude"] = True
+    if reasoning:
+        params["reasoning"] = reasoning
+    return params
+
+def route_payload(provider, provider_model, payload):
+    """Request body for a route: reasoning limits as OpenRouter's object, OpenAI/xAI's reasoning_effort, or dropped."""
+    body = {**payload, "model": provider_model}
+    reasoning = body.pop("reasoning", None)
+    if reasoning and provider == "openrouter":
+        body["reasoning"] = reasoning
+    elif reasoning and provider in ("openai", "xai") and reasoning.get("effort"):
+        body["reasoning_effort"] = reasoning["effort"]
+    return body
+
+async def post_routed(model, payload, timeout, web_search=False):
+    """POST a chat completion to the model's best route, failing over while time remains."""
+    deadline = time.monotonic() + timeout
+    last_error = None
+    for attempt, (provider, provider_model) in enumerate(ranked_routes(model, web_search), start=1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        url, key = PROVIDERS[provider]
+        headers = {"Content-Type": "application/json", **({"Authorization": f"Bearer {key}"} if key else {})}
+        with span("provider.attempt", provider=provider, model=provider_model, attempt=attempt) as attrs:
+            start = time.monotonic()
+            try:
+                response = await get_client().post(url, headers=headers, json=route_payload(provider, provider_model, payload), timeout=remaining)
+                response.raise_for_status()
+                data = response.json()
+                if not data.get('choices'):
+                    raise ValueError(f"Response without choices: {str(data)[:200]}")
+            except Exception as e:
+                record_route((provider, provider_model), time.monotonic() - start, False)
+                attrs["error"] = f"{type(e).__name__}: {e}"
+                print(f"[{model}] {provider} failed, trying next route: {type(e).__name__}")
+                last_error = e
+                continue
+            record_route((provider, provider_model), time.monotonic() - start, True)
+            return data, provider
+    raise last_error or TimeoutError(f"No route for {model} within {timeout}s")
+
+async def query_model(model, messages, timeout=120.0, web_search=False, response_format=None, profile=None, plugins=None):
     if not HTTPX_AVAILABLE:
         print(f"[{model}] HTTPX not available")
         return None
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-    }
     payload = {"model": model, "messages": messages}
-    if web_search:
-        payload["plugins"] = [{"id": "web"}]
-    try:
-        print(f"[{model}] Starting request (web_search={web_search})...")
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            response = await client.post(OPENROUTER_API_URL, headers=headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            message = data['choices'][0]['message']
+    if web_search or plugins:
+        # Plugins are OpenRouter's, so such calls stay on OpenRouter routes
+        web_search = True
+        payload["plugins"] = plugins or [{"id": "web"}]
+    if response_format:
+        payload["response_format"] = response_format
+    payload.update(generation_params(profile))
+    prompt_chars = sum(len(m.get("content") or "") for m in messages)
+    with span("openrouter.call", model=model, prompt_chars=prompt_chars, web_search=web_search) as attrs:
+        if CASSETTE_MODE == "replay":
+            return await cassette_replay(payload)
+        httpx = get_httpx()
+        start = time.monotonic()
+        error = None
+        try:
+            print(f"[{model}] Starting request (web_search={web_search})...")
+            data, provider = await post_routed(model, payload, timeout, web_search)
+            choice = data['choices'][0]
+            message = choice['message']
             content = message.get('content', '')
+            usage = data.get('usage') or {}
+            attrs.update(provider=provider, prompt_tokens=usage.get('prompt_tokens'), completion_tokens=usage.get('completion_tokens'),
+                         reasoning_tokens=(usage.get('completion_tokens_details') or {}).get('reasoning_tokens'),
+                         truncated=choice.get('finish_reason') == 'length')
+            if profile:
+                attrs["profile"] = profile["stage"]
             print(f"[{model}] ✅ Success ({len(content)} chars)")
-            return {'content': content}
-    except httpx.TimeoutException:
-        print(f"[{model}] ❌ TIMEOUT after {timeout}s")
-        return None
-    except httpx.HTTPStatusError as e:
-        print(f"[{model}] ❌ HTTP {e.response.status_code}: {e.response.text[:200]}")
-        return None
-    except Exception as e:
-        print(f"[{model}] ❌ Error: {type(e).__name__}: {e}")
+            result = {'content': content}
+            if message.get('annotations'):
+                result['annotations'] = message['annotations']
+            if CASSETTE_MODE == "record":
+                cassette_record(payload, result, time.monotonic() - start)
+            return result
+        except httpx.TimeoutException:
+            error = f"TIMEOUT after {timeout}s"
+        except httpx.HTTPStatusError as e:
+            error = f"HTTP {e.response.status_code}: {e.response.text[:200]}"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        print(f"[{model}] ❌ {error}")
+        attrs["error"] = error
+        if CASSETTE_MODE == "record":
+            cassette_record(payload, None, time.monotonic() - start, error=error)
         return None
 
-async def query_models_parallel(models, messages, web_search=False, on_model_complete=None):
-    """Query multiple models in parallel, with optional per-model callback."""
-    results = {}
-
-    async def query_with_callback(model):
-        result = await query_model(model, messages, web_search=web_search)
-        status = "success" if result else "failed"
-        results[model] = result
-        if on_model_complete:
-            on_model_complete(model, status, result)
-        return result
-
-    tasks = [query_with_callback(model) for model in models]
-    await asyncio.gather(*tasks)
-    return results
+def warm_up():
+    """Pre-establish the pooled OpenRouter connection and the KV keep-alive connection."""
+    timings = {}
+    start = time.monotonic()
+    if HTTPX_AVAILABLE:
+        get_httpx()
+        timings["import_httpx"] = round(time.monotonic() - start, 4)
+
+        async def connect():
+            # Any response (even 405) leaves a TLS connection in the pool
+            await get_client().head(OPENROUTER_API_URL, timeout=5.0)
+
+        start = time.monotonic()
+        try:
+            run_async(connect())
+            timings["openrouter"] = round(time.monotonic() - start, 4)
+        except Exception as e:
+            timings["openrouter"] = f"failed: {type(e).__name__}"
+    if KV_URL and KV_TOKEN:
+        start = time.monotonic()
+        try:
+            kv_request("GET", "/ping")
+            timings["kv"] = round(time.monotonic() - start, 4)
+        except Exception as e:
+            timings["kv"] = f"failed: {type(e).__name__}"
+    return {"status": "warm", "timings": timings}
 
 # ============== COUNCIL ==============
 
-async def stage1_collect_responses(user_query, models=None, on_model_complete=None):
-    models_to_use = models or COUNCIL_MODELS
-    messages = [{"role": "user", "content": user_query}]
-    responses = await query_models_parallel(models_to_use, messages, web_search=True, on_model_complete=on_model_complete)
-    return [{"model": m, "response": r.get('content', '')} for m, r in responses.items() if r]
+def assign_reviews(reviewers, authors, k):
+    """Balanced review subsets: each reviewer takes the k least-reviewed answers it did not write."""
+    load = [0] * len(authors)
+    assignments = {}
+    for pos, reviewer in enumerate(reviewers):
+        start = (pos + 1) % len(authors)
+        eligible = sorted((i for i, a in enumerate(authors) if a != reviewer),
+                          key=lambda i: (load[i], (i - start) % len(authors)))
+        assignments[reviewer] = sorted(eligible[:k])
+        for i in assignments[reviewer]:
+            load[i] += 1
+    return assignments
+
+def cluster_answers(stage1_results):
+    """Greedy clusters of near-identical answers: [[index, ...]], longest answer (the representative) first."""
+    def shingles(text):
+        words = re.findall(r"\w+", text.lower())
+        return frozenset(words) if len(words) < 3 else frozenset(" ".join(words[i:i + 3]) for i in range(len(words) - 2))
+    sets = [shingles(r.get('response') or '') for r in stage1_results]
+    clusters = []
+    for i, a in enumerate(sets):
+        for cluster in clusters if DEDUPE_ENABLED else ():
+            b = sets[cluster[0]]
+            if a and b and len(a & b) / len(a | b) >= DEDUPE_THRESHOLD:
+                cluster.append(i)
+                break
+        else:
+            clusters.append([i])
+    return [sorted(c, key=lambda i: -len(stage1_results[i].get('response') or '')) for c in clusters]
+
+def ranking_prompt(user_query, responses_text, structured):
+    if structured:
+        return f"""Evaluate these responses to: {user_query}
 
-async def stage2_collect_rankings(user_query, stage1_results, models=None, on_model_complete=None):
-    models_to_use = models or COUNCIL_MODELS
-    labels = [chr(65 + i) for i in range(len(stage1_results))]
-    label_to_model = {f"Response {l}": r['model'] for l, r in zip(labels, stage1_results)}
-
-    responses_text = "\n\n".join([f"Response {l}:\n{r['response']}" for l, r in zip(labels, stage1_results)])
+{responses_text}
 
-    ranking_prompt = f"""Evaluate these responses to: {user_query}
+Critique each response and score it 1-10 on: {", ".join(RANKING_CRITERIA)}.
+Rank all responses best to worst in "final_ranking" by label (e.g. "Response A"). Reply with JSON only."""
+    return f"""Evaluate these responses to: {user_query}
 
 {responses_text}
 
@@ -232,23 +1299,67 @@ FINAL RANKING:
 2. Response Y
 ..."""
 
-    messages = [{"role": "user", "content": ranking_prompt}]
-    responses = await query_models_parallel(models_to_use, messages, on_model_complete=on_model_complete)
-
-    results = []
-    for model, resp in responses.items():
-        if resp:
-            text = resp.get('content', '')
-            parsed = parse_ranking(text)
-            results.append({"model": model, "ranking": text, "parsed_ranking": parsed})
-
-    return results, label_to_model
+def ranking_plan(user_query, stage1_results, models, ranking_mode=None, review_sample_size=None):
+    """Stage 2 labels and per-reviewer prompts (subsampled review keeps the run-wide labels)."""
+    structured = (ranking_mode or RANKING_MODE) == "structured"
+    labels = response_labels(len(stage1_results))
+    label_to_model = {f"Response {l}": r['model'] for l, r in zip(labels, stage1_results)}
+    blocks = [f"Response {l}:\n{r['response']}" for l, r in zip(labels, stage1_results)]
+
+    k = review_sample_size if review_sample_size is not None else REVIEW_SAMPLE_SIZE
+    assigned, messages = {}, {}
+    if k and k < len(stage1_results):
+        assignments = assign_reviews(models, [r['model'] for r in stage1_results], max(k, 2))
+        for model, indices in assignments.items():
+            assigned[model] = [f"Response {labels[i]}" for i in indices]
+            text = "\n\n".join(blocks[i] for i in indices)
+            messages[model] = [{"role": "user", "content": ranking_prompt(user_query, text, structured)}]
+    else:
+        shared = [{"role": "user", "content": ranking_prompt(user_query, "\n\n".join(blocks), structured)}]
+        messages = {model: shared for model in models}
+    return {"label_to_model": label_to_model, "messages": messages, "assigned": assigned,
+            "response_format": RANKING_RESPONSE_FORMAT if structured else None}
+
+def ranking_result(model, text, plan):
+    """Parse one reviewer's output against the labels it was shown."""
+    label_to_model, assigned = plan["label_to_model"], plan["assigned"]
+    valid = {l: label_to_model[l] for l in assigned[model]} if model in assigned else label_to_model
+    parsed = parse_structured_ranking(text, valid)
+    if parsed:
+        result = {"model": model, "ranking": parsed["text"], "parsed_ranking": parsed["ranking"],
+                  "scores": parsed["scores"], "parse_method": "structured"}
+    else:
+        ranking, method = parse_ranking(text)
+        result = {"model": model, "ranking": text, "parsed_ranking": ranking, "parse_method": method}
+    if model in assigned:
+        result["parsed_ranking"] = [l for l in result["parsed_ranking"] if l in valid]
+        result["assigned"] = assigned[model]
+    return result
+
+async def query_chairman(model, messages, ends_at, share=1.0, profile=None):
+    """One chairman attempt within a share of the remaining stage 3 time."""
+    remaining = (ends_at - time.monotonic()) * share
+    if remaining <= 0:
+        return None
+    try:
+        resp = await asyncio.wait_for(query_model(model, messages, timeout=min(120.0, remaining), profile=profile), timeout=remaining)
+    except asyncio.TimeoutError:
+        print(f"[{model}] ❌ Chairman missed the stage 3 deadline")
+        return None
+    content = (resp or {}).get('content')
+    return content if content and content.strip() else None
 
-async def stage3_synthesize(user_query, stage1_results, stage2_results, chairman=None):
+async def stage3_synthesize(user_query, stage1_results, stage2_results, chairman=None, deadline=None, aggregate=None, profile=None, clusters=None):
+    """Chairman with ordered fallbacks (optionally racing two) and a deadline; falls back to the top-ranked answer."""
     chairman = chairman or CHAIRMAN_MODEL
 
-    s1_text = "\n\n".join([f"{r['model']}: {r['response']}" for r in stage1_results])
-    s2_text = "\n\n".join([f"{r['model']}: {r['ranking']}" for r in stage2_results])
+    # Each cluster of near-identical answers once, under its representative
+    clusters = clusters or {}
+    clustered = {m for members in clusters.values() for m in members}
+    s1_text = "\n\n".join([
+        f"{r['model']}" + (f" (near-identical answers also from: {', '.join(clusters[r['model']])})" if r['model'] in clusters else "")
+        + f": {r['response']}" for r in stage1_results if r['model'] not in clustered])
+    s2_text = "\n\n".join([f"{r['model']}: {r['ranking']}" for r in stage2_results]) or "(No peer rankings this time.)"
 
     prompt = f"""You are the Chairman. Synthesize the best answer.
 
@@ -263,41 +1374,435 @@ Rankings:
 Provide the final answer:"""
 
     messages = [{"role": "user", "content": prompt}]
-    resp = await query_model(chairman, messages)
-
-    if not resp:
+    ends_at = time.monotonic() + (deadline if deadline is not None else REQUEST_SLO_SECONDS)
+    queue = [chairman] + [m for m in CHAIRMAN_FALLBACK_MODELS if m != chairman]
+    failed = []
+
+    if CHAIRMAN_RACE and len(queue) >= 2:
+        share = 1.0 if len(queue) == 2 else CHAIRMAN_ATTEMPT_SHARE
+        racers = {asyncio.ensure_future(query_chairman(m, messages, ends_at, share, profile)): m for m in queue[:2]}
+        queue, pending = queue[2:], set(racers)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result() is not None:
+                        return {"model": racers[task], "response": task.result(), **({"fallback_from": failed} if failed else {})}
+                    failed.append(racers[task])
+        finally:
+            for task in pending:
+                task.cancel()
+
+    for i, model in enumerate(queue):
+        if time.monotonic() >= ends_at:
+            break
+        content = await query_chairman(model, messages, ends_at, 1.0 if i == len(queue) - 1 else CHAIRMAN_ATTEMPT_SHARE, profile)
+        if content is not None:
+            return {"model": model, "response": content, **({"fallback_from": failed} if failed else {})}
+        failed.append(model)
+
+    # No chairman in time: return the council's top-ranked individual answer
+    answers = {r['model']: r for r in stage1_results if r.get('response')}
+    best = next((answers[a['model']] for a in aggregate or [] if a['model'] in answers), None) or next(iter(answers.values()), None)
+    if not best:
         return {"model": chairman, "response": "Error: Unable to synthesize."}
-    return {"model": chairman, "response": resp.get('content', '')}
+    return {"model": best['model'], "response": best['response'], "fallback": "top_ranked_stage1", "fallback_from": failed}
+
+def response_labels(count):
+    """Spreadsheet-style labels (A..Z, AA, AB, ...) so councils can exceed 26 members."""
+    labels = []
+    for n in range(1, count + 1):
+        label = ""
+        while n > 0:
+            n, rem = divmod(n - 1, 26)
+            label = chr(65 + rem) + label
+        labels.append(label)
+    return labels
+
+RANKING_LABEL_RE = re.compile(r'(?P<numbered>\d+\.\s*)?(?P<label>Response [A-Z]+)\b')
+JSON_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*(.*?)\s*```\s*$', re.DOTALL)
+
+_EVALUATION_SCHEMA = {
+    "type": "object",
+    "properties": {"label": {"type": "string"}, "critique": {"type": "string"},
+                   **{c: {"type": "integer", "minimum": 1, "maximum": 10} for c in RANKING_CRITERIA}},
+    "required": ["label", "critique", *RANKING_CRITERIA],
+    "additionalProperties": False,
+}
+RANKING_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "council_ranking", "strict": True, "schema": {
+        "type": "object",
+        "properties": {"evaluations": {"type": "array", "items": _EVALUATION_SCHEMA},
+                       "final_ranking": {"type": "array", "items": {"type": "string"}}},
+        "required": ["evaluations", "final_ranking"],
+        "additionalProperties": False,
+    }},
+}
 
 def parse_ranking(text):
-    if "FINAL RANKING:" in text:
-        section = text.split("FINAL RANKING:")[1]
-        matches = re.findall(r'\d+\.\s*Response [A-Z]', section)
-        if matches:
-            return [re.search(r'Response [A-Z]', m).group() for m in matches]
-    return re.findall(r'Response [A-Z]', text)
+    """Single-pass parse: numbered FINAL RANKING list, else first mention of each label."""
+    marker = text.find("FINAL RANKING:")
+    section = text[marker + len("FINAL RANKING:"):] if marker != -1 else text
+    numbered, mentioned = [], []
+    for m in RANKING_LABEL_RE.finditer(section):
+        label = m.group('label')
+        if m.group('numbered') and label not in numbered:
+            numbered.append(label)
+        if label not in mentioned:
+            mentioned.append(label)
+    if numbered and marker != -1:
+        return numbered, "numbered"
+    return mentioned, "final_ranking" if marker != -1 else "mentions"
+
+def _normalize_label(label):
+    if not isinstance(label, str):
+        return None
+    label = label.strip()
+    if label.lower().startswith("response"):
+        label = label[len("response"):].strip()
+    return f"Response {label.upper()}" if label.isalpha() else None
+
+def parse_structured_ranking(text, label_to_model):
+    """Validate a JSON ranking reply; returns None so callers fall back to the text parser."""
+    fenced = JSON_FENCE_RE.match(text)
+    if fenced:
+        text = fenced.group(1)
+    if not text.lstrip().startswith("{"):
+        return None
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("final_ranking"), list):
+        return None
+    ranking = []
+    for label in map(_normalize_label, data["final_ranking"]):
+        if label in label_to_model and label not in ranking:
+            ranking.append(label)
+    if not ranking:
+        return None
+    scores, critiques = {}, []
+    for ev in data.get("evaluations") or []:
+        label = _normalize_label(ev.get("label")) if isinstance(ev, dict) else None
+        if label in label_to_model:
+            scores[label] = {c: ev[c] for c in RANKING_CRITERIA if isinstance(ev.get(c), (int, float))}
+            critiques.append(f"{label}: {ev.get('critique', '')}")
+    rendered = "\n\n".join(critiques) + "\n\nFINAL RANKING:\n" + "\n".join(f"{i}. {l}" for i, l in enumerate(ranking, 1))
+    return {"ranking": ranking, "scores": scores, "text": rendered.strip()}
+
+def ranking_parsed(r):
+    """False for reviews whose order is only the order labels were mentioned in (no FINAL RANKING)."""
+    method = r.get('parse_method') or parse_ranking(r['ranking'])[1]
+    return method != "mentions"
 
 def calc_aggregate(stage2_results, label_to_model):
     positions = defaultdict(list)
-    for r in stage2_results:
-        for i, label in enumerate(parse_ranking(r['ranking']), 1):
+    for r in filter(ranking_parsed, stage2_results):
+        # Reuse the stage-2 parse; only legacy results without it are re-parsed
+        parsed = r.get('parsed_ranking')
+        if parsed is None:
+            parsed = parse_ranking(r['ranking'])[0]
+        subsampled = 'assigned' in r
+        if subsampled:
+            parsed = [l for l in parsed if l in label_to_model]
+        for i, label in enumerate(parsed, 1):
             if label in label_to_model:
+                # Stretch partial (subsampled) rankings onto the full 1..n scale
+                if subsampled and 1 < len(parsed) < len(label_to_model):
+                    i = 1 + (i - 1) * (len(label_to_model) - 1) / (len(parsed) - 1)
                 positions[label_to_model[label]].append(i)
 
     agg = [{"model": m, "average_rank": round(sum(p)/len(p), 2)} for m, p in positions.items() if p]
     agg.sort(key=lambda x: x['average_rank'])
     return agg
 
+# ============== RETRIEVAL ==============
+
+# Stage 1 searches the web once per query instead of once per council member:
+# a search backend returns [{title, url, snippet}], cached in KV by normalized
+# query for RETRIEVAL_CACHE_TTL, and every member gets the same numbered
+# sources. "openrouter" is one web-plugin call on RETRIEVAL_MODEL (its
+# url_citation annotations); "local" searches the JSON documents at
+# RETRIEVAL_LOCAL_PATH (tests, offline); "none" turns web context off.
+RETRIEVAL_BACKEND = os.getenv("LLM_COUNCIL_RETRIEVAL", "openrouter")
+RETRIEVAL_MODEL = "openai/gpt-4o-mini"
+RETRIEVAL_MAX_RESULTS = 5
+RETRIEVAL_SNIPPET_CHARS = 400
+RETRIEVAL_TIMEOUT = 20.0
+RETRIEVAL_CACHE_TTL = 3600
+RETRIEVAL_LOCAL_PATH = os.getenv("LLM_COUNCIL_RETRIEVAL_LOCAL_PATH", "retrieval_corpus.json")
+
+async def openrouter_search(query, max_results):
+    # Through query_model, so the call is routed, recorded / replayed by the cassette and traced like any other
+    message = await query_model(RETRIEVAL_MODEL, [{"role": "user", "content": f"Search the web for: {query}\n\nSummarize what you find in two sentences."}],
+                                timeout=RETRIEVAL_TIMEOUT, profile=generation_profiles(None)["retrieval"],
+                                plugins=[{"id": "web", "max_results": max_results}])
+    if message is None:
+        raise RuntimeError(f"Search call to {RETRIEVAL_MODEL} failed")
+    sources = {}
+    for a in message.get('annotations') or []:
+        c = a.get('url_citation') or {}
+        if a.get('type') == 'url_citation' and c.get('url') and c['url'] not in sources:
+            sources[c['url']] = {"title": c.get('title') or c['url'], "url": c['url'], "snippet": c.get('content') or ''}
+    sources = list(sources.values())[:max_results]
+    if sources and not any(src["snippet"] for src in sources):
+        sources[0]["snippet"] = message.get('content') or ''  # Cited without excerpts: keep the summary
+    return sources
+
+_local_documents = None
+
+async def local_search(query, max_results):
+    global _local_documents
+    if _local_documents is None:
+        with open(RETRIEVAL_LOCAL_PATH, encoding="utf-8") as f:
+            _local_documents = [(d, set(re.findall(r"\w+", f"{d.get('title', '')} {d['text']}".lower()))) for d in json.load(f)]
+    words = set(normalize_query(query).split())
+    scored = sorted(((len(words & w), i) for i, (_, w) in enumerate(_local_documents)), key=lambda x: (-x[0], x[1]))
+    return [{"title": _local_documents[i][0].get("title", ""), "url": _local_documents[i][0].get("url", ""),
+             "snippet": _local_documents[i][0]["text"]} for score, i in scored[:max_results] if score > 0]
+
+# Pluggable: register another async (query, max_results) -> sources function here
+SEARCH_BACKENDS = {"openrouter": openrouter_search, "local": local_search}
+
+def normalize_query(query):
+    return " ".join(re.findall(r"\w+", query.lower()))
+
+async def retrieve(query, backend=None):
+    """{backend, sources, cached} for a query (None when retrieval is off); backend errors propagate uncached."""
+    backend = backend or RETRIEVAL_BACKEND
+    if backend == "none":
+        return None
+    if backend not in SEARCH_BACKENDS:
+        raise ValueError(f"Unknown retrieval backend: {backend}")
+    key = f"retrieval:{backend}:{hashlib.sha256(normalize_query(query).encode()).hexdigest()[:32]}"
+    # Blocking KV calls run in a thread, off the loop the other councils share
+    cached = await asyncio.to_thread(kv_command, "GET", key)
+    if cached:
+        return {"backend": backend, "sources": decode_kv_value(cached), "cached": True}
+    with span("retrieval.search", backend=backend) as attrs:
+        sources = await SEARCH_BACKENDS[backend](query, RETRIEVAL_MAX_RESULTS)
+        attrs["sources"] = len(sources)
+    for src in sources:
+        snippet = " ".join((src.get("snippet") or "").split())
+        src["snippet"] = snippet if len(snippet) <= RETRIEVAL_SNIPPET_CHARS else snippet[:RETRIEVAL_SNIPPET_CHARS].rsplit(" ", 1)[0] + "..."
+    await asyncio.to_thread(kv_command, "SET", key, encode_kv_value(sources).decode(), "EX", RETRIEVAL_CACHE_TTL)
+    return {"backend": backend, "sources": sources, "cached": False}
+
+def stage1_messages(user_query, retrieval):
+    """The question, preceded by the shared numbered sources when there are any."""
+    messages = [{"role": "user", "content": user_query}]
+    if retrieval and retrieval["sources"]:
+        context = "\n\n".join(f"[{n}] {src['title']} ({src['url']})\n{src['snippet']}" for n, src in enumerate(retrieval["sources"], start=1))
+        messages.insert(0, {"role": "system", "content": "Web search results for the user's question (cite them as [n] where "
+                                                         "you use them; they may be incomplete or wrong):\n\n" + context})
+    return messages
+
+# ============== COUNCIL GRAPH ==============
+
+# A stage 1/2 model call running longer than this counts as failed
+MODEL_NODE_TIMEOUT = float(os.getenv("MODEL_NODE_TIMEOUT", "150"))
+
+async def run_graph(nodes, on_event=None):
+    """Run {name: (fn, deps, after, timeout)} nodes (deps listed first), each as soon as its inputs are ready.
+
+    fn(inputs) gets the results of deps and of the after nodes that succeeded; a failed dep
+    skips the node. on_event(kind, name, value) sees node_start/node_complete/node_failed/node_skipped.
+    Returns (results, failed); cancelling the run cancels the nodes in flight.
+    """
+    emit = on_event or (lambda *_: None)
+    results, failed, skipped = {}, {}, set()
+    waiting, running = dict(nodes), {}
+
+    async def run_node(name, fn, inputs, timeout):
+        with span("dag.node", node=name), profile_stage(name):
+            result = fn(inputs)
+            if asyncio.iscoroutine(result):
+                result = await asyncio.wait_for(result, timeout) if timeout else await result
+            return result
+
+    try:
+        while waiting or running:
+            progressed = True
+            while progressed:
+                progressed = False
+                for name, (fn, deps, after, timeout) in list(waiting.items()):
+                    if any(d in failed or d in skipped for d in deps):
+                        del waiting[name]
+                        skipped.add(name)
+                        emit("node_skipped", name, None)
+                        progressed = True
+                    elif all(d in results for d in deps) and all(d in results or d in failed or d in skipped for d in after):
+                        del waiting[name]
+                        inputs = {d: results[d] for d in list(deps) + list(after) if d in results}
+                        running[asyncio.ensure_future(run_node(name, fn, inputs, timeout))] = name
+                        emit("node_start", name, None)
+            if not running:
+                break
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = running.pop(task)
+                try:
+                    results[name] = task.result()
+                    emit("node_complete", name, results[name])
+                except Exception as e:
+                    failed[name] = e
+                    emit("node_failed", name, e)
+    finally:
+        for task in running:
+            task.cancel()
+    return results, failed
+
+def council_graph(user_query, council_models, chairman, ranking_mode=None, review_sample_size=None, started_at=None, profiles=None,
+                  skip_review=False, degradation=None):
+    """Council nodes: retrieval, stage1:<model> answers, stage1, stage1.dedupe, stage2.plan, stage2:<model> reviews, stage2, stage3.
+
+    skip_review leaves out stage2.plan and the reviews (stage2 then has no rankings); degradation is
+    the degradation report put in the stage 2 metadata.
+    """
+    started_at = started_at or time.monotonic()
+    profiles = profiles or generation_profiles(None)
+    durations = []
+
+    def answer(model):
+        async def run(inputs):
+            start = time.monotonic()
+            try:
+                # If the shared search failed, fall back to the per-model web plugin
+                resp = await query_model(model, stage1_messages(user_query, inputs.get("retrieval")),
+                                         web_search="retrieval" not in inputs, profile=profiles["stage1"])
+            finally:
+                durations.append(time.monotonic() - start)
+            if not resp:
+                raise RuntimeError(f"{model} did not answer")
+            return {"model": model, "response": resp.get('content', '')}
+        return run
+
+    def review(model):
+        async def run(inputs):
+            plan = inputs["stage2.plan"]
+            if model not in plan["messages"]:
+                raise LookupError(f"No answers assigned to {model}")
+            resp = await query_model(model, plan["messages"][model], response_format=plan["response_format"],
+                                     profile=profiles["stage2"])
+            if not resp:
+                raise RuntimeError(f"{model} did not review")
+            return ranking_result(model, resp.get('content') or '', plan)
+        return run
+
+    async def collect_answers(inputs):
+        # Blocking KV calls: keep them off the loop the other councils share
+        await asyncio.to_thread(degradation_record, list(durations))
+        s1 = [inputs[f"stage1:{m}"] for m in council_models if f"stage1:{m}" in inputs]
+        if not s1:
+            raise RuntimeError("All models failed to respond in Stage 1")
+        return s1
+
+    def deduplicate(inputs):
+        s1 = inputs["stage1"]
+        clusters = cluster_answers(s1)
+        return {"answers": [s1[c[0]] for c in clusters],
+                "members": {s1[c[0]]['model']: [s1[i]['model'] for i in c[1:]] for c in clusters if len(c) > 1}}
+
+    def collect_rankings(inputs):
+        label_map = inputs["stage2.plan"]["label_to_model"] if not skip_review else {}
+        members = inputs["stage1.dedupe"]["members"]
+        s2 = [inputs[f"stage2:{m}"] for m in council_models if f"stage2:{m}" in inputs]
+        # Cluster members share their representative's ranking
+        agg = []
+        for entry in calc_aggregate(s2, label_map):
+            agg += [entry] + [{**entry, "model": m, "clustered_with": entry["model"]} for m in members.get(entry["model"], [])]
+        metadata = {"label_to_model": label_map, "aggregate_rankings": agg, **({"answer_clusters": members} if members else {})}
+        unparsed = [r["model"] for r in s2 if not ranking_parsed(r)]
+        if unparsed:
+            # Left out of the aggregate: mention order says nothing about preference
+            metadata["unparsed_rankings"] = unparsed
+        if inputs.get("retrieval"):
+            metadata["sources"] = [{"title": src["title"], "url": src["url"]} for src in inputs["retrieval"]["sources"]]
+        if degradation is not None:
+            metadata["degradation"] = degradation
+        return {"results": s2, "metadata": metadata}
+
+    async def synthesize(inputs):
+        deadline = max(CHAIRMAN_MIN_DEADLINE, REQUEST_SLO_SECONDS - (time.monotonic() - started_at))
+        s2 = inputs["stage2"]
+        return await stage3_synthesize(user_query, inputs["stage1"], s2["results"], chairman,
+                                       deadline=deadline, aggregate=s2["metadata"]["aggregate_rankings"],
+                                       profile=profiles["stage3"], clusters=s2["metadata"].get("answer_clusters"))
+
+    nodes = {"retrieval": (lambda i: retrieve(user_query), (), (), RETRIEVAL_TIMEOUT)}
+    nodes.update({f"stage1:{m}": (answer(m), (), ("retrieval",), MODEL_NODE_TIMEOUT) for m in council_models})
+    nodes["stage1"] = (collect_answers, (), [f"stage1:{m}" for m in council_models], None)
+    nodes["stage1.dedupe"] = (deduplicate, ("stage1",), (), None)
+    if skip_review:
+        nodes["stage2"] = (collect_rankings, ("stage1.dedupe",), ["retrieval"], None)
+    else:
+        nodes["stage2.plan"] = (lambda i: ranking_plan(user_query, i["stage1.dedupe"]["answers"], council_models, ranking_mode, review_sample_size),
+                                ("stage1.dedupe",), (), None)
+        nodes.update({f"stage2:{m}": (review(m), ("stage2.plan",), (), MODEL_NODE_TIMEOUT) for m in council_models})
+        nodes["stage2"] = (collect_rankings, ("stage1.dedupe", "stage2.plan"), [f"stage2:{m}" for m in council_models] + ["retrieval"], None)
+    nodes["stage3"] = (synthesize, ("stage1", "stage2"), (), None)
+    return nodes
+
+def council_progress(council_models, chairman, send):
+    """Translate graph events into the SSE protocol: <stage>_start, model_status, <stage>_complete."""
+    started = set()
+
+    def on_event(kind, name, value):
+        stage, _, model = name.partition(":")
+        stage = stage.split(".")[0]
+        if stage == "retrieval":
+            return  # Its sources are reported in the stage 2 metadata
+        if kind == "node_start" and stage not in started:
+            started.add(stage)
+            send(f"{stage}_start", {"model": chairman} if stage == "stage3" else {"models": council_models})
+        elif model and kind in ("node_complete", "node_failed"):
+            send("model_status", {"model": model, "status": "success" if kind == "node_complete" else "failed",
+                                  "stage": int(stage[-1])})
+        elif kind == "node_complete" and name == "stage2":
+            send("stage2_complete", value["results"], value["metadata"])
+        elif kind == "node_complete" and name in ("stage1", "stage3"):
+            send(f"{name}_complete", value)
+
+    return on_event
+
 # ============== HANDLER ==============
 
 class handler(BaseHTTPRequestHandler):
-    def send_json(self, data, status=200):
+    def send_json(self, data, status=200, headers=None):
+        """Send a JSON response; data may be pre-serialized bytes."""
         self.send_response(status)
         self.send_header('Content-type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Auth-Password, X-Auth-Email')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Auth-Password, X-Auth-Email, If-None-Match')
+        self.send_header('Access-Control-Expose-Headers', 'ETag, Retry-After')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        body = data if isinstance(data, bytes) else json_bytes(data)
+        if len(body) >= 1024:
+            accepted = self.headers.get('Accept-Encoding', '').lower()
+            if BROTLI_AVAILABLE and 'br' in accepted:
+                import brotli
+                body = brotli.compress(body, quality=5)
+                self.send_header('Content-Encoding', 'br')
+            elif 'gzip' in accepted:
+                body = gzip.compress(body, compresslevel=6)
+                self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def is_not_modified(self, etag):
+        tags = [t.strip() for t in self.headers.get('If-None-Match', '').split(',') if t.strip()]
+        return '*' in tags or etag in tags
+
+    def send_not_modified(self, etag):
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Expose-Headers', 'ETag')
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
 
     def send_sse(self, event_type, data=None, metadata=None):
         event = {"type": event_type}
@@ -305,7 +1810,7 @@ class handler(BaseHTTPRequestHandler):
             event["data"] = data
         if metadata is not None:
             event["metadata"] = metadata
-        self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+        self.wfile.write(b"data: " + json_bytes(event) + b"\n\n")
         self.wfile.flush()
 
     def get_auth(self):
@@ -321,14 +1826,39 @@ class handler(BaseHTTPRequestHandler):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Auth-Password, X-Auth-Email')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Auth-Password, X-Auth-Email, If-None-Match')
         self.end_headers()
 
     def do_GET(self):
         path = urlparse(self.path).path
 
         if path == '/api' or path == '/api/':
-            self.send_json({"status": "ok", "service": "LLM Council API"})
+            self.send_json(HEALTH_BODY)
+            return
+
+        # GET /api/warmup - import httpx and open the OpenRouter and KV connections
+        if path == '/api/warmup':
+            valid, error = self.check_auth()
+            if not valid:
+                self.send_json({"error": error}, 401)
+                return
+            self.send_json(warm_up())
+            return
+
+        # GET /api/admin/slow-requests[/{id}] - flight recorder (X-Admin-Token)
+        if path.startswith('/api/admin/slow-requests'):
+            if not ADMIN_TOKEN or self.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+                self.send_json({"error": "Not found"}, 404)
+                return
+            entries = [json_parse(e) for e in kv_command("LRANGE", "slow_requests", 0, -1) or []]
+            recording_id = path[len('/api/admin/slow-requests'):].strip('/')
+            if recording_id:
+                match = next((e for e in entries if e["id"] == recording_id), None)
+                self.send_json(match or {"error": "Recording not found"}, 200 if match else 404)
+            else:
+                hidden = ("profile", "task_dumps", "sample_interval")
+                self.send_json({"enabled": PROFILING_ENABLED,
+                                "requests": [{k: v for k, v in e.items() if k not in hidden} for e in entries]})
             return
 
         if path == '/api/models':
@@ -336,11 +1866,7 @@ class handler(BaseHTTPRequestHandler):
             if not valid:
                 self.send_json({"error": error}, 401)
                 return
-            self.send_json({
-                "available_models": AVAILABLE_MODELS,
-                "default_council_models": COUNCIL_MODELS,
-                "default_chairman_model": CHAIRMAN_MODEL
-            })
+            self.send_json(MODELS_BODY)
             return
 
         if path == '/api/sessions':
@@ -349,25 +1875,94 @@ class handler(BaseHTTPRequestHandler):
                 self.send_json({"error": error}, 401)
                 return
             _, email = self.get_auth()
+            # Cheap counter check first: an unchanged list is never fetched from KV
+            version = get_sessions_version(email)
+            etag = f'W/"sessions-{version}"' if version is not None else None
+            if etag and self.is_not_modified(etag):
+                self.send_not_modified(etag)
+                return
             sessions = get_user_sessions(email)
-            # Return summary only (no full messages)
+            # Return summary only (no full messages); archived sessions come from the archive index
             summary = [{"id": s["id"], "title": s["title"], "created_at": s["created_at"], "message_count": len(s["messages"])} for s in sessions]
-            self.send_json(summary)
+            summary = sorted(summary + archived_session_summaries(email, {s["id"] for s in sessions}),
+                             key=lambda s: s["created_at"], reverse=True)
+            self.send_json(summary, headers={"ETag": etag} if etag else None)
+            return
+
+        # GET /api/search?q=...&limit=20&stage1=0
+        if path == '/api/search':
+            valid, error = self.check_auth()
+            if not valid:
+                self.send_json({"error": error}, 401)
+                return
+            _, email = self.get_auth()
+            query = parse_qs(urlparse(self.path).query)
+            q = query.get('q', [''])[0]
+            try:
+                limit = max(1, min(100, int(query.get('limit', ['20'])[0])))
+            except ValueError:
+                limit = 20
+            start = time.monotonic()
+            results = search_sessions(email, q, limit, include_stage1=query.get('stage1', ['1'])[0] != '0')
+            self.send_json({"query": q, "results": results, "took_ms": round((time.monotonic() - start) * 1000, 2)})
             return
 
-        # GET /api/sessions/{id}
+        # GET /api/sessions/{id}[?view=slim&offset=&limit=]
+        # GET /api/sessions/{id}/messages/{index} -> Stage 1 / Stage 2 details
         if path.startswith('/api/sessions/'):
             valid, error = self.check_auth()
             if not valid:
                 self.send_json({"error": error}, 401)
                 return
             _, email = self.get_auth()
-            session_id = path.split('/api/sessions/')[1]
-            session = get_session(email, session_id)
-            if session:
-                self.send_json(session)
-            else:
+            parts = path[len('/api/sessions/'):].strip('/').split('/')
+            session = get_session(email, parts[0])
+            if not session:
                 self.send_json({"error": "Session not found"}, 404)
+                return
+
+            if len(parts) == 3 and parts[1] == 'messages' and parts[2].isdigit():
+                index = int(parts[2])
+                messages = session["messages"]
+                if index >= len(messages) or messages[index].get("role") != "assistant":
+                    self.send_json({"error": "Message not found"}, 404)
+                    return
+                message = messages[index]
+                self.send_json({
+                    "index": index,
+                    "stage1": message.get("stage1", []),
+                    "stage2": message.get("stage2", []),
+                    "metadata": message.get("metadata", {}),
+                })
+                return
+
+            query = parse_qs(urlparse(self.path).query)
+            etag = f'W/"session-{session["id"]}-{session.get("version", 0)}"'
+
+            # GET /api/sessions/{id}/delta?since_version=N
+            if len(parts) == 2 and parts[1] == 'delta':
+                try:
+                    since_version = int(query.get('since_version', [''])[0])
+                except ValueError:
+                    self.send_json({"error": "since_version must be an integer"}, 400)
+                    return
+                if since_version == session.get("version", 0) or self.is_not_modified(etag):
+                    self.send_not_modified(etag)
+                    return
+                self.send_json(session_delta(session, since_version), headers={"ETag": etag})
+                return
+
+            if self.is_not_modified(etag):
+                self.send_not_modified(etag)
+                return
+            view = query.get('view', ['full'])[0]
+            try:
+                offset = int(query.get('offset', ['0'])[0])
+                limit = int(query['limit'][0]) if 'limit' in query else None
+            except ValueError:
+                self.send_json({"error": "offset and limit must be integers"}, 400)
+                return
+            self.send_json(session_view(session, view, offset, limit), headers={"ETag": etag})
             return
 
         self.send_json({"error": "Not found"}, 404)
@@ -401,8 +1996,26 @@ class handler(BaseHTTPRequestHandler):
                 return
 
             session_id = body.get('session_id')
-            council_models = body.get('council_models', COUNCIL_MODELS)
+            council_models = list(dict.fromkeys(body.get('council_models') or COUNCIL_MODELS))
             chairman = body.get('chairman_model', CHAIRMAN_MODEL)
+            ranking_mode = body.get('ranking_mode')
+            review_sample_size = body.get('review_sample_size')
+            lane = body.get('priority') or 'interactive'
+            try:
+                profiles = generation_profiles(body.get('generation'))
+            except ValueError as e:
+                self.send_json({"error": str(e)}, 400)
+                return
+            if lane not in ADMISSION_LANE_WEIGHTS:
+                self.send_json({"error": f"Unknown priority: {lane}"}, 400)
+                return
+
+            try:
+                ticket = admission_enqueue(email, lane)
+            except AdmissionRejected as e:
+                self.send_json({"error": f"Council is at capacity ({e.reason}), retry later"}, 429,
+                               {"Retry-After": str(e.retry_after)})
+                return
 
             # Send SSE headers
             self.send_response(200)
@@ -411,66 +2024,59 @@ class handler(BaseHTTPRequestHandler):
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
 
-            # Run council and save results
-            async def run():
-                try:
-                    # Stage 1: Collect responses with per-model status updates
-                    self.send_sse("stage1_start", {"models": council_models})
-
-                    def on_model_complete(model, status, result):
-                        self.send_sse("model_status", {
-                            "model": model,
-                            "status": status,
-                            "stage": 1
-                        })
-
-                    s1 = await stage1_collect_responses(user_query, council_models, on_model_complete=on_model_complete)
-                    self.send_sse("stage1_complete", s1)
-
-                    if not s1:
-                        self.send_sse("error", {"message": "All models failed to respond in Stage 1"})
-                        return
-
-                    # Stage 2: Collect rankings with per-model status updates
-                    self.send_sse("stage2_start", {"models": council_models})
-
-                    def on_ranking_complete(model, status, result):
-                        self.send_sse("model_status", {
-                            "model": model,
-                            "status": status,
-                            "stage": 2
-                        })
-
-                    s2, label_map = await stage2_collect_rankings(user_query, s1, council_models, on_model_complete=on_ranking_complete)
-                    agg = calc_aggregate(s2, label_map)
-                    self.send_sse("stage2_complete", s2, {"label_to_model": label_map, "aggregate_rankings": agg})
-
-                    # Stage 3: Chairman synthesis
-                    self.send_sse("stage3_start", {"model": chairman})
-                    s3 = await stage3_synthesize(user_query, s1, s2, chairman)
-                    self.send_sse("stage3_complete", s3)
-
-                    # Save to session if session_id provided
-                    if session_id:
-                        # Add user message
-                        add_message_to_session(email, session_id, {"role": "user", "content": user_query})
-                        # Add assistant message with all stages
-                        assistant_msg = {
-                            "role": "assistant",
-                            "stage1": s1,
-                            "stage2": s2,
-                            "stage3": s3,
-                            "metadata": {"label_to_model": label_map, "aggregate_rankings": agg}
-                        }
-                        add_message_to_session(email, session_id, assistant_msg)
-
-                    self.send_sse("complete")
-
-                except Exception as e:
-                    print(f"Council error: {type(e).__name__}: {e}")
-                    self.send_sse("error", {"message": f"Council error: {str(e)}"})
-
-            asyncio.run(run())
+            try:
+                admission_wait(ticket, lambda status: self.send_sse("queued", status))
+            except AdmissionRejected as e:
+                self.send_sse("error", {"message": "Council is at capacity, retry later", "retry_after": e.retry_after})
+                return
+            except Exception:
+                admission_release(ticket)
+                raise
+
+            # Run council and save results; events go back to this thread to be written
+            async def run(emit):
+                started_at = time.monotonic()
+                with start_trace("council.request", models=len(council_models), session=bool(session_id)), \
+                        profile_request("council", models=len(council_models)):
+                    try:
+                        # Shrink the council / skip review / swap the chairman under load (reported in metadata)
+                        models, chair, sample, skip_review, report = await asyncio.to_thread(
+                            degradation_plan, council_models, chairman, review_sample_size)
+                        nodes = council_graph(user_query, models, chair, ranking_mode, sample, started_at, profiles,
+                                              skip_review=skip_review, degradation=report)
+                        results, failed = await run_graph(nodes, council_progress(models, chair, emit))
+                        for stage in ("stage1", "stage2", "stage3"):
+                            if stage in failed:
+                                emit("error", {"message": str(failed[stage])})
+                                return
+                        s1, s2, s3 = results["stage1"], results["stage2"]["results"], results["stage3"]
+                        metadata = results["stage2"]["metadata"]
+
+                        # Save to session if session_id provided
+                        if session_id:
+                            # Add user message
+                            await asyncio.to_thread(add_message_to_session, email, session_id,
+                                                    {"role": "user", "content": user_query})
+                            # Add assistant message with all stages
+                            assistant_msg = {
+                                "role": "assistant",
+                                "stage1": s1,
+                                "stage2": s2,
+                                "stage3": s3,
+                                "metadata": metadata
+                            }
+                            await asyncio.to_thread(add_message_to_session, email, session_id, assistant_msg)
+
+                        emit("complete")
+
+                    except Exception as e:
+                        print(f"Council error: {type(e).__name__}: {e}")
+                        emit("error", {"message": f"Council error: {str(e)}"})
+
+            try:
+                run_streaming(run, self.send_sse)
+            finally:
+                admission_release(ticket)
             return
 
         self.send_json({"error": "Not found"}, 404)
@@ -0,0 +1,238 @@
+"""Admission control in front of council runs.
+
+At most ADMISSION_MAX_CONCURRENT councils run at once. Each user may have at
+most ADMISSION_PER_USER_LIMIT councils running or queued. Requests over the
+per-user limit are rejected straight away.
+
+Each request comes in on a priority lane ("interactive" or "batch"). Waiting
+requests are ordered by virtual finish time: arrival + expected service time
+/ lane weight. A heavier lane therefore goes ahead of older requests on a
+lighter lane, but only up to a point, so no lane is starved.
+
+Each lane has a queue-time SLO. A request whose estimated wait already
+exceeds it is rejected on arrival with a Retry-After hint instead of joining
+the queue. A request still queued when its SLO runs out is also rejected.
+Expected service time is an EWMA of observed council durations.
+"""
+
+import asyncio
+import bisect
+import math
+import time
+from typing import AsyncIterator, List, Dict, Any, Optional
+
+from .config import (
+    ADMISSION_ENABLED,
+    ADMISSION_MAX_CONCURRENT,
+    ADMISSION_PER_USER_LIMIT,
+    ADMISSION_LANE_WEIGHTS,
+    ADMISSION_QUEUE_SLO_SECONDS,
+    ADMISSION_INITIAL_SERVICE_SECONDS,
+)
+
+LANES = tuple(ADMISSION_LANE_WEIGHTS)
+DEFAULT_LANE = "interactive"
+
+# Weight of the newest duration in the service time EWMA
+_SERVICE_EWMA_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """A council request that cannot be admitted (maps to HTTP 429)."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """One request's place in the admission queue, then its running slot."""
+
+    def __init__(self, controller: "AdmissionController", user: str, lane: str, score: float):
+        self.controller = controller
+        self.user = user
+        self.lane = lane
+        self.score = score
+        self.enqueued_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.released = False
+        self.changed = asyncio.Event()
+
+    @property
+    def admitted(self) -> bool:
+        return self.admitted_at is not None
+
+    @property
+    def queue_time(self) -> float:
+        """Seconds spent waiting (so far, if still queued)."""
+        return (self.admitted_at or time.monotonic()) - self.enqueued_at
+
+    async def wait(self) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Wait until admitted, yielding queue status whenever the position changes.
+
+        Yields:
+            Dicts with 'position' (1-based), 'lane' and 'estimated_wait' seconds
+
+        Raises:
+            AdmissionRejected: If still queued when the lane's SLO runs out
+        """
+        deadline = self.enqueued_at + ADMISSION_QUEUE_SLO_SECONDS[self.lane]
+        last_position = None
+        while not self.admitted:
+            position = self.controller.position(self)
+            if position != last_position:
+                last_position = position
+                yield {
+                    "position": position,
+                    "lane": self.lane,
+                    "estimated_wait": round(self.controller.estimated_wait(position), 1),
+                }
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.release()
+                raise AdmissionRejected("queue_timeout", self.controller.retry_after())
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self):
+        """Leave the queue or free the running slot (idempotent)."""
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    """Per-user limits and lane-weighted queueing of council runs."""
+
+    def __init__(
+        self,
+        max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+        per_user_limit: int = ADMISSION_PER_USER_LIMIT,
+        service_seconds: float = ADMISSION_INITIAL_SERVICE_SECONDS
+    ):
+        self.max_concurrent = max_concurrent
+        self.per_user_limit = per_user_limit
+        self.service_seconds = service_seconds
+        self.running: List[Ticket] = []
+        self.waiting: List[Ticket] = []
+        self.users: Dict[str, List[Ticket]] = {}
+        self.rejected: Dict[str, int] = {}
+
+    def estimated_wait(self, position: int) -> float:
+        """Expected seconds until the request at this queue position is admitted."""
+        return position * self.service_seconds / self.max_concurrent
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up."""
+        return max(1, math.ceil(self.service_seconds / self.max_concurrent))
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based queue position of a waiting ticket (0 once admitted)."""
+        if ticket.admitted:
+            return 0
+        index = bisect.bisect_left(self.waiting, ticket.score, key=lambda t: t.score)
+        while self.waiting[index] is not ticket:
+            index += 1
+        return index + 1
+
+    def _reject(self, reason: str, retry_after: int):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        raise AdmissionRejected(reason, retry_after)
+
+    def enqueue(self, user: str, lane: str = DEFAULT_LANE) -> Ticket:
+        """
+        Admit a council request or put it in the queue.
+
+        Args:
+            user: Caller identity for the per-user limit
+            lane: Priority lane ("interactive" or "batch")
+
+        Returns:
+            Ticket (already admitted if a slot was free); release it when done
+
+        Raises:
+            AdmissionRejected: Over the per-user limit, or the queue is too
+                long to meet the lane's SLO
+        """
+        if lane not in ADMISSION_LANE_WEIGHTS:
+            raise ValueError(f"Unknown priority lane: {lane}")
+
+        now = time.monotonic()
+        mine = self.users.get(user, [])
+        if len(mine) >= self.per_user_limit:
+            running = [t.admitted_at for t in mine if t.admitted]
+            wait = self.service_seconds - (now - min(running)) if running else self.service_seconds
+            self._reject("user_limit", max(1, math.ceil(wait)))
+
+        ticket = Ticket(self, user, lane, now + self.service_seconds / ADMISSION_LANE_WEIGHTS[lane])
+        if len(self.running) < self.max_concurrent and not self.waiting:
+            ticket.admitted_at = now
+            self.running.append(ticket)
+        else:
+            position = bisect.bisect_right(self.waiting, ticket.score, key=lambda t: t.score) + 1
+            wait = self.estimated_wait(position)
+            slo = ADMISSION_QUEUE_SLO_SECONDS[lane]
+            if wait > slo:
+                self._reject("queue_full", max(1, math.ceil(wait - slo)))
+            bisect.insort(self.waiting, ticket, key=lambda t: t.score)
+            self._notify()
+
+        self.users.setdefault(user, []).append(ticket)
+        return ticket
+
+    def _release(self, ticket: Ticket):
+        mine = self.users.get(ticket.user, [])
+        if ticket in mine:
+            mine.remove(ticket)
+            if not mine:
+                del self.users[ticket.user]
+
+        if ticket.admitted:
+            self.running.remove(ticket)
+            duration = time.monotonic() - ticket.admitted_at
+            self.service_seconds += _SERVICE_EWMA_ALPHA * (duration - self.service_seconds)
+        elif ticket in self.waiting:
+            self.waiting.remove(ticket)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Admit waiting tickets into free slots, lowest virtual finish time first."""
+        now = time.monotonic()
+        while self.waiting and len(self.running) < self.max_concurrent:
+            ticket = self.waiting.pop(0)
+            ticket.admitted_at = now
+            self.running.append(ticket)
+            ticket.changed.set()
+        self._notify()
+
+    def _notify(self):
+        """Wake waiting tickets so they re-check (and report) their position."""
+        for ticket in self.waiting:
+            ticket.changed.set()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current load, per-lane queue lengths and rejection counts."""
+        return {
+            "running": len(self.running),
+            "max_concurrent": self.max_concurrent,
+            "waiting": {lane: sum(1 for t in self.waiting if t.lane == lane) for lane in LANES},
+            "service_seconds": round(self.service_seconds, 2),
+            "oldest_wait": round(max((t.queue_time for t in self.waiting), default=0.0), 2),
+            "rejected": dict(self.rejected),
+        }
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_controller() -> Optional[AdmissionController]:
+    """The process-wide admission controller (None when ADMISSION_ENABLED is off)."""
+    global _controller
+    if _controller is None and ADMISSION_ENABLED:
+        _controller = AdmissionController()
+    return _controller
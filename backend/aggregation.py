@@ -0,0 +1,401 @@
+"""Rank aggregation engines for council peer reviews.
+
+Rankings are represented as NumPy arrays of 1-based positions with NaN for
+responses a reviewer did not rank. Every engine works on arrays of shape
+(..., reviewers, candidates), so the same code scores a single council run or
+thousands of stored runs at once.
+"""
+
+from typing import List, Dict, Any, Tuple, Optional
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+# Supported aggregation methods ("average" is the original mean-position score)
+AGGREGATION_METHODS = ("average", "borda", "copeland", "kemeny", "bradley_terry")
+
+
+def response_labels(count: int) -> List[str]:
+    """
+    Generate anonymous response labels that scale past 26 entries.
+
+    Labels follow spreadsheet column naming: A..Z, AA..AZ, BA..
+
+    Args:
+        count: Number of labels to generate
+
+    Returns:
+        List of labels (without the "Response " prefix)
+    """
+    labels = []
+    for index in range(count):
+        label = ""
+        n = index + 1
+        while n > 0:
+            n, remainder = divmod(n - 1, 26)
+            label = chr(65 + remainder) + label
+        labels.append(label)
+    return labels
+
+
+def _require_numpy():
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("numpy is required for rank aggregation (pip install numpy)")
+
+
+def build_rank_matrix(
+    stage2_results: List[Dict[str, Any]],
+    label_to_model: Dict[str, str],
+    models: Optional[List[str]] = None
+) -> Tuple["np.ndarray", List[str]]:
+    """
+    Build a (reviewers, candidates) position matrix for one council run.
+
+    Args:
+        stage2_results: Rankings from Stage 2 (with 'parsed_ranking')
+        label_to_model: Mapping from anonymous labels to model names
+        models: Optional candidate order (defaults to label order)
+
+    Returns:
+        Tuple of (position matrix, candidate model list)
+    """
+    tensor, models = build_rank_tensor([(stage2_results, label_to_model)], models)
+    return tensor[0], models
+
+
+def build_rank_tensor(
+    runs: List[Tuple[List[Dict[str, Any]], Dict[str, str]]],
+    models: Optional[List[str]] = None
+) -> Tuple["np.ndarray", List[str]]:
+    """
+    Build a (runs, reviewers, models) position tensor for many council runs.
+
+    Models that did not take part in a run have an all-NaN column, and runs
+    with fewer reviewers are padded with all-NaN rows.
+
+    Args:
+        runs: List of (stage2_results, label_to_model) pairs
+        models: Optional global model order (defaults to order of appearance)
+
+    Returns:
+        Tuple of (position tensor, model list)
+    """
+    _require_numpy()
+
+    if models is None:
+        models = []
+        seen = set()
+        for _, label_to_model in runs:
+            for model in label_to_model.values():
+                if model not in seen:
+                    seen.add(model)
+                    models.append(model)
+    model_index = {model: i for i, model in enumerate(models)}
+
+    max_reviewers = max((len(stage2) for stage2, _ in runs), default=0)
+    tensor = np.full((len(runs), max(max_reviewers, 1), len(models)), np.nan)
+
+    for run_index, (stage2_results, label_to_model) in enumerate(runs):
+        for reviewer_index, ranking in enumerate(stage2_results):
+            if ranking.get('parse_method') == "mentions":
+                # Mention order, not a ranking (see council.ranking_parsed)
+                continue
+            parsed = ranking.get('parsed_ranking') or []
+            position = 0
+            for label in parsed:
+                model = label_to_model.get(label)
+                if model is None or model not in model_index:
+                    continue
+                position += 1
+                tensor[run_index, reviewer_index, model_index[model]] = position
+
+    return tensor, models
+
+
+def pairwise_preferences(ranks: "np.ndarray") -> "np.ndarray":
+    """
+    Count how many reviewers prefer each candidate over each other candidate.
+
+    Only pairs that a reviewer actually ranked against each other count, so
+    incomplete (subsampled) rankings are handled naturally.
+
+    Args:
+        ranks: Position array of shape (..., reviewers, candidates)
+
+    Returns:
+        Array of shape (..., candidates, candidates) where [i, j] is the number
+        of reviewers ranking i above j
+    """
+    ranked = ~np.isnan(ranks)
+    filled = np.where(ranked, ranks, np.inf)
+    both = ranked[..., :, None] & ranked[..., None, :]
+    above = (filled[..., :, None] < filled[..., None, :]) & both
+    return above.sum(axis=-3).astype(float)
+
+
+def average_scores(ranks: "np.ndarray") -> "np.ndarray":
+    """Negated mean position (higher is better); NaN for never-ranked candidates."""
+    counts = (~np.isnan(ranks)).sum(axis=-2)
+    totals = np.nansum(ranks, axis=-2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, -totals / counts, np.nan)
+
+
+def borda_scores(ranks: "np.ndarray") -> "np.ndarray":
+    """
+    Borda count: each reviewer gives (ranked - position) points.
+
+    Partial rankings (subsampled review) are stretched to the full candidate
+    scale, so winning a three-way comparison is worth as much as winning
+    the full ballot. Complete rankings are unaffected.
+    """
+    ranked_count = (~np.isnan(ranks)).sum(axis=-1, keepdims=True)
+    candidates = (~np.all(np.isnan(ranks), axis=-2)).sum(axis=-1)[..., None, None]
+    scale = (candidates - 1) / np.maximum(ranked_count - 1, 1)
+    points = (ranked_count - ranks) * scale
+    return _mask_unranked(np.nansum(points, axis=-2), ranks)
+
+
+def copeland_scores(ranks: "np.ndarray") -> "np.ndarray":
+    """Copeland score: pairwise majority wins minus pairwise majority losses."""
+    prefs = pairwise_preferences(ranks)
+    opposite = np.swapaxes(prefs, -1, -2)
+    score = (prefs > opposite).sum(axis=-1) - (prefs < opposite).sum(axis=-1)
+    return _mask_unranked(score.astype(float), ranks)
+
+
+def condorcet_winner(ranks: "np.ndarray") -> "np.ndarray":
+    """
+    Find the Condorcet winner of each run.
+
+    Args:
+        ranks: Position array of shape (..., reviewers, candidates)
+
+    Returns:
+        Array of shape (...) with the winning candidate index, or -1 if none
+    """
+    prefs = pairwise_preferences(ranks)
+    opposite = np.swapaxes(prefs, -1, -2)
+    present = ~np.all(np.isnan(ranks), axis=-2)
+    beats = (prefs > opposite) | ~present[..., None, :]
+    np.einsum('...ii->...i', beats)[...] = True
+    winner = np.all(beats, axis=-1) & present
+    return np.where(winner.any(axis=-1), winner.argmax(axis=-1), -1)
+
+
+def kemeny_scores(ranks: "np.ndarray", passes: Optional[int] = None) -> "np.ndarray":
+    """
+    Approximate Kemeny-Young consensus ranking.
+
+    Starts from the Borda order and applies adjacent-swap local search, which
+    only ever reduces the number of pairwise disagreements with reviewers.
+
+    Args:
+        ranks: Position array of shape (..., reviewers, candidates)
+        passes: Number of local-search passes (defaults to the candidate count)
+
+    Returns:
+        Scores (higher is better) derived from the consensus order
+    """
+    prefs = pairwise_preferences(ranks)
+    batch_shape = prefs.shape[:-2]
+    n = prefs.shape[-1]
+    flat_prefs = prefs.reshape(-1, n, n)
+
+    borda = np.nan_to_num(borda_scores(ranks), nan=-np.inf).reshape(-1, n)
+    order = np.argsort(-borda, axis=-1, kind='stable')
+    rows = np.arange(order.shape[0])
+
+    for _ in range(passes if passes is not None else n):
+        swapped = False
+        for position in range(n - 1):
+            a = order[:, position]
+            b = order[:, position + 1]
+            swap = flat_prefs[rows, b, a] > flat_prefs[rows, a, b]
+            if swap.any():
+                swapped = True
+                order[swap, position] = b[swap]
+                order[swap, position + 1] = a[swap]
+        if not swapped:
+            break
+
+    scores = np.empty_like(order, dtype=float)
+    scores[rows[:, None], order] = n - np.arange(n)
+    return _mask_unranked(scores.reshape(*batch_shape, n), ranks)
+
+
+def bradley_terry_scores(
+    ranks: "np.ndarray",
+    iterations: int = 100,
+    prior: float = 0.1
+) -> "np.ndarray":
+    """
+    Bradley-Terry strengths fitted with the MM algorithm.
+
+    Args:
+        ranks: Position array of shape (..., reviewers, candidates)
+        iterations: Number of MM iterations
+        prior: Pseudo-wins added to every candidate to keep strengths finite
+
+    Returns:
+        Log-strengths (higher is better)
+    """
+    wins = pairwise_preferences(ranks)
+    games = wins + np.swapaxes(wins, -1, -2)
+    total_wins = wins.sum(axis=-1) + prior
+    strength = np.ones(wins.shape[:-1])
+
+    for _ in range(iterations):
+        pair_sum = strength[..., :, None] + strength[..., None, :]
+        denominator = (games / pair_sum).sum(axis=-1) + prior / strength
+        strength = total_wins / denominator
+        # Normalize to a geometric mean of 1 to keep the scale fixed
+        strength = strength / np.exp(np.log(strength).mean(axis=-1, keepdims=True))
+
+    return _mask_unranked(np.log(strength), ranks)
+
+
+def _mask_unranked(scores: "np.ndarray", ranks: "np.ndarray") -> "np.ndarray":
+    """Set the score of candidates nobody ranked to NaN."""
+    present = ~np.all(np.isnan(ranks), axis=-2)
+    return np.where(present, scores, np.nan)
+
+
+_ENGINES = {
+    "average": average_scores,
+    "borda": borda_scores,
+    "copeland": copeland_scores,
+    "kemeny": kemeny_scores,
+    "bradley_terry": bradley_terry_scores,
+}
+
+
+def score(ranks: "np.ndarray", method: str = "borda") -> "np.ndarray":
+    """
+    Score candidates with the given aggregation method.
+
+    Args:
+        ranks: Position array of shape (..., reviewers, candidates)
+        method: One of AGGREGATION_METHODS
+
+    Returns:
+        Scores of shape (..., candidates), higher is better, NaN if unranked
+    """
+    _require_numpy()
+    if method not in _ENGINES:
+        raise ValueError(f"Unknown aggregation method: {method}")
+    return _ENGINES[method](np.asarray(ranks, dtype=float))
+
+
+def score_models(
+    stage2_results: List[Dict[str, Any]],
+    label_to_model: Dict[str, str],
+    method: str = "borda"
+) -> Dict[str, float]:
+    """
+    Score each model of a single council run.
+
+    Args:
+        stage2_results: Rankings from Stage 2
+        label_to_model: Mapping from anonymous labels to model names
+        method: One of AGGREGATION_METHODS
+
+    Returns:
+        Dict mapping model name to score (higher is better); unranked models omitted
+    """
+    ranks, models = build_rank_matrix(stage2_results, label_to_model)
+    scores = score(ranks, method)
+    return {
+        model: round(float(value), 4)
+        for model, value in zip(models, scores)
+        if not np.isnan(value)
+    }
+
+
+def runs_from_conversations(conversations: List[Dict[str, Any]]) -> List[Tuple[List[Dict[str, Any]], Dict[str, str]]]:
+    """
+    Extract (stage2_results, label_to_model) pairs from stored conversations.
+
+    Older messages without stored metadata get their label mapping rebuilt
+    from the Stage 1 order, which is how labels are assigned.
+
+    Args:
+        conversations: Full conversation dicts
+
+    Returns:
+        List of runs suitable for build_rank_tensor
+    """
+    runs = []
+    for conversation in conversations:
+        for message in conversation.get("messages", []):
+            if message.get("role") != "assistant" or not message.get("stage2"):
+                continue
+            label_to_model = (message.get("metadata") or {}).get("label_to_model")
+            if not label_to_model:
+                stage1 = message.get("stage1") or []
+                label_to_model = {
+                    f"Response {label}": result["model"]
+                    for label, result in zip(response_labels(len(stage1)), stage1)
+                }
+            runs.append((message["stage2"], label_to_model))
+    return runs
+
+
+def compare_models(
+    runs: List[Tuple[List[Dict[str, Any]], Dict[str, str]]],
+    method: str = "borda"
+) -> List[Dict[str, Any]]:
+    """
+    Re-score many stored council runs in one batch and compare models.
+
+    Args:
+        runs: List of (stage2_results, label_to_model) pairs
+        method: One of AGGREGATION_METHODS
+
+    Returns:
+        List of dicts with model, mean score, win rate and run count, best first
+    """
+    if not runs:
+        return []
+
+    ranks, models = build_rank_tensor(runs)
+    scores = score(ranks, method)
+    present = ~np.isnan(scores)
+
+    # A model "wins" a run when it has the top score in that run
+    best = np.nanmax(np.where(present, scores, -np.inf), axis=-1, keepdims=True)
+    wins = (scores == best) & present
+
+    run_counts = present.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_scores = np.nansum(np.where(present, scores, 0.0), axis=0) / run_counts
+        win_rates = wins.sum(axis=0) / run_counts
+
+    comparison = [
+        {
+            "model": model,
+            "mean_score": round(float(mean_scores[i]), 4),
+            "win_rate": round(float(win_rates[i]), 3),
+            "runs": int(run_counts[i]),
+        }
+        for i, model in enumerate(models)
+        if run_counts[i] > 0
+    ]
+    comparison.sort(key=lambda item: item["mean_score"], reverse=True)
+    return comparison
+
+
+if __name__ == "__main__":
+    import sys
+    from . import storage
+
+    method = sys.argv[1] if len(sys.argv) > 1 else "borda"
+    conversations = [
+        storage.get_conversation(item["id"], restore=False) for item in storage.list_conversations()
+    ]
+    for row in compare_models(runs_from_conversations(conversations), method):
+        print(f"{row['model']:40s} score={row['mean_score']:8.3f} win_rate={row['win_rate']:.3f} runs={row['runs']}")
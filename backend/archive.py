@@ -0,0 +1,336 @@
+"""Tiered archival of idle conversations into append-only segment files.
+
+Hot conversations are loose files in DATA_DIR, one per conversation. The
+archive job (scripts/archive_conversations.py) moves conversations whose
+file has not been written for ARCHIVE_AFTER_DAYS into segment files in
+ARCHIVE_DIR. It appends each stored blob, already compressed by storage,
+to the current segment. A new segment starts once the current one exceeds
+ARCHIVE_SEGMENT_MAX_BYTES. Segments are never rewritten.
+
+index.json maps each archived conversation to (segment, offset, length)
+plus the metadata the conversation list needs, so listing never touches
+the segments. A read maps the segment (mmap) and slices out one blob.
+Reading an archived conversation through storage restores it to a loose
+file and drops it from the index, so it goes back to the hot tier.
+
+Every record starts with a header (magic, id, length). If the index is
+lost, rebuild_index() recovers it by scanning the segments.
+
+The server and the archive job are separate processes. Each reloads
+index.json whenever its mtime changes. Every change to the index happens
+under an exclusive file lock (index.lock) and starts from a fresh read, so
+neither process writes a stale copy over the other's entries.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+from .config import DATA_DIR, ARCHIVE_DIR, ARCHIVE_AFTER_DAYS, ARCHIVE_SEGMENT_MAX_BYTES
+from .serialization import dumps, loads
+from .compression import unpack
+from .tracing import span
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking
+    fcntl = None
+
+_MAGIC = b"LCA1"
+_HEADER = struct.Struct(">4sHI")  # magic, id length, blob length
+_INDEX_PATH = os.path.join(ARCHIVE_DIR, "index.json")
+_LOCK_PATH = os.path.join(ARCHIVE_DIR, "index.lock")
+
+_lock = threading.RLock()
+_index: Optional[Dict[str, Dict[str, Any]]] = None
+# (mtime_ns, size) of the index.json _index was read from (None: no file)
+_index_stamp: Optional[Tuple[int, int]] = None
+# Segment number -> read-only mapping of it (remapped when the file has grown)
+_maps: Dict[int, mmap.mmap] = {}
+
+
+def _segment_path(segment: int) -> str:
+    return os.path.join(ARCHIVE_DIR, f"segment-{segment:06d}.seg")
+
+
+def _segments() -> List[int]:
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    return sorted(
+        int(name[len("segment-"):-len(".seg")])
+        for name in os.listdir(ARCHIVE_DIR)
+        if name.startswith("segment-") and name.endswith(".seg")
+    )
+
+
+def _stamp() -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(_INDEX_PATH)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _load_index(force: bool = False) -> Dict[str, Dict[str, Any]]:
+    """The index, re-read when index.json changed (e.g. written by the archive job)."""
+    global _index, _index_stamp
+    stamp = _stamp()
+    if _index is None or force or stamp != _index_stamp:
+        try:
+            with open(_INDEX_PATH, 'rb') as f:
+                _index = loads(f.read())
+        except FileNotFoundError:
+            _index = {}
+        _index_stamp = stamp
+    return _index
+
+
+def _save_index():
+    global _index_stamp
+    Path(ARCHIVE_DIR).mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{_INDEX_PATH}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(dumps(_index))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, _INDEX_PATH)
+    _index_stamp = _stamp()
+
+
+@contextmanager
+def _locked_index():
+    """Exclusive cross-process lock on the index, yielding a freshly read copy to change."""
+    Path(ARCHIVE_DIR).mkdir(parents=True, exist_ok=True)
+    with _lock, open(_LOCK_PATH, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield _load_index(force=True)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _view(segment: int, end: int) -> mmap.mmap:
+    """Mapping of a segment covering at least [0, end)."""
+    mapped = _maps.get(segment)
+    if mapped is None or len(mapped) < end:
+        if mapped is not None:
+            mapped.close()
+        with open(_segment_path(segment), 'rb') as f:
+            mapped = _maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return mapped
+
+
+def is_archived(conversation_id: str) -> bool:
+    """Whether a conversation is in the archive."""
+    with _lock:
+        return conversation_id in _load_index()
+
+
+def read(conversation_id: str) -> Optional[bytes]:
+    """
+    Read an archived conversation's stored blob without restoring it.
+
+    Args:
+        conversation_id: Conversation identifier
+
+    Returns:
+        The blob as storage wrote it (storage.unpack it), or None if not archived
+    """
+    with _lock:
+        entry = _load_index().get(conversation_id)
+        if entry is None:
+            return None
+        with span("archive.read", segment=entry["segment"], bytes=entry["length"]):
+            end = entry["offset"] + entry["length"]
+            return bytes(_view(entry["segment"], end)[entry["offset"]:end])
+
+
+def restore(conversation_id: str) -> bool:
+    """
+    Move an archived conversation back to a loose file in DATA_DIR.
+
+    Args:
+        conversation_id: Conversation identifier
+
+    Returns:
+        True if it was archived and has been restored
+    """
+    with _locked_index():
+        blob = read(conversation_id)
+        if blob is None:
+            return False
+        path = os.path.join(DATA_DIR, f"{conversation_id}.json")
+        Path(DATA_DIR).mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp_path, path)
+        # The segment keeps the bytes (append-only); only the index forgets them
+        del _index[conversation_id]
+        _save_index()
+        return True
+
+
+def list_archived() -> List[Dict[str, Any]]:
+    """Metadata of archived conversations, as storage.list_conversations returns it."""
+    with _lock:
+        return [
+            {
+                "id": conversation_id,
+                "created_at": entry["created_at"],
+                "title": entry["title"],
+                "message_count": entry["message_count"],
+            }
+            for conversation_id, entry in _load_index().items()
+        ]
+
+
+def _open_segment() -> Tuple[int, Any]:
+    """The segment to append to (a new one once the last is full)."""
+    Path(ARCHIVE_DIR).mkdir(parents=True, exist_ok=True)
+    segments = _segments()
+    segment = segments[-1] if segments else 1
+    if segments and os.path.getsize(_segment_path(segment)) >= ARCHIVE_SEGMENT_MAX_BYTES:
+        segment += 1
+    return segment, open(_segment_path(segment), 'ab')
+
+
+def archive_idle(max_age_days: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Move conversations not written for max_age_days into segment files.
+
+    Args:
+        max_age_days: Idle time before archival (defaults to ARCHIVE_AFTER_DAYS)
+
+    Returns:
+        Dict with 'archived' (count), 'loose_bytes' (disk space the loose
+        files used) and 'archived_bytes' (bytes appended to segments)
+    """
+    days = ARCHIVE_AFTER_DAYS if max_age_days is None else max_age_days
+    cutoff = time.time() - days * 86400
+    if not os.path.isdir(DATA_DIR):
+        return {"archived": 0, "loose_bytes": 0, "archived_bytes": 0}
+
+    with _locked_index() as index, span("archive.run", max_age_days=days) as run_span:
+        moved: List[Tuple[str, str, os.stat_result]] = []
+        loose_bytes = archived_bytes = 0
+        segment, out = _open_segment()
+        try:
+            for filename in sorted(os.listdir(DATA_DIR)):
+                if not filename.endswith('.json'):
+                    continue
+                path = os.path.join(DATA_DIR, filename)
+                before = os.stat(path)
+                if before.st_mtime > cutoff:
+                    continue
+                with open(path, 'rb') as f:
+                    blob = f.read()
+                conversation = loads(unpack(blob))
+                conversation_id = conversation["id"]
+                key = conversation_id.encode()
+
+                if out.tell() >= ARCHIVE_SEGMENT_MAX_BYTES:
+                    out.close()
+                    segment, out = _open_segment()
+                out.write(_HEADER.pack(_MAGIC, len(key), len(blob)) + key)
+                offset = out.tell()
+                out.write(blob)
+
+                index[conversation_id] = {
+                    "segment": segment,
+                    "offset": offset,
+                    "length": len(blob),
+                    "title": conversation.get("title", "New Conversation"),
+                    "created_at": conversation["created_at"],
+                    "message_count": len(conversation["messages"]),
+                    "archived_at": time.time(),
+                }
+                moved.append((conversation_id, path, before))
+                loose_bytes += getattr(before, "st_blocks", 0) * 512 or before.st_size
+                archived_bytes += _HEADER.size + len(key) + len(blob)
+            out.flush()
+            os.fsync(out.fileno())
+        finally:
+            out.close()
+
+        if moved:
+            # Index first, then delete: a crash in between leaves a conversation
+            # in both tiers (the loose file wins), never in neither
+            _save_index()
+            for conversation_id, path, before in moved:
+                after = os.stat(path)
+                if (after.st_mtime_ns, after.st_size) != (before.st_mtime_ns, before.st_size):
+                    # Written while being archived: keep it hot
+                    del index[conversation_id]
+                    continue
+                os.remove(path)
+            _save_index()
+
+        archived = sum(1 for conversation_id, _, _ in moved if conversation_id in index)
+        run_span.set_attributes(archived=archived, archived_bytes=archived_bytes)
+        return {"archived": archived, "loose_bytes": loose_bytes, "archived_bytes": archived_bytes}
+
+
+def rebuild_index() -> int:
+    """
+    Recreate index.json by scanning every segment (later records win).
+
+    Conversations that also exist as loose files are left out: the loose
+    file is the current copy.
+
+    Returns:
+        Number of archived conversations indexed
+    """
+    global _index
+    with _locked_index():
+        index: Dict[str, Dict[str, Any]] = {}
+        for segment in _segments():
+            with open(_segment_path(segment), 'rb') as f:
+                data = f.read()
+            position = 0
+            while position + _HEADER.size <= len(data):
+                magic, key_length, length = _HEADER.unpack_from(data, position)
+                if magic != _MAGIC:
+                    print(f"Archive segment {segment} is corrupt at byte {position}; skipping the rest")
+                    break
+                start = position + _HEADER.size
+                conversation_id = data[start:start + key_length].decode()
+                offset = start + key_length
+                conversation = loads(unpack(data[offset:offset + length]))
+                index[conversation_id] = {
+                    "segment": segment,
+                    "offset": offset,
+                    "length": length,
+                    "title": conversation.get("title", "New Conversation"),
+                    "created_at": conversation["created_at"],
+                    "message_count": len(conversation["messages"]),
+                    "archived_at": None,
+                }
+                position = offset + length
+
+        _index = {
+            conversation_id: entry for conversation_id, entry in index.items()
+            if not os.path.exists(os.path.join(DATA_DIR, f"{conversation_id}.json"))
+        }
+        _save_index()
+        return len(_index)
+
+
+def archive_stats() -> Dict[str, Any]:
+    """Archived conversations, segment bytes and how much of them is still live."""
+    with _lock:
+        index = _load_index()
+        segment_bytes = sum(os.path.getsize(_segment_path(segment)) for segment in _segments())
+        return {
+            "archived": len(index),
+            "segments": len(_segments()),
+            "segment_bytes": segment_bytes,
+            "live_bytes": sum(entry["length"] for entry in index.values()),
+        }
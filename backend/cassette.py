@@ -0,0 +1,154 @@
+"""Record/replay of OpenRouter traffic.
+
+In "record" mode every upstream call made by query_model is appended to a
+gzip-compressed JSON-lines cassette: the request (without credentials), the
+response (or failure) and how long it took. In "replay" mode query_model
+serves responses from the cassette instead of the network, optionally
+sleeping for the recorded latency, so benchmarks and profiling runs see
+production-shaped timings on a machine with no network access.
+
+Interactions are keyed by a hash of the request payload. Identical requests
+recorded several times are replayed in recorded order (the last one repeats).
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from .serialization import dumps, loads
+from .config import CASSETTE_MODE, CASSETTE_PATH, CASSETTE_REPLAY_LATENCY, CASSETTE_REPLAY_SPEED
+
+
+def payload_key(payload: Dict[str, Any]) -> str:
+    """Stable hash of an upstream request payload."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+class Cassette:
+    """A recorded set of upstream interactions."""
+
+    def __init__(
+        self,
+        path: str = CASSETTE_PATH,
+        mode: str = CASSETTE_MODE,
+        replay_latency: bool = CASSETTE_REPLAY_LATENCY,
+        speed: float = CASSETTE_REPLAY_SPEED
+    ):
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self.speed = speed
+        self._interactions: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._cursor: Dict[str, int] = defaultdict(int)
+        if mode == "replay":
+            self.load()
+
+    def load(self):
+        """Read every interaction on the cassette into memory."""
+        self._interactions.clear()
+        self._cursor.clear()
+        for interaction in self.interactions():
+            self._interactions[interaction["key"]].append(interaction)
+
+    def interactions(self):
+        """Iterate over recorded interactions in recording order."""
+        if not os.path.exists(self.path):
+            return
+        # Every record() call appends one gzip member; gzip reads them as one stream
+        with gzip.open(self.path, 'rb') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield loads(line)
+
+    def record(
+        self,
+        payload: Dict[str, Any],
+        response: Optional[Dict[str, Any]],
+        latency: float,
+        error: Optional[str] = None
+    ):
+        """
+        Append one upstream interaction to the cassette.
+
+        Args:
+            payload: Request payload sent to OpenRouter (no credentials)
+            response: Parsed response dict, or None if the call failed
+            latency: Wall time of the call in seconds
+            error: Failure description, if any
+        """
+        interaction = {
+            "key": payload_key(payload),
+            "model": payload.get("model"),
+            "request": payload,
+            "response": response,
+            "error": error,
+            "latency": round(latency, 4),
+            "recorded_at": time.time(),
+        }
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(self.path, 'ab') as f:
+            f.write(dumps(interaction) + b"\n")
+        self._interactions[interaction["key"]].append(interaction)
+
+    async def replay(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Serve a recorded response for a request payload.
+
+        Args:
+            payload: Request payload that would be sent to OpenRouter
+
+        Returns:
+            Recorded response dict, or None if the call failed when recorded
+            or was never recorded
+        """
+        key = payload_key(payload)
+        recorded = self._interactions.get(key)
+        if not recorded:
+            print(f"Cassette miss for {payload.get('model')} ({key})")
+            return None
+
+        index = min(self._cursor[key], len(recorded) - 1)
+        self._cursor[key] += 1
+        interaction = recorded[index]
+
+        if self.replay_latency and self.speed > 0:
+            await asyncio.sleep(interaction["latency"] / self.speed)
+        return interaction["response"]
+
+
+_cassette: Optional[Cassette] = None
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Get the process-wide cassette, or None when record/replay is off."""
+    global _cassette
+    if CASSETTE_MODE not in ("record", "replay"):
+        return None
+    if _cassette is None:
+        _cassette = Cassette()
+    return _cassette
+
+
+if __name__ == "__main__":
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else CASSETTE_PATH
+    latencies = defaultdict(list)
+    failures = defaultdict(int)
+    for interaction in Cassette(path, mode="off").interactions():
+        latencies[interaction["model"]].append(interaction["latency"])
+        if interaction["response"] is None:
+            failures[interaction["model"]] += 1
+
+    print(f"{'model':40} {'calls':>6} {'failed':>6} {'mean s':>8} {'max s':>8}")
+    for model, values in sorted(latencies.items()):
+        print(f"{model:40} {len(values):6d} {failures[model]:6d} "
+              f"{sum(values) / len(values):8.2f} {max(values):8.2f}")
@@ -0,0 +1,259 @@
+"""Transparent compression of stored conversation bodies.
+
+Stored files start with a small header so the format can evolve and old
+files stay readable:
+
+    b"LLMC" | format version (1 byte) | codec (1 byte) | dictionary id (4 bytes) | payload
+
+Files without the header are plain JSON written by older versions. The zlib
+codec uses a preset dictionary of strings that appear in every stored
+council turn (JSON keys, labels, model names, prompt fragments), which
+helps a lot on short messages. With the optional zstandard package, a
+dictionary can also be trained on existing conversations
+(python -m backend.compression train) and is then used for new writes.
+"""
+
+import gzip
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+from .config import STORAGE_COMPRESSION, COMPRESSION_DICT_DIR
+
+MAGIC = b"LLMC"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct(">4sBBI")
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+_CODECS = {"none": CODEC_NONE, "zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+
+
+def _builtin_dictionary() -> bytes:
+    """
+    Preset dictionary shared by every stored conversation.
+
+    zlib favours strings near the end of the dictionary, so the most common
+    fragments come last. Never change this in place: add a new dictionary
+    instead, since its id is recorded in every file written with it.
+    """
+    fragments = [
+        "The question asks about", "In summary,", "However,", "For example,",
+        "**Strengths:**", "**Weaknesses:**", "\\n\\n### ", "\\n\\n**", "\\n- ",
+        "provides a clear", "is accurate but", "lacks depth on", "the most comprehensive",
+        "Response A provides good detail", "Response B is accurate", "Response C offers",
+        "FINAL RANKING:\\n1. Response A\\n2. Response B\\n3. Response C\\n4. Response D",
+        "anthropic/claude-opus-4.5", "anthropic/claude-sonnet-4.5", "openai/gpt-5.2",
+        "openai/gpt-5.1", "x-ai/grok-4", "google/gemini-2.5-pro", "google/gemini-3-pro-preview",
+        '"created_at":"', '"title":"', '"messages":[', '"version":',
+        '"average_rank":', '"rankings_count":', '"council_models":["',
+        '"metadata":{"label_to_model":{"Response A":"', '"aggregate_rankings":[{"model":"',
+        '"parsed_ranking":["Response A","Response B","Response C","Response D"]',
+        '"parse_method":"numbered"', '","ranking":"', '"stage3":{"model":"',
+        '"stage2":[{"model":"', '{"role":"user","content":"',
+        '{"role":"assistant","stage1":[{"model":"', '","response":"', '"},{"model":"',
+    ]
+    return "".join(fragments).encode("utf-8")
+
+
+BUILTIN_DICTIONARY = _builtin_dictionary()
+
+
+def dictionary_id(dictionary: bytes) -> int:
+    """Stable identifier of a dictionary (0 means no dictionary)."""
+    return zlib.crc32(dictionary) or 1
+
+
+_dictionaries: Optional[Dict[int, bytes]] = None
+_latest_trained_id: Optional[int] = None
+
+
+def _known_dictionaries() -> Dict[int, bytes]:
+    """Built-in dictionary plus any trained ones found in COMPRESSION_DICT_DIR."""
+    global _dictionaries, _latest_trained_id
+    if _dictionaries is None:
+        _dictionaries = {dictionary_id(BUILTIN_DICTIONARY): BUILTIN_DICTIONARY}
+        _latest_trained_id = None
+        if os.path.isdir(COMPRESSION_DICT_DIR):
+            for filename in sorted(os.listdir(COMPRESSION_DICT_DIR)):
+                if filename.endswith(".dict"):
+                    with open(os.path.join(COMPRESSION_DICT_DIR, filename), 'rb') as f:
+                        data = f.read()
+                    _latest_trained_id = dictionary_id(data)
+                    _dictionaries[_latest_trained_id] = data
+    return _dictionaries
+
+
+def _write_dictionary(codec: int) -> Tuple[int, bytes]:
+    """Dictionary used for new writes: the newest trained one for zstd, else built-in."""
+    dictionaries = _known_dictionaries()
+    if codec == CODEC_ZSTD and _latest_trained_id is not None:
+        return _latest_trained_id, dictionaries[_latest_trained_id]
+    return dictionary_id(BUILTIN_DICTIONARY), BUILTIN_DICTIONARY
+
+
+def pack(data: bytes, codec_name: str = None) -> bytes:
+    """
+    Compress a serialized body and prepend the format header.
+
+    Args:
+        data: Serialized (JSON) bytes
+        codec_name: "zlib", "zstd" or "none" (defaults to STORAGE_COMPRESSION);
+            zstd silently falls back to zlib when zstandard is not installed
+
+    Returns:
+        Bytes ready to be written to storage
+    """
+    codec = _CODECS[codec_name or STORAGE_COMPRESSION]
+    if codec == CODEC_ZSTD and not ZSTD_AVAILABLE:
+        codec = CODEC_ZLIB
+
+    if codec == CODEC_NONE:
+        return data
+
+    dict_id, dictionary = _write_dictionary(codec)
+    if codec == CODEC_ZSTD:
+        compressor = zstandard.ZstdCompressor(
+            level=6, dict_data=zstandard.ZstdCompressionDict(dictionary)
+        )
+        payload = compressor.compress(data)
+    else:
+        compressor = zlib.compressobj(level=6, zdict=dictionary)
+        payload = compressor.compress(data) + compressor.flush()
+
+    return _HEADER.pack(MAGIC, FORMAT_VERSION, codec, dict_id) + payload
+
+
+def unpack(data: bytes) -> bytes:
+    """
+    Decompress stored bytes; legacy plain JSON is returned unchanged.
+
+    Args:
+        data: Bytes as read from storage
+
+    Returns:
+        Serialized (JSON) bytes
+    """
+    if not data.startswith(MAGIC):
+        return data
+
+    _, version, codec, dict_id = _HEADER.unpack_from(data)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported storage format version {version}")
+    payload = data[_HEADER.size:]
+    dictionary = _known_dictionaries().get(dict_id) if dict_id else b""
+    if dictionary is None:
+        raise ValueError(f"Unknown compression dictionary {dict_id:#010x}")
+
+    if codec == CODEC_ZLIB:
+        decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        return decompressor.decompress(payload) + decompressor.flush()
+    if codec == CODEC_ZSTD:
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("zstandard is required to read this file (pip install zstandard)")
+        params = {"dict_data": zstandard.ZstdCompressionDict(dictionary)} if dictionary else {}
+        return zstandard.ZstdDecompressor(**params).decompress(payload)
+    if codec == CODEC_NONE:
+        return payload
+    raise ValueError(f"Unknown compression codec {codec}")
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick a response Content-Encoding from an Accept-Encoding header.
+
+    Args:
+        accept_encoding: Raw Accept-Encoding header value
+
+    Returns:
+        "br" (if brotli is installed), "gzip", or None for identity
+    """
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+
+    if BROTLI_AVAILABLE and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def encode_body(body: bytes, encoding: str) -> bytes:
+    """
+    Compress a response body with a negotiated Content-Encoding.
+
+    Args:
+        body: Response bytes
+        encoding: "br" or "gzip"
+
+    Returns:
+        Compressed bytes
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def train_dictionary(data_dir: str, size: int = 64 * 1024) -> Optional[str]:
+    """
+    Train a zstd dictionary on the stored conversations.
+
+    Args:
+        data_dir: Directory with stored conversation files
+        size: Target dictionary size in bytes
+
+    Returns:
+        Path of the written dictionary, or None if there was too little data
+    """
+    global _dictionaries
+    if not ZSTD_AVAILABLE:
+        raise RuntimeError("zstandard is required to train a dictionary (pip install zstandard)")
+
+    samples = []
+    for filename in os.listdir(data_dir):
+        if filename.endswith('.json'):
+            with open(os.path.join(data_dir, filename), 'rb') as f:
+                samples.append(unpack(f.read()))
+    if len(samples) < 10:
+        return None
+
+    trained = zstandard.train_dictionary(size, samples).as_bytes()
+    Path(COMPRESSION_DICT_DIR).mkdir(parents=True, exist_ok=True)
+    path = os.path.join(COMPRESSION_DICT_DIR, f"{len(os.listdir(COMPRESSION_DICT_DIR)):04d}.dict")
+    with open(path, 'wb') as f:
+        f.write(trained)
+    _dictionaries = None
+    return path
+
+
+if __name__ == "__main__":
+    import sys
+    from .config import DATA_DIR
+
+    if sys.argv[1:] == ["train"]:
+        written = train_dictionary(DATA_DIR)
+        print(f"Wrote {written}" if written else "Not enough conversations to train a dictionary")
+    else:
+        print("Usage: python -m backend.compression train")
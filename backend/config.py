@@ -1,5 +1,6 @@
 """Configuration for the LLM Council."""
 
+import json
 import os
 from dotenv import load_dotenv
 
@@ -48,8 +49,238 @@ COUNCIL_MODELS = [
 # Default chairman model - synthesizes final response
 CHAIRMAN_MODEL = "google/gemini-3-pro-preview"
 
+# Chairmen tried in order when the chairman fails or runs out of time
+CHAIRMAN_FALLBACK_MODELS = [
+    "anthropic/claude-opus-4.5",
+    "openai/gpt-5.2",
+]
+
+# End-to-end budget for one council run; stage 3 gets whatever is left
+# (but at least CHAIRMAN_MIN_DEADLINE seconds)
+REQUEST_SLO_SECONDS = 180.0
+CHAIRMAN_MIN_DEADLINE = 20.0
+
+# Share of the remaining stage 3 time one chairman attempt may use, so a
+# hanging chairman leaves time for a fallback (the last candidate gets it all)
+CHAIRMAN_ATTEMPT_SHARE = 0.6
+
+# Race the first two chairmen and keep the first good synthesis
+CHAIRMAN_RACE = False
+
+# A stage 1/2 model call running longer than this is cancelled and counts as
+# failed, so one hanging model cannot hold up the council
+MODEL_NODE_TIMEOUT = 150.0
+
+# Admission control: concurrent councils, per-user in-flight limit (running
+# plus queued), priority lane weights and each lane's queue-time SLO
+ADMISSION_ENABLED = os.getenv("LLM_COUNCIL_ADMISSION", "1") == "1"
+ADMISSION_MAX_CONCURRENT = int(os.getenv("LLM_COUNCIL_MAX_CONCURRENT", "8"))
+ADMISSION_PER_USER_LIMIT = int(os.getenv("LLM_COUNCIL_PER_USER_LIMIT", "2"))
+ADMISSION_LANE_WEIGHTS = {"interactive": 4, "batch": 1}
+ADMISSION_QUEUE_SLO_SECONDS = {"interactive": 20.0, "batch": 300.0}
+# Expected council duration until real ones have been observed
+ADMISSION_INITIAL_SERVICE_SECONDS = 60.0
+
+# Load-aware degradation: pressure is the larger of queue pressure ((running +
+# queued councils) / ADMISSION_MAX_CONCURRENT) and latency pressure (EWMA of
+# stage 1 answer times / DEGRADATION_LATENCY_TARGET). Level n is entered once
+# pressure exceeds DEGRADATION_THRESHOLDS[n - 1] and left only when it falls
+# below DEGRADATION_RECOVERY times that. Each level caps the council size and
+# stage 2 sample size (0 skips stage 2) and may swap in a faster chairman.
+DEGRADATION_ENABLED = os.getenv("LLM_COUNCIL_DEGRADATION", "1") == "1"
+DEGRADATION_THRESHOLDS = [1.0, 1.5, 2.5]
+DEGRADATION_RECOVERY = 0.8
+DEGRADATION_LATENCY_TARGET = 30.0
+# Latency samples older than this no longer count (no traffic, no evidence)
+DEGRADATION_LATENCY_STALE_SECONDS = 300.0
+DEGRADATION_LEVELS = [
+    {"name": "full", "max_models": None, "review_sample_size": None, "chairman": None},
+    {"name": "reduced", "max_models": 3, "review_sample_size": 2, "chairman": None},
+    {"name": "lean", "max_models": 2, "review_sample_size": 0, "chairman": "google/gemini-2.5-flash"},
+    {"name": "minimal", "max_models": 1, "review_sample_size": 0, "chairman": "google/gemini-2.5-flash"},
+]
+
+# Full-text search over past conversations (SQLite FTS5, updated on append);
+# SEARCH_INDEX_STAGE1 also indexes every council member's individual answer
+SEARCH_ENABLED = os.getenv("LLM_COUNCIL_SEARCH", "1") == "1"
+SEARCH_INDEX_PATH = "data/search.db"
+SEARCH_INDEX_STAGE1 = True
+
+# Conversation titles: an extractive title is set instantly from the first
+# message; when refinement is on, a model-written title replaces it later.
+# Pending refinements are batched into one TITLE_MODEL call per window.
+TITLE_MODEL = "google/gemini-2.5-flash"
+TITLE_REFINEMENT_ENABLED = os.getenv("LLM_COUNCIL_TITLE_REFINEMENT", "1") == "1"
+TITLE_BATCH_WINDOW = 2.0
+TITLE_BATCH_MAX = 20
+
+# Generation limits per stage (overridable per request): max output tokens,
+# reasoning effort ("minimal".."high") or a reasoning token budget, whether
+# reasoning_details are returned, and stop sequences. None means no limit.
+# Stage 2 reviewers think at low effort, but their output is not capped: the
+# FINAL RANKING block comes last, so a cut would lose exactly what is parsed.
+GENERATION_PROFILES = {
+    "stage1": {"max_tokens": None, "reasoning_effort": None, "include_reasoning": True},
+    "stage2": {"max_tokens": None, "reasoning_effort": "low", "include_reasoning": False},
+    "stage3": {"max_tokens": None, "reasoning_effort": "medium", "include_reasoning": False},
+    "title": {"max_tokens": 400, "reasoning_effort": "minimal", "include_reasoning": False},
+    "retrieval": {"max_tokens": 200, "reasoning_effort": None, "include_reasoning": False},
+}
+
+# Share of council runs whose default-profile stages run uncapped instead, so
+# /api/stats/generation has a baseline to measure each profile's savings against
+GENERATION_BASELINE_SAMPLE_RATE = float(os.getenv("LLM_COUNCIL_BASELINE_SAMPLE_RATE", "0.02"))
+
+# Near-identical stage 1 answers (word shingle Jaccard >= DEDUPE_THRESHOLD)
+# are reviewed and shown to the chairman once, as one cluster
+DEDUPE_ENABLED = os.getenv("LLM_COUNCIL_DEDUPE", "1") == "1"
+DEDUPE_THRESHOLD = 0.8
+DEDUPE_SHINGLE_SIZE = 3
+
+# Shared web retrieval for stage 1: one search per query (cached by normalized
+# query for RETRIEVAL_CACHE_TTL seconds) whose sources are put in every council
+# member's prompt. Backends: "openrouter" (OpenRouter web plugin, one call on
+# RETRIEVAL_MODEL), "local" (word-overlap search of the JSON documents at
+# RETRIEVAL_LOCAL_PATH, for tests and offline runs) or "none".
+RETRIEVAL_BACKEND = os.getenv("LLM_COUNCIL_RETRIEVAL", "none")
+RETRIEVAL_MODEL = "openai/gpt-4o-mini"
+RETRIEVAL_MAX_RESULTS = 5
+RETRIEVAL_SNIPPET_CHARS = 400
+RETRIEVAL_TIMEOUT = 20.0
+RETRIEVAL_CACHE_TTL = 3600
+RETRIEVAL_CACHE_MAX_ENTRIES = 256
+RETRIEVAL_LOCAL_PATH = os.getenv("LLM_COUNCIL_RETRIEVAL_LOCAL_PATH", "data/retrieval_corpus.json")
+
+# Stage 2 ranking mode: "text" (FINAL RANKING list parsed from free text) or
+# "structured" (JSON output via OpenRouter response_format)
+RANKING_MODE = "text"
+
+# Criteria each response is scored on in structured ranking mode
+RANKING_CRITERIA = ["accuracy", "insight", "clarity"]
+
+# Stage 2 aggregation method: "average" (mean position, no extra dependencies),
+# or one of "borda", "copeland", "kemeny", "bradley_terry" (requires numpy)
+AGGREGATION_METHOD = "average"
+
 # OpenRouter API endpoint
 OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
 
+# OpenAI-compatible chat completion endpoints. api_key_env names the variable
+# holding the key; providers without one configured are skipped unless
+# key_optional (e.g. a self-hosted vLLM / llama.cpp / Ollama server).
+# reasoning is how the endpoint takes reasoning limits: OpenRouter's
+# "reasoning" object (openrouter), a top-level reasoning_effort (effort), or
+# not at all (unset: the limits are dropped).
+PROVIDERS = {
+    "openrouter": {"url": OPENROUTER_API_URL, "api_key_env": "OPENROUTER_API_KEY", "reasoning": "openrouter"},
+    "openai": {"url": "https://api.openai.com/v1/chat/completions", "api_key_env": "OPENAI_API_KEY",
+               "reasoning": "effort"},
+    "xai": {"url": "https://api.x.ai/v1/chat/completions", "api_key_env": "XAI_API_KEY", "reasoning": "effort"},
+    "local": {
+        "url": os.getenv("LOCAL_LLM_URL", "http://localhost:8080/v1/chat/completions"),
+        "api_key_env": "LOCAL_LLM_API_KEY",
+        "key_optional": True,
+    },
+}
+
+# Council model -> [(provider, model id at that provider)], in order of
+# preference until live latencies are known. Unlisted models use OpenRouter.
+# A self-hosted model joins the council as e.g.
+# "local/llama-3.3-70b": [("local", "llama-3.3-70b")]
+MODEL_ROUTES = {
+    "openai/gpt-5.2": [("openrouter", "openai/gpt-5.2"), ("openai", "gpt-5.2")],
+    "openai/gpt-4.1": [("openrouter", "openai/gpt-4.1"), ("openai", "gpt-4.1")],
+    "x-ai/grok-4": [("openrouter", "x-ai/grok-4"), ("xai", "grok-4")],
+    # Extra routes as JSON, e.g. {"local/llama-3.3-70b": [["local", "llama-3.3-70b"]]}
+    **json.loads(os.getenv("LLM_COUNCIL_MODEL_ROUTES", "{}")),
+}
+
+# Route selection: latency assumed for untried routes, how much the error
+# rate EWMA inflates a route's cost, consecutive failures that bench a route
+# (for PROVIDER_COOLDOWN_SECONDS), and how often the runner-up is tried first
+PROVIDER_DEFAULT_LATENCY = 10.0
+PROVIDER_ERROR_PENALTY = 4.0
+PROVIDER_FAILURE_THRESHOLD = 3
+PROVIDER_COOLDOWN_SECONDS = 30.0
+PROVIDER_EXPLORE_RATE = 0.05
+
 # Data directory for conversation storage
 DATA_DIR = "data/conversations"
+
+# Cold tier: conversations not written for ARCHIVE_AFTER_DAYS are moved by
+# scripts/archive_conversations.py into append-only segment files (restored
+# to DATA_DIR when next read)
+ARCHIVE_DIR = "data/archive"
+ARCHIVE_AFTER_DAYS = float(os.getenv("LLM_COUNCIL_ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+
+# Compression of stored conversation files: "zlib" (stdlib, preset dictionary),
+# "zstd" (requires zstandard, can use trained dictionaries) or "none".
+# Files written with any setting, and legacy plain JSON files, stay readable.
+STORAGE_COMPRESSION = "zlib"
+COMPRESSION_DICT_DIR = "data/dictionaries"
+
+# Conversation GET responses at least this large are gzip/br encoded when accepted
+RESPONSE_COMPRESSION_MIN_SIZE = 1024
+
+# Counter bumped on every conversation write; backs the conversation list ETag
+LIST_VERSION_PATH = "data/conversations.version"
+
+# Persistent per-model latency / failure / rank statistics
+STATS_PATH = "data/model_stats.json"
+
+# Number of recent latency samples kept per model for percentile estimates
+STATS_LATENCY_WINDOW = 200
+
+# Statistics are kept in memory and written at most this often (and at shutdown)
+STATS_FLUSH_INTERVAL = 5.0
+
+# "Fast council" selection: models whose p90 latency exceeds the SLO are dropped
+FAST_COUNCIL_LATENCY_SLO = 45.0
+FAST_COUNCIL_MIN_MODELS = 2
+FAST_COUNCIL_MAX_MODELS = None
+FAST_COUNCIL_MAX_FAILURE_RATE = 0.5
+# Models that rarely win are dropped too: relative peer rank is 0 for always
+# best and 1 for always worst, judged once a model has this many ranked runs
+FAST_COUNCIL_MAX_RELATIVE_RANK = 0.75
+FAST_COUNCIL_MIN_RANKED_RUNS = 5
+
+# Semantic near-duplicate cache in front of the full council (skips all stages on a hit)
+SEMANTIC_CACHE_ENABLED = False
+SEMANTIC_CACHE_PATH = "data/semantic_cache.jsonl"
+SEMANTIC_CACHE_THRESHOLD = 0.85
+SEMANTIC_CACHE_MAX_ENTRIES = 500
+
+# Subsampled stage 2 peer review: each reviewer ranks this many stage 1 answers
+# (never its own, every answer reviewed equally often) instead of all of them,
+# which keeps stage 2 linear in council size. None reviews every answer.
+REVIEW_SAMPLE_SIZE = None
+
+# Record/replay of OpenRouter traffic: "off", "record" (append every call to the
+# cassette) or "replay" (serve calls from the cassette, no network)
+CASSETTE_MODE = os.getenv("LLM_COUNCIL_CASSETTE", "off")
+CASSETTE_PATH = os.getenv("LLM_COUNCIL_CASSETTE_PATH", "data/cassettes/openrouter.jsonl.gz")
+# In replay, sleep for each call's recorded latency (divided by the speed factor)
+CASSETTE_REPLAY_LATENCY = os.getenv("LLM_COUNCIL_CASSETTE_LATENCY", "1") == "1"
+CASSETTE_REPLAY_SPEED = float(os.getenv("LLM_COUNCIL_CASSETTE_SPEED", "1.0"))
+
+# Span-based tracing of council runs (one trace per run, spans per stage,
+# model call and storage operation)
+TRACING_ENABLED = os.getenv("LLM_COUNCIL_TRACING", "0") == "1"
+TRACING_SAMPLE_RATE = float(os.getenv("LLM_COUNCIL_TRACING_SAMPLE_RATE", "0.1"))
+# When set, every trace is recorded and those slower than this are always exported
+TRACING_SLOW_TRACE_SECONDS = None
+# "json" (JSON-lines file at TRACING_PATH) or "otlp" (OTLP/HTTP JSON to TRACING_OTLP_ENDPOINT)
+TRACING_EXPORTER = os.getenv("LLM_COUNCIL_TRACING_EXPORTER", "json")
+TRACING_PATH = "data/traces.jsonl"
+TRACING_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT", "http://localhost:4318/v1/traces")
+
+# Opt-in profiling: sampled CPU stacks and asyncio task dumps of council
+# requests, keeping the last PROFILING_RING_SIZE slower than PROFILING_SLOW_SECONDS
+PROFILING_ENABLED = os.getenv("LLM_COUNCIL_PROFILING", "0") == "1"
+PROFILING_SLOW_SECONDS = float(os.getenv("LLM_COUNCIL_PROFILING_SLOW_SECONDS", "30"))
+PROFILING_SAMPLE_INTERVAL = 0.01
+PROFILING_RING_SIZE = 20
+
+# Token required by the /api/admin endpoints (X-Admin-Token header); unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
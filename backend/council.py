@@ -1,58 +1,125 @@
 """3-stage LLM Council orchestration."""
 
-from typing import List, Dict, Any, Tuple
-from .openrouter import query_models_parallel, query_model
-from .config import COUNCIL_MODELS, CHAIRMAN_MODEL
-
-
-async def stage1_collect_responses(user_query: str, models: List[str] = None) -> List[Dict[str, Any]]:
+import asyncio
+import json
+import re
+import time
+from typing import Callable, List, Dict, Any, Tuple, Optional
+from .openrouter import query_model, query_model_coalesced
+from .config import (
+    COUNCIL_MODELS,
+    CHAIRMAN_MODEL,
+    CHAIRMAN_FALLBACK_MODELS,
+    CHAIRMAN_RACE,
+    CHAIRMAN_MIN_DEADLINE,
+    CHAIRMAN_ATTEMPT_SHARE,
+    MODEL_NODE_TIMEOUT,
+    REQUEST_SLO_SECONDS,
+    RANKING_MODE,
+    RANKING_CRITERIA,
+    AGGREGATION_METHOD,
+    REVIEW_SAMPLE_SIZE,
+    SEMANTIC_CACHE_ENABLED,
+    RETRIEVAL_TIMEOUT,
+)
+from .aggregation import response_labels
+from .review import resolve_sample_size, assign_reviews, review_coverage, scaled_position, subset_responses_text
+from .tracing import span, start_trace
+from .dag import Graph, EventCallback
+from . import stats, semantic_cache, generation, dedupe, retrieval, degradation
+
+# Single-pass ranking parser: every "Response X" mention, flagged when it is
+# part of a numbered list item ("1. Response X")
+_RANKING_LABEL_RE = re.compile(r'(?P<numbered>\d+\.\s*)?(?P<label>Response [A-Z]+)\b')
+
+# Stage 2 ranking modes (see RANKING_MODE)
+RANKING_MODES = ("text", "structured")
+
+# Strips a ```json ... ``` fence some models wrap structured output in
+_JSON_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*(.*?)\s*```\s*$', re.DOTALL)
+
+# JSON schema for structured-output ranking mode (OpenRouter response_format)
+RANKING_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "council_ranking",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "evaluations": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "label": {"type": "string"},
+                            "critique": {"type": "string"},
+                            **{
+                                criterion: {"type": "integer", "minimum": 1, "maximum": 10}
+                                for criterion in RANKING_CRITERIA
+                            },
+                        },
+                        "required": ["label", "critique", *RANKING_CRITERIA],
+                        "additionalProperties": False,
+                    },
+                },
+                "final_ranking": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                },
+            },
+            "required": ["evaluations", "final_ranking"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+def resolve_council_models(council_models: List[str] = None, fast_council: bool = False) -> List[str]:
     """
-    Stage 1: Collect individual responses from all council models.
+    Determine which models sit on the council for a request.
 
     Args:
-        user_query: The user's question
-        models: Optional list of models to use (defaults to COUNCIL_MODELS)
+        council_models: Optional list of requested models (defaults to COUNCIL_MODELS)
+        fast_council: Whether to drop models that historically miss the latency SLO
 
     Returns:
-        List of dicts with 'model' and 'response' keys
+        List of council models to query
     """
-    models_to_use = models if models else COUNCIL_MODELS
-    messages = [{"role": "user", "content": user_query}]
-
-    # Query all models in parallel
-    responses = await query_models_parallel(models_to_use, messages)
-
-    # Format results
-    stage1_results = []
-    for model, response in responses.items():
-        if response is not None:  # Only include successful responses
-            stage1_results.append({
-                "model": model,
-                "response": response.get('content', '')
-            })
-
-    return stage1_results
+    models = council_models if council_models else COUNCIL_MODELS
+    if fast_council:
+        models = stats.select_fast_council(models)
+    return models
 
 
-async def stage2_collect_rankings(
+def plan_rankings(
     user_query: str,
     stage1_results: List[Dict[str, Any]],
-    models: List[str] = None
-) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+    models: List[str] = None,
+    ranking_mode: str = None,
+    review_sample_size: Optional[int] = None
+) -> Dict[str, Any]:
     """
-    Stage 2: Each model ranks the anonymized responses.
+    Prepare stage 2: anonymize the answers and build each reviewer's prompt.
 
     Args:
         user_query: The original user query
         stage1_results: Results from Stage 1
-        models: Optional list of models to use (defaults to COUNCIL_MODELS)
+        models: Optional list of reviewers (defaults to COUNCIL_MODELS)
+        ranking_mode: "text" or "structured" (defaults to RANKING_MODE)
+        review_sample_size: Answers each reviewer ranks (defaults to
+            REVIEW_SAMPLE_SIZE; None means all answers)
 
     Returns:
-        Tuple of (rankings list, label_to_model mapping)
+        Dict with 'label_to_model', 'requests' (reviewer -> messages),
+        'assigned_labels' (reviewer -> labels) and 'assignments' (reviewer ->
+        answer indices), both for subsampled review only, 'response_format'
+        and 'sample_size'
     """
     models_to_use = models if models else COUNCIL_MODELS
+    mode = ranking_mode if ranking_mode else RANKING_MODE
     # Create anonymized labels for responses (Response A, Response B, etc.)
-    labels = [chr(65 + i) for i in range(len(stage1_results))]  # A, B, C, ...
+    labels = response_labels(len(stage1_results))  # A, B, ..., Z, AA, AB, ...
 
     # Create mapping from label to model name
     label_to_model = {
@@ -60,13 +127,79 @@ async def stage2_collect_rankings(
         for label, result in zip(labels, stage1_results)
     }
 
-    # Build the ranking prompt
-    responses_text = "\n\n".join([
-        f"Response {label}:\n{result['response']}"
-        for label, result in zip(labels, stage1_results)
-    ])
+    sample_size = resolve_sample_size(review_sample_size, len(stage1_results))
+    requests = {}
+    assigned_labels = {}
+    assignments = {}
+    if sample_size is None:
+        # Full review: one shared prompt with every response
+        responses_text = "\n\n".join([
+            f"Response {label}:\n{result['response']}"
+            for label, result in zip(labels, stage1_results)
+        ])
+        messages = [{"role": "user", "content": build_ranking_prompt(user_query, responses_text, mode)}]
+        requests = {model: messages for model in models_to_use}
+    else:
+        # Subsampled review: each reviewer ranks its own balanced subset,
+        # keeping the run-wide labels so rankings can be combined
+        assignments = assign_reviews(
+            models_to_use, [result['model'] for result in stage1_results], sample_size
+        )
+        for model, indices in assignments.items():
+            responses_text = subset_responses_text(labels, stage1_results, indices)
+            requests[model] = [{"role": "user", "content": build_ranking_prompt(user_query, responses_text, mode)}]
+            assigned_labels[model] = [f"Response {labels[index]}" for index in indices]
+
+    return {
+        "label_to_model": label_to_model,
+        "requests": requests,
+        "assigned_labels": assigned_labels,
+        "assignments": assignments,
+        "response_format": RANKING_RESPONSE_FORMAT if mode == "structured" else None,
+        "sample_size": sample_size,
+    }
+
+
+def ranking_result(model: str, text: str, plan: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Parse one reviewer's stage 2 output against the labels it was shown.
+
+    Args:
+        model: Reviewer model
+        text: Its raw output
+        plan: Stage 2 plan from plan_rankings
+
+    Returns:
+        Stage 2 result dict (see build_stage2_result), plus 'assigned' labels
+        in subsampled review
+    """
+    label_to_model = plan["label_to_model"]
+    assigned = plan["assigned_labels"].get(model)
+    if assigned is None:
+        return build_stage2_result(model, text, label_to_model)
 
-    ranking_prompt = f"""You are evaluating different responses to the following question:
+    result = build_stage2_result(model, text, {label: label_to_model[label] for label in assigned})
+    result["parsed_ranking"] = [label for label in result["parsed_ranking"] if label in assigned]
+    result["assigned"] = assigned
+    return result
+
+
+def build_ranking_prompt(user_query: str, responses_text: str, mode: str = "text") -> str:
+    """
+    Build the stage 2 ranking prompt for a set of labeled responses.
+
+    Args:
+        user_query: The original user query
+        responses_text: The anonymized responses, one labeled block each
+        mode: "text" or "structured"
+
+    Returns:
+        Prompt text
+    """
+    if mode == "structured":
+        return build_structured_ranking_prompt(user_query, responses_text)
+
+    return f"""You are evaluating different responses to the following question:
 
 Question: {user_query}
 
@@ -97,55 +230,182 @@ FINAL RANKING:
 
 Now provide your evaluation and ranking:"""
 
-    messages = [{"role": "user", "content": ranking_prompt}]
 
-    # Get rankings from all council models in parallel
-    responses = await query_models_parallel(models_to_use, messages)
+def build_structured_ranking_prompt(user_query: str, responses_text: str) -> str:
+    """
+    Build the (shorter) ranking prompt used in structured-output mode.
+
+    Args:
+        user_query: The original user query
+        responses_text: The anonymized responses, one labeled block each
 
-    # Format results
-    stage2_results = []
-    for model, response in responses.items():
-        if response is not None:
-            full_text = response.get('content', '')
-            parsed = parse_ranking_from_text(full_text)
-            stage2_results.append({
-                "model": model,
-                "ranking": full_text,
-                "parsed_ranking": parsed
-            })
+    Returns:
+        Prompt text
+    """
+    criteria = ", ".join(RANKING_CRITERIA)
+    return f"""You are evaluating different responses to the following question:
 
-    return stage2_results, label_to_model
+Question: {user_query}
+
+Here are the responses from different models (anonymized):
+
+{responses_text}
+
+For each response, write a short critique and score it from 1 to 10 on: {criteria}.
+Then rank all responses from best to worst in "final_ranking", using their labels (e.g. "Response A").
+Reply with JSON only."""
+
+
+def build_stage2_result(model: str, text: str, label_to_model: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Turn a reviewer's raw reply into a stage 2 result.
+
+    Structured (JSON) replies are validated and rendered back into the
+    familiar critique + FINAL RANKING text; anything else goes through the
+    text parser.
+
+    Args:
+        model: Reviewer model identifier
+        text: Raw reply content
+        label_to_model: Mapping of valid labels for this run
+
+    Returns:
+        Dict with 'model', 'ranking', 'parsed_ranking', 'parse_method' and optional 'scores'
+    """
+    structured = parse_structured_ranking(text, label_to_model)
+    if structured is not None:
+        return {
+            "model": model,
+            "ranking": structured["text"],
+            "parsed_ranking": structured["ranking"],
+            "scores": structured["scores"],
+            "parse_method": "structured"
+        }
+
+    parsed, method = _parse_ranking(text)
+    return {
+        "model": model,
+        "ranking": text,
+        "parsed_ranking": parsed,
+        "parse_method": method
+    }
+
+
+def _normalize_label(label: Any) -> Optional[str]:
+    """Normalize "A" / "response a" / "Response A" to "Response A"."""
+    if not isinstance(label, str):
+        return None
+    label = label.strip()
+    if label.lower().startswith("response"):
+        label = label[len("response"):].strip()
+    return f"Response {label.upper()}" if label.isalpha() else None
+
+
+def parse_structured_ranking(text: str, label_to_model: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """
+    Parse and validate a structured-output ranking reply.
+
+    Args:
+        text: Raw reply content
+        label_to_model: Mapping of valid labels for this run
+
+    Returns:
+        Dict with 'ranking', 'scores' and rendered 'text', or None if the
+        reply is not valid structured output
+    """
+    fenced = _JSON_FENCE_RE.match(text)
+    if fenced:
+        text = fenced.group(1)
+    if not text.lstrip().startswith("{"):
+        return None
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("final_ranking"), list):
+        return None
+
+    ranking = []
+    for label in data["final_ranking"]:
+        label = _normalize_label(label)
+        if label in label_to_model and label not in ranking:
+            ranking.append(label)
+    if not ranking:
+        return None
+
+    scores = {}
+    critiques = []
+    for evaluation in data.get("evaluations") or []:
+        if not isinstance(evaluation, dict):
+            continue
+        label = _normalize_label(evaluation.get("label"))
+        if label not in label_to_model:
+            continue
+        scores[label] = {
+            criterion: evaluation[criterion]
+            for criterion in RANKING_CRITERIA
+            if isinstance(evaluation.get(criterion), (int, float))
+        }
+        critiques.append(f"{label}: {evaluation.get('critique', '')}".strip())
+
+    rendered = "\n\n".join(critiques)
+    rendered += "\n\nFINAL RANKING:\n" + "\n".join(
+        f"{position}. {label}" for position, label in enumerate(ranking, start=1)
+    )
+
+    return {"ranking": ranking, "scores": scores, "text": rendered.strip()}
 
 
 async def stage3_synthesize_final(
     user_query: str,
     stage1_results: List[Dict[str, Any]],
     stage2_results: List[Dict[str, Any]],
-    chairman_model: str = None
+    chairman_model: str = None,
+    deadline: Optional[float] = None,
+    race: Optional[bool] = None,
+    aggregate_rankings: Optional[List[Dict[str, Any]]] = None,
+    profile: Optional[Dict[str, Any]] = None,
+    answer_clusters: Optional[Dict[str, List[str]]] = None
 ) -> Dict[str, Any]:
     """
     Stage 3: Chairman synthesizes final response.
 
+    The chairman is followed by CHAIRMAN_FALLBACK_MODELS until one produces a
+    synthesis within the deadline. If none does, the top-ranked stage 1
+    answer is returned so every run ends with a usable answer.
+
     Args:
         user_query: The original user query
         stage1_results: Individual model responses from Stage 1
         stage2_results: Rankings from Stage 2
         chairman_model: Optional chairman model (defaults to CHAIRMAN_MODEL)
+        deadline: Seconds stage 3 may take in total (defaults to REQUEST_SLO_SECONDS)
+        race: Query the first two chairmen at once (defaults to CHAIRMAN_RACE)
+        aggregate_rankings: Stage 2 aggregate, used to pick the fallback answer
+        profile: Generation profile (defaults to the configured stage 3 profile)
+        answer_clusters: Representative model -> models with near-identical
+            answers; only the representative's answer is included
 
     Returns:
-        Dict with 'model' and 'response' keys
+        Dict with 'model' and 'response' keys, plus 'fallback_from' (chairmen
+        that failed) and 'fallback' ("top_ranked_stage1") when applicable
     """
     chairman = chairman_model if chairman_model else CHAIRMAN_MODEL
-    # Build comprehensive context for chairman
+    # Build comprehensive context for chairman (each cluster of
+    # near-identical answers once, under its representative)
+    answer_clusters = answer_clusters or {}
+    clustered = {model for members in answer_clusters.values() for model in members}
     stage1_text = "\n\n".join([
-        f"Model: {result['model']}\nResponse: {result['response']}"
+        f"Model: {result['model']}{_cluster_note(answer_clusters.get(result['model']))}\n"
+        f"Response: {result['response']}"
         for result in stage1_results
+        if result['model'] not in clustered
     ])
 
     stage2_text = "\n\n".join([
         f"Model: {result['model']}\nRanking: {result['ranking']}"
         for result in stage2_results
-    ])
+    ]) or "(No peer rankings this time.)"
 
     chairman_prompt = f"""You are the Chairman of an LLM Council. Multiple AI models have provided responses to a user's question, and then ranked each other's responses.
 
@@ -166,22 +426,139 @@ Provide a clear, well-reasoned final answer that represents the council's collec
 
     messages = [{"role": "user", "content": chairman_prompt}]
 
-    # Query the chairman model
-    response = await query_model(chairman, messages)
-
-    if response is None:
-        # Fallback if chairman fails
+    candidates = [chairman] + [model for model in CHAIRMAN_FALLBACK_MODELS if model != chairman]
+    race = CHAIRMAN_RACE if race is None else race
+    ends_at = time.monotonic() + (deadline if deadline is not None else REQUEST_SLO_SECONDS)
+
+    with span("council.stage3", model=chairman, prompt_chars=len(chairman_prompt)) as stage_span:
+        model, content, failed = await _run_chairmen(
+            candidates, messages, ends_at, race, profile or generation.resolve_profiles()["stage3"]
+        )
+        stage_span.set_attributes(chairman=model, failed_chairmen=len(failed))
+
+    if content is not None:
+        result = {"model": model, "response": content}
+        if failed:
+            result["fallback_from"] = failed
+        return result
+
+    # No chairman answered in time: surface the council's best individual answer
+    best = top_ranked_answer(stage1_results, aggregate_rankings)
+    if best is None:
         return {
             "model": chairman,
             "response": "Error: Unable to generate final synthesis."
         }
-
     return {
-        "model": chairman,
-        "response": response.get('content', '')
+        "model": best["model"],
+        "response": best["response"],
+        "fallback": "top_ranked_stage1",
+        "fallback_from": failed
     }
 
 
+def _cluster_note(members: Optional[List[str]]) -> str:
+    return f" (near-identical answers also from: {', '.join(members)})" if members else ""
+
+
+async def _query_chairman(
+    model: str,
+    messages: List[Dict[str, str]],
+    ends_at: float,
+    share: float = 1.0,
+    profile: Optional[Dict[str, Any]] = None
+) -> Optional[str]:
+    """One chairman attempt using a share of the time left; None on failure or timeout."""
+    remaining = (ends_at - time.monotonic()) * share
+    if remaining <= 0:
+        return None
+    try:
+        response = await asyncio.wait_for(
+            query_model(model, messages, timeout=min(120.0, remaining), profile=profile), timeout=remaining
+        )
+    except asyncio.TimeoutError:
+        print(f"Chairman {model} missed the stage 3 deadline")
+        return None
+    content = (response or {}).get('content')
+    return content if content and content.strip() else None
+
+
+async def _run_chairmen(
+    candidates: List[str],
+    messages: List[Dict[str, str]],
+    ends_at: float,
+    race: bool,
+    profile: Optional[Dict[str, Any]] = None
+) -> Tuple[Optional[str], Optional[str], List[str]]:
+    """
+    Try chairmen in order (racing the first two if asked) until one answers.
+
+    Returns:
+        Tuple of (chairman model, synthesis or None, chairmen that failed)
+    """
+    failed = []
+    queue = list(candidates)
+
+    if race and len(queue) >= 2:
+        racers = {
+            asyncio.ensure_future(
+                _query_chairman(
+                    model, messages, ends_at, 1.0 if len(queue) == 2 else CHAIRMAN_ATTEMPT_SHARE, profile
+                )
+            ): model
+            for model in queue[:2]
+        }
+        queue = queue[2:]
+        pending = set(racers)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result() is not None:
+                        return racers[task], task.result(), failed
+                    failed.append(racers[task])
+        finally:
+            for task in pending:
+                task.cancel()
+
+    for position, model in enumerate(queue):
+        if time.monotonic() >= ends_at:
+            break
+        share = 1.0 if position == len(queue) - 1 else CHAIRMAN_ATTEMPT_SHARE
+        content = await _query_chairman(model, messages, ends_at, share, profile)
+        if content is not None:
+            return model, content, failed
+        failed.append(model)
+
+    return None, None, failed
+
+
+def top_ranked_answer(
+    stage1_results: List[Dict[str, Any]],
+    aggregate_rankings: Optional[List[Dict[str, Any]]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    The stage 1 answer the council ranked highest (first answer if unranked).
+
+    Args:
+        stage1_results: Results from Stage 1
+        aggregate_rankings: Aggregate rankings, best first
+
+    Returns:
+        Stage 1 result dict, or None if there are no answers
+    """
+    by_model = {result['model']: result for result in stage1_results if result.get('response')}
+    for entry in aggregate_rankings or []:
+        if entry['model'] in by_model:
+            return by_model[entry['model']]
+    return next(iter(by_model.values()), None)
+
+
+def stage3_deadline(started_at: float) -> float:
+    """Seconds left for stage 3 of a run that started at started_at (time.monotonic())."""
+    return max(CHAIRMAN_MIN_DEADLINE, REQUEST_SLO_SECONDS - (time.monotonic() - started_at))
+
+
 def parse_ranking_from_text(ranking_text: str) -> List[str]:
     """
     Parse the FINAL RANKING section from the model's response.
@@ -192,33 +569,70 @@ def parse_ranking_from_text(ranking_text: str) -> List[str]:
     Returns:
         List of response labels in ranked order
     """
-    import re
+    return _parse_ranking(ranking_text)[0]
 
-    # Look for "FINAL RANKING:" section
-    if "FINAL RANKING:" in ranking_text:
-        # Extract everything after "FINAL RANKING:"
-        parts = ranking_text.split("FINAL RANKING:")
-        if len(parts) >= 2:
-            ranking_section = parts[1]
-            # Try to extract numbered list format (e.g., "1. Response A")
-            # This pattern looks for: number, period, optional space, "Response X"
-            numbered_matches = re.findall(r'\d+\.\s*Response [A-Z]', ranking_section)
-            if numbered_matches:
-                # Extract just the "Response X" part
-                return [re.search(r'Response [A-Z]', m).group() for m in numbered_matches]
 
-            # Fallback: Extract all "Response X" patterns in order
-            matches = re.findall(r'Response [A-Z]', ranking_section)
-            return matches
+def _parse_ranking(ranking_text: str) -> Tuple[List[str], str]:
+    """
+    Single-pass text ranking parser.
 
-    # Fallback: try to find any "Response X" patterns in order
-    matches = re.findall(r'Response [A-Z]', ranking_text)
-    return matches
+    Prefers the numbered list after "FINAL RANKING:", then any labels in
+    that section, then any labels in the whole text. Repeated labels are
+    only counted at their first position.
+
+    Args:
+        ranking_text: The full text response from the model
+
+    Returns:
+        Tuple of (labels in ranked order, parse method)
+    """
+    marker = ranking_text.find("FINAL RANKING:")
+    if marker != -1:
+        section = ranking_text[marker + len("FINAL RANKING:"):]
+        method = "final_ranking"
+    else:
+        section = ranking_text
+        method = "mentions"
+
+    numbered = []
+    mentioned = []
+    for match in _RANKING_LABEL_RE.finditer(section):
+        label = match.group('label')
+        if match.group('numbered') and label not in numbered:
+            numbered.append(label)
+        if label not in mentioned:
+            mentioned.append(label)
+
+    if numbered and marker != -1:
+        return numbered, "numbered"
+    return mentioned, method
+
+
+def ranking_parsed(ranking: Dict[str, Any]) -> bool:
+    """
+    Whether a stage 2 result carries an actual ranking.
+
+    Without a FINAL RANKING section the parser falls back to the order labels
+    were first mentioned in ("mentions"), which says nothing about which
+    answer the reviewer preferred, so such results are left out of the
+    aggregate.
+
+    Args:
+        ranking: Stage 2 result
+
+    Returns:
+        False for "mentions" parses
+    """
+    method = ranking.get('parse_method')
+    if method is None:
+        method = _parse_ranking(ranking['ranking'])[1]
+    return method != "mentions"
 
 
 def calculate_aggregate_rankings(
     stage2_results: List[Dict[str, Any]],
-    label_to_model: Dict[str, str]
+    label_to_model: Dict[str, str],
+    method: str = None
 ) -> List[Dict[str, Any]]:
     """
     Calculate aggregate rankings across all models.
@@ -226,36 +640,74 @@ def calculate_aggregate_rankings(
     Args:
         stage2_results: Rankings from each model
         label_to_model: Mapping from anonymous labels to model names
+        method: Aggregation method (defaults to AGGREGATION_METHOD); anything
+            other than "average" adds a 'score' computed by backend.aggregation
 
     Returns:
-        List of dicts with model name and average rank, sorted best to worst
+        List of dicts with model name and average rank, sorted best to worst;
+        reviews without a parsed ranking (see ranking_parsed) are ignored
     """
     from collections import defaultdict
 
+    stage2_results = [ranking for ranking in stage2_results if ranking_parsed(ranking)]
+
     # Track positions for each model
     model_positions = defaultdict(list)
 
-    for ranking in stage2_results:
-        ranking_text = ranking['ranking']
-
-        # Parse the ranking from the structured format
-        parsed_ranking = parse_ranking_from_text(ranking_text)
+    # Track per-criterion scores (structured mode only)
+    model_scores = defaultdict(lambda: defaultdict(list))
 
+    for ranking in stage2_results:
+        # Reuse the ranking parsed in stage 2; only re-parse legacy results
+        parsed_ranking = ranking.get('parsed_ranking')
+        if parsed_ranking is None:
+            parsed_ranking = parse_ranking_from_text(ranking['ranking'])
+
+        # Subsampled reviews rank only their assigned answers; stretch those
+        # positions onto the full scale so they are comparable
+        subsampled = 'assigned' in ranking
+        if subsampled:
+            parsed_ranking = [label for label in parsed_ranking if label in label_to_model]
         for position, label in enumerate(parsed_ranking, start=1):
             if label in label_to_model:
+                if subsampled:
+                    position = scaled_position(position, len(parsed_ranking), len(label_to_model))
                 model_name = label_to_model[label]
                 model_positions[model_name].append(position)
 
+        for label, scores in (ranking.get('scores') or {}).items():
+            if label in label_to_model:
+                for criterion, score in scores.items():
+                    model_scores[label_to_model[label]][criterion].append(score)
+
     # Calculate average position for each model
     aggregate = []
     for model, positions in model_positions.items():
         if positions:
             avg_rank = sum(positions) / len(positions)
-            aggregate.append({
+            entry = {
                 "model": model,
                 "average_rank": round(avg_rank, 2),
                 "rankings_count": len(positions)
-            })
+            }
+            if model in model_scores:
+                entry["average_scores"] = {
+                    criterion: round(sum(values) / len(values), 2)
+                    for criterion, values in model_scores[model].items()
+                }
+            aggregate.append(entry)
+
+    method = method if method else AGGREGATION_METHOD
+    if method != "average":
+        from .aggregation import score_models
+
+        scores = score_models(stage2_results, label_to_model, method)
+        for entry in aggregate:
+            entry["score"] = scores.get(entry["model"])
+            entry["method"] = method
+        # Sort by score (higher is better), average rank breaks ties
+        aggregate.sort(key=lambda x: (-(x['score'] or 0), x['average_rank']))
+        return aggregate
 
     # Sort by average rank (lower is better)
     aggregate.sort(key=lambda x: x['average_rank'])
@@ -263,48 +715,407 @@ def calculate_aggregate_rankings(
     return aggregate
 
 
-async def generate_conversation_title(user_query: str) -> str:
+class StageFailed(Exception):
+    """A council stage produced nothing to build on (e.g. no stage 1 answers)."""
+
+    def __init__(self, stage: str, message: str):
+        super().__init__(message)
+        self.stage = stage
+
+
+def build_council_graph(
+    user_query: str,
+    council_models: List[str],
+    chairman_model: str = None,
+    ranking_mode: str = None,
+    aggregation_method: str = None,
+    review_sample_size: Optional[int] = None,
+    started_at: Optional[float] = None,
+    profiles: Optional[Dict[str, Dict[str, Any]]] = None,
+    skip_review: bool = False,
+    degradation_report: Optional[Dict[str, Any]] = None
+) -> Graph:
     """
-    Generate a short title for a conversation based on the first user message.
+    The council as a dependency graph.
+
+    Nodes: "retrieval" (one shared web search, see retrieval.py),
+    "stage1:<model>" per answer, "stage1" (the answers that came
+    back), "stage1.dedupe" (one answer per cluster of near-identical ones),
+    "stage2.plan" (labels and review prompts), "stage2:<model>" per review,
+    "stage2" (rankings and aggregate) and "stage3" (chairman). Without
+    review, "stage2" has no rankings and stage2.plan and the reviews are
+    left out.
+    Each model call gets MODEL_NODE_TIMEOUT and fails the node on error, so
+    one slow or failing model only drops its own contribution.
 
     Args:
-        user_query: The first user message
+        user_query: The user's question
+        council_models: Council models (answer and review)
+        chairman_model: Optional chairman model (defaults to CHAIRMAN_MODEL)
+        ranking_mode: "text" or "structured" stage 2 rankings (defaults to RANKING_MODE)
+        aggregation_method: Rank aggregation method (defaults to AGGREGATION_METHOD)
+        review_sample_size: Answers each stage 2 reviewer ranks (defaults to REVIEW_SAMPLE_SIZE)
+        started_at: time.monotonic() at the start of the request, for the stage 3 deadline
+        profiles: Per-stage generation profiles (defaults to the configured ones)
+        skip_review: Leave out stage 2 peer review
+        degradation_report: Degradation level entry for the stage 2 metadata
 
     Returns:
-        A short title (3-5 words)
+        Graph ready to run
+    """
+    started_at = time.monotonic() if started_at is None else started_at
+    profiles = generation.sample_baseline(profiles or generation.resolve_profiles())
+    graph = Graph("council")
+
+    def answer(model: str):
+        async def run(inputs: Dict[str, Any]) -> Dict[str, Any]:
+            # A failed search leaves the answers without sources rather than failing them
+            messages = retrieval.stage1_messages(user_query, inputs.get("retrieval"))
+            response = await query_model_coalesced(model, messages, profile=profiles["stage1"])
+            if response is None:
+                raise RuntimeError(f"{model} did not answer")
+            return {"model": model, "response": response.get('content', '')}
+        return run
+
+    def review(model: str):
+        async def run(inputs: Dict[str, Any]) -> Dict[str, Any]:
+            plan = inputs["stage2.plan"]
+            if model not in plan["requests"]:
+                raise LookupError(f"No answers assigned to {model}")
+            response = await query_model_coalesced(
+                model, plan["requests"][model], response_format=plan["response_format"],
+                profile=profiles["stage2"]
+            )
+            if response is None:
+                raise RuntimeError(f"{model} did not review")
+            return ranking_result(model, response.get('content') or '', plan)
+        return run
+
+    def collect_answers(inputs: Dict[str, Any]) -> List[Dict[str, Any]]:
+        results = [inputs[f"stage1:{model}"] for model in council_models if f"stage1:{model}" in inputs]
+        if not results:
+            raise StageFailed("stage1", "All models failed to respond. Please try again.")
+        return results
+
+    def deduplicate(inputs: Dict[str, Any]) -> Dict[str, Any]:
+        return dedupe.review_set(inputs["stage1"], dedupe.cluster_answers(inputs["stage1"]))
+
+    def collect_rankings(inputs: Dict[str, Any]) -> Dict[str, Any]:
+        label_to_model = inputs["stage2.plan"]["label_to_model"] if not skip_review else {}
+        members = inputs["stage1.dedupe"]["members"]
+        results = [inputs[f"stage2:{model}"] for model in council_models if f"stage2:{model}" in inputs]
+        aggregate_rankings = dedupe.expand_aggregate(
+            calculate_aggregate_rankings(results, label_to_model, method=aggregation_method), members
+        )
+        stats.record_rankings(aggregate_rankings, len(label_to_model))
+        metadata = {
+            "label_to_model": label_to_model,
+            "aggregate_rankings": aggregate_rankings,
+            "council_models": council_models
+        }
+        if members:
+            metadata["answer_clusters"] = members
+        unparsed = [result["model"] for result in results if not ranking_parsed(result)]
+        if unparsed:
+            metadata["unparsed_rankings"] = unparsed
+        assignments = inputs["stage2.plan"]["assignments"] if not skip_review else {}
+        if assignments:
+            # Subsampled review: count the usable reviews per answer, so answers
+            # nobody ranked (their reviewers failed or gave no ranking) are visible
+            returned = {
+                model: indices for model, indices in assignments.items()
+                if f"stage2:{model}" in inputs and model not in unparsed
+            }
+            coverage = dict(zip(label_to_model, review_coverage(returned, len(label_to_model))))
+            metadata["review_coverage"] = coverage
+            unreviewed = [label for label, count in coverage.items() if count == 0]
+            if unreviewed:
+                metadata["unreviewed"] = unreviewed
+        if inputs.get("retrieval"):
+            metadata["sources"] = retrieval.source_list(inputs["retrieval"])
+        if degradation_report is not None:
+            metadata["degradation"] = degradation_report
+        return {"results": results, "metadata": metadata}
+
+    async def synthesize(inputs: Dict[str, Any]) -> Dict[str, Any]:
+        return await stage3_synthesize_final(
+            user_query,
+            inputs["stage1"],
+            inputs["stage2"]["results"],
+            chairman_model=chairman_model,
+            deadline=stage3_deadline(started_at),
+            aggregate_rankings=inputs["stage2"]["metadata"]["aggregate_rankings"],
+            profile=profiles["stage3"],
+            answer_clusters=inputs["stage2"]["metadata"].get("answer_clusters")
+        )
+
+    graph.add("retrieval", lambda inputs: retrieval.retrieve(user_query), timeout=RETRIEVAL_TIMEOUT)
+    answers = [
+        graph.add(f"stage1:{model}", answer(model), after=["retrieval"], timeout=MODEL_NODE_TIMEOUT)
+        for model in council_models
+    ]
+    graph.add("stage1", collect_answers, after=answers)
+    graph.add("stage1.dedupe", deduplicate, deps=["stage1"])
+    if skip_review:
+        graph.add("stage2", collect_rankings, deps=["stage1.dedupe"], after=["retrieval"])
+    else:
+        graph.add("stage2.plan", lambda inputs: plan_rankings(
+            user_query, inputs["stage1.dedupe"]["answers"], council_models, ranking_mode, review_sample_size
+        ), deps=["stage1.dedupe"])
+        reviews = [
+            graph.add(f"stage2:{model}", review(model), deps=["stage2.plan"], timeout=MODEL_NODE_TIMEOUT)
+            for model in council_models
+        ]
+        graph.add("stage2", collect_rankings, deps=["stage1.dedupe", "stage2.plan"], after=reviews + ["retrieval"])
+    graph.add("stage3", synthesize, deps=["stage1", "stage2"])
+    return graph
+
+
+def council_progress(
+    council_models: List[str],
+    chairman_model: str,
+    emit: Callable[[Dict[str, Any]], None]
+) -> EventCallback:
     """
-    title_prompt = f"""Generate a very short title (3-5 words maximum) that summarizes the following question.
-The title should be concise and descriptive. Do not use quotes or punctuation in the title.
+    Translate council graph events into the streaming protocol.
 
-Question: {user_query}
+    Emits '<stage>_start' when a stage's first node starts, 'model_status'
+    as each model call finishes, and '<stage>_complete' with the stage's
+    results.
 
-Title:"""
+    Args:
+        council_models: Council models (listed in stage 1/2 start events)
+        chairman_model: Chairman model (listed in the stage 3 start event)
+        emit: Called with each event dict ({'type': ..., 'data': ...})
 
-    messages = [{"role": "user", "content": title_prompt}]
+    Returns:
+        on_event callback for Graph.run
+    """
+    started = set()
+
+    def on_event(kind: str, name: str, value: Any):
+        stage, _, model = name.partition(":")
+        stage = stage.split(".")[0]
+        if stage == "retrieval":
+            return  # Its sources are reported in the stage 2 metadata
+        if kind == "node_start" and stage not in started:
+            started.add(stage)
+            data = {"model": chairman_model} if stage == "stage3" else {"models": council_models}
+            emit({"type": f"{stage}_start", "data": data})
+        elif model and kind in ("node_complete", "node_failed"):
+            status = "success" if kind == "node_complete" else "failed"
+            emit({"type": "model_status", "data": {"model": model, "status": status, "stage": int(stage[-1])}})
+        elif kind == "node_complete" and name == "stage2":
+            emit({"type": "stage2_complete", "data": value["results"], "metadata": value["metadata"]})
+        elif kind == "node_complete" and name in ("stage1", "stage3"):
+            emit({"type": f"{name}_complete", "data": value})
+
+    return on_event
+
+
+async def run_council_graph(
+    user_query: str,
+    council_models: List[str],
+    chairman_model: str = None,
+    ranking_mode: str = None,
+    aggregation_method: str = None,
+    review_sample_size: Optional[int] = None,
+    started_at: Optional[float] = None,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    profiles: Optional[Dict[str, Dict[str, Any]]] = None
+) -> Tuple[List, List, Dict, Dict]:
+    """
+    Run the council graph (no cache lookup or store), fitted to the current
+    load by the degradation policy (see degradation.py).
 
-    # Use gemini-2.5-flash for title generation (fast and cheap)
-    response = await query_model("google/gemini-2.5-flash", messages, timeout=30.0)
+    Args:
+        user_query: The user's question
+        council_models: Council models
+        chairman_model: Optional chairman model (defaults to CHAIRMAN_MODEL)
+        ranking_mode: "text" or "structured" stage 2 rankings (defaults to RANKING_MODE)
+        aggregation_method: Rank aggregation method (defaults to AGGREGATION_METHOD)
+        review_sample_size: Answers each stage 2 reviewer ranks (defaults to REVIEW_SAMPLE_SIZE)
+        started_at: time.monotonic() at the start of the request
+        on_progress: Optional callback receiving streaming protocol events
+        profiles: Per-stage generation profiles (defaults to the configured ones)
 
-    if response is None:
-        # Fallback to a generic title
-        return "New Conversation"
+    Returns:
+        Tuple of (stage1_results, stage2_results, stage3_result, metadata);
+        metadata['degradation'] reports the level the run was held to
 
-    title = response.get('content', 'New Conversation').strip()
+    Raises:
+        StageFailed: No council model answered
+        Exception: Whatever broke stage 2 or 3
+    """
+    fitted = degradation.plan(list(dict.fromkeys(council_models)), chairman_model, review_sample_size)
+    council_models, chairman_model = fitted["council_models"], fitted["chairman_model"]
+    graph = build_council_graph(
+        user_query, council_models, chairman_model, ranking_mode,
+        aggregation_method, fitted["review_sample_size"], started_at, profiles,
+        skip_review=fitted["skip_review"], degradation_report=fitted["report"]
+    )
+    progress = None
+    if on_progress is not None:
+        progress = council_progress(council_models, chairman_model or CHAIRMAN_MODEL, on_progress)
+
+    def on_event(kind: str, name: str, value: Any):
+        # Stage 1 answer times (timeouts included) drive the latency signal
+        if name.startswith("stage1:") and kind in ("node_complete", "node_failed"):
+            degradation.record_latency(graph.timings[name])
+        if progress is not None:
+            progress(kind, name, value)
+
+    results = await graph.run(on_event)
+    for stage in ("stage1", "stage2", "stage3"):
+        if stage in graph.failed:
+            raise graph.failed[stage]
+
+    return results["stage1"], results["stage2"]["results"], results["stage3"], results["stage2"]["metadata"]
+
+
+def cache_namespace(
+    council_models: List[str],
+    chairman_model: Optional[str],
+    ranking_mode: Optional[str] = None,
+    aggregation_method: Optional[str] = None,
+    review_sample_size: Optional[int] = None,
+    profiles: Optional[Dict[str, Dict[str, Any]]] = None
+) -> str:
+    """
+    Semantic cache namespace for one request's council settings.
+
+    Defaults are resolved first, so leaving a setting out and passing its
+    default share entries.
+
+    Args:
+        council_models: Council models for this request
+        chairman_model: Optional chairman model (defaults to CHAIRMAN_MODEL)
+        ranking_mode: Stage 2 ranking mode (defaults to RANKING_MODE)
+        aggregation_method: Rank aggregation method (defaults to AGGREGATION_METHOD)
+        review_sample_size: Answers each reviewer ranks (defaults to REVIEW_SAMPLE_SIZE)
+        profiles: Resolved generation profiles (defaults to GENERATION_PROFILES)
+
+    Returns:
+        Namespace for semantic_cache lookups and stores
+    """
+    return semantic_cache.council_namespace(council_models, chairman_model or CHAIRMAN_MODEL, {
+        "ranking_mode": ranking_mode or RANKING_MODE,
+        "aggregation_method": aggregation_method or AGGREGATION_METHOD,
+        "review_sample_size": review_sample_size if review_sample_size is not None else REVIEW_SAMPLE_SIZE,
+        "generation": profiles or generation.resolve_profiles(),
+    })
+
+
+def lookup_cached_council(
+    user_query: str,
+    council_models: List[str],
+    chairman_model: str = None,
+    ranking_mode: Optional[str] = None,
+    aggregation_method: Optional[str] = None,
+    review_sample_size: Optional[int] = None,
+    profiles: Optional[Dict[str, Dict[str, Any]]] = None
+) -> Optional[Tuple[List, List, Dict, Dict]]:
+    """
+    Look up a near-duplicate earlier query in the semantic cache.
+
+    Only runs with the same settings (see cache_namespace) can answer.
+
+    Args:
+        user_query: The user's question
+        council_models: Council models for this request
+        chairman_model: Optional chairman model (defaults to CHAIRMAN_MODEL)
+        ranking_mode: Stage 2 ranking mode
+        aggregation_method: Rank aggregation method
+        review_sample_size: Answers each stage 2 reviewer ranks
+        profiles: Resolved generation profiles
+
+    Returns:
+        Tuple of (stage1_results, stage2_results, stage3_result, metadata) on a
+        hit, None on a miss or when the cache is disabled
+    """
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
 
-    # Clean up the title - remove quotes, limit length
-    title = title.strip('"\'')
+    namespace = cache_namespace(
+        council_models, chairman_model, ranking_mode, aggregation_method, review_sample_size, profiles
+    )
+    with span("cache.lookup") as lookup_span:
+        hit = semantic_cache.get_cache().lookup(user_query, namespace)
+        lookup_span.set_attribute("hit", hit is not None)
+    if hit is None:
+        return None
+
+    result = hit["result"]
+    metadata = dict(result["metadata"])
+    metadata["cache"] = {
+        "hit": True,
+        "similarity": hit["similarity"],
+        "cached_query": hit["query"]
+    }
+    return result["stage1"], result["stage2"], result["stage3"], metadata
 
-    # Truncate if too long
-    if len(title) > 50:
-        title = title[:47] + "..."
 
-    return title
+def store_cached_council(
+    user_query: str,
+    council_models: List[str],
+    chairman_model: str,
+    stage1_results: List[Dict[str, Any]],
+    stage2_results: List[Dict[str, Any]],
+    stage3_result: Dict[str, Any],
+    metadata: Dict[str, Any],
+    ranking_mode: Optional[str] = None,
+    aggregation_method: Optional[str] = None,
+    review_sample_size: Optional[int] = None,
+    profiles: Optional[Dict[str, Dict[str, Any]]] = None
+):
+    """
+    Store a completed council run in the semantic cache.
+
+    Failed runs (no stage 1 answers or no chairman synthesis) and degraded
+    runs are not cached.
+
+    Args:
+        user_query: The user's question
+        council_models: Council models used
+        chairman_model: Optional chairman model (defaults to CHAIRMAN_MODEL)
+        stage1_results: Results from Stage 1
+        stage2_results: Results from Stage 2
+        stage3_result: Result from Stage 3
+        metadata: Run metadata (label mapping, aggregate rankings, ...)
+        ranking_mode: Stage 2 ranking mode used
+        aggregation_method: Rank aggregation method used
+        review_sample_size: Answers each stage 2 reviewer ranked
+        profiles: Resolved generation profiles used
+    """
+    if not SEMANTIC_CACHE_ENABLED:
+        return
+    if not stage1_results or stage3_result.get("fallback") or (stage3_result.get("response") or "").startswith("Error:"):
+        return
+    if metadata.get("degradation", {}).get("level"):
+        # A degraded answer must not stand in for full councils later
+        return
+
+    namespace = cache_namespace(
+        council_models, chairman_model, ranking_mode, aggregation_method, review_sample_size, profiles
+    )
+    semantic_cache.get_cache().store(user_query, {
+        "stage1": stage1_results,
+        "stage2": stage2_results,
+        "stage3": stage3_result,
+        "metadata": metadata
+    }, namespace)
 
 
 async def run_full_council(
     user_query: str,
     council_models: List[str] = None,
-    chairman_model: str = None
+    chairman_model: str = None,
+    fast_council: bool = False,
+    ranking_mode: str = None,
+    aggregation_method: str = None,
+    use_cache: bool = True,
+    review_sample_size: Optional[int] = None,
+    generation_overrides: Optional[Dict[str, Dict[str, Any]]] = None
 ) -> Tuple[List, List, Dict, Dict]:
     """
     Run the complete 3-stage council process.
@@ -313,40 +1124,61 @@ async def run_full_council(
         user_query: The user's question
         council_models: Optional list of models for the council (defaults to COUNCIL_MODELS)
         chairman_model: Optional chairman model (defaults to CHAIRMAN_MODEL)
+        fast_council: Whether to select the council subset that meets the latency SLO
+        ranking_mode: "text" or "structured" stage 2 rankings (defaults to RANKING_MODE)
+        aggregation_method: Rank aggregation method (defaults to AGGREGATION_METHOD)
+        use_cache: Whether a semantic cache hit may answer the query
+        review_sample_size: Answers each stage 2 reviewer ranks (defaults to REVIEW_SAMPLE_SIZE)
+        generation_overrides: Per-stage generation profile overrides ({stage: {field: value}})
 
     Returns:
         Tuple of (stage1_results, stage2_results, stage3_result, metadata)
     """
-    # Stage 1: Collect individual responses
-    stage1_results = await stage1_collect_responses(user_query, models=council_models)
-
-    # If no models responded successfully, return error
-    if not stage1_results:
-        return [], [], {
-            "model": "error",
-            "response": "All models failed to respond. Please try again."
-        }, {}
-
-    # Stage 2: Collect rankings
-    stage2_results, label_to_model = await stage2_collect_rankings(
-        user_query, stage1_results, models=council_models
-    )
+    with start_trace("council.run", query_chars=len(user_query)):
+        return await _run_full_council(
+            user_query, council_models, chairman_model, fast_council,
+            ranking_mode, aggregation_method, use_cache, review_sample_size, generation_overrides
+        )
 
-    # Calculate aggregate rankings
-    aggregate_rankings = calculate_aggregate_rankings(stage2_results, label_to_model)
 
-    # Stage 3: Synthesize final answer
-    stage3_result = await stage3_synthesize_final(
-        user_query,
-        stage1_results,
-        stage2_results,
-        chairman_model=chairman_model
+async def _run_full_council(
+    user_query: str,
+    council_models: Optional[List[str]],
+    chairman_model: Optional[str],
+    fast_council: bool,
+    ranking_mode: Optional[str],
+    aggregation_method: Optional[str],
+    use_cache: bool,
+    review_sample_size: Optional[int],
+    generation_overrides: Optional[Dict[str, Dict[str, Any]]]
+) -> Tuple[List, List, Dict, Dict]:
+    """Body of run_full_council, running inside its trace."""
+    started_at = time.monotonic()
+    council_models = resolve_council_models(council_models, fast_council)
+    profiles = generation.resolve_profiles(generation_overrides)
+
+    # A near-duplicate earlier query skips all three stages
+    if use_cache:
+        cached = lookup_cached_council(
+            user_query, council_models, chairman_model,
+            ranking_mode, aggregation_method, review_sample_size, profiles
+        )
+        if cached is not None:
+            return cached
+
+    try:
+        stage1_results, stage2_results, stage3_result, metadata = await run_council_graph(
+            user_query, council_models, chairman_model, ranking_mode,
+            aggregation_method, review_sample_size, started_at, profiles=profiles
+        )
+    except StageFailed as e:
+        # If no models responded successfully, return error
+        return [], [], {"model": "error", "response": str(e)}, {}
+
+    store_cached_council(
+        user_query, council_models, chairman_model,
+        stage1_results, stage2_results, stage3_result, metadata,
+        ranking_mode, aggregation_method, review_sample_size, profiles
     )
 
-    # Prepare metadata
-    metadata = {
-        "label_to_model": label_to_model,
-        "aggregate_rankings": aggregate_rankings
-    }
-
     return stage1_results, stage2_results, stage3_result, metadata
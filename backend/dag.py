@@ -0,0 +1,159 @@
+"""Small dependency-graph executor for council runs.
+
+A run is a graph of named nodes (the council builds one node per model call
+plus one per stage step). Each node is a function of its inputs: the results
+of the nodes it depends on. A node starts as soon as its inputs are ready,
+so the critical path is set by the declared dependencies alone, not by
+hand-written stage barriers.
+
+A node can depend on others in two ways:
+- deps: the node needs their results. If one of them fails, the node is
+  skipped.
+- after: the node waits for them to finish, but runs even if some failed.
+  Inputs only include the ones that succeeded. This is how a stage collects
+  whichever model calls came back.
+
+A node may have its own timeout; hitting it counts as a failure. Cancelling
+the run cancels every node still running. Progress is reported through one
+callback, on_event(kind, node, value), with kind "node_start",
+"node_complete", "node_failed" or "node_skipped". Callers turn these into
+whatever progress protocol they speak.
+"""
+
+import asyncio
+import inspect
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Union
+
+from .tracing import span
+from . import profiling
+
+NodeFunction = Callable[[Dict[str, Any]], Union[Any, Awaitable[Any]]]
+EventCallback = Callable[[str, str, Any], None]
+
+
+class Node:
+    """One unit of work in a graph."""
+
+    __slots__ = ("name", "fn", "deps", "after", "timeout")
+
+    def __init__(self, name: str, fn: NodeFunction, deps: List[str], after: List[str], timeout: Optional[float]):
+        self.name = name
+        self.fn = fn
+        self.deps = deps
+        self.after = after
+        self.timeout = timeout
+
+
+class Graph:
+    """A single-use graph of nodes; build it with add(), then await run()."""
+
+    def __init__(self, name: str = "graph"):
+        self.name = name
+        self.nodes: Dict[str, Node] = {}
+        self.results: Dict[str, Any] = {}
+        self.failed: Dict[str, BaseException] = {}
+        self.skipped: List[str] = []
+        self.timings: Dict[str, float] = {}
+
+    def add(
+        self,
+        name: str,
+        fn: NodeFunction,
+        deps: Iterable[str] = (),
+        after: Iterable[str] = (),
+        timeout: Optional[float] = None
+    ) -> str:
+        """
+        Add a node. Dependencies must already be in the graph, which keeps it acyclic.
+
+        Args:
+            name: Unique node name
+            fn: Called with {dependency name: result}; may be sync or async
+            deps: Nodes whose results are required (the node is skipped if one fails)
+            after: Nodes to wait for whose failure is tolerated
+            timeout: Seconds the node may run before it counts as failed
+
+        Returns:
+            The node name, for use in later deps
+        """
+        if name in self.nodes:
+            raise ValueError(f"Duplicate node: {name}")
+        deps, after = list(deps), list(after)
+        for dep in deps + after:
+            if dep not in self.nodes:
+                raise ValueError(f"Node {name} depends on unknown node {dep}")
+        self.nodes[name] = Node(name, fn, deps, after, timeout)
+        return name
+
+    async def _run_node(self, node: Node, inputs: Dict[str, Any]) -> Any:
+        with span("dag.node", node=node.name), profiling.stage(node.name):
+            start = time.monotonic()
+            try:
+                result = node.fn(inputs)
+                if inspect.isawaitable(result):
+                    if node.timeout is None:
+                        result = await result
+                    else:
+                        result = await asyncio.wait_for(result, node.timeout)
+                return result
+            finally:
+                self.timings[node.name] = round(time.monotonic() - start, 4)
+
+    async def run(self, on_event: Optional[EventCallback] = None) -> Dict[str, Any]:
+        """
+        Run every node, each as soon as its inputs are ready.
+
+        Args:
+            on_event: Optional callback(kind, node name, value) for progress
+
+        Returns:
+            Results of the nodes that completed (failures are in .failed,
+            skipped nodes in .skipped)
+        """
+        def emit(kind: str, name: str, value: Any = None):
+            if on_event is not None:
+                on_event(kind, name, value)
+
+        waiting = dict(self.nodes)
+        running: Dict["asyncio.Future", str] = {}
+
+        with span(f"dag.{self.name}", nodes=len(self.nodes)):
+            try:
+                while waiting or running:
+                    progressed = True
+                    while progressed:
+                        progressed = False
+                        for name, node in list(waiting.items()):
+                            if any(dep in self.failed or dep in self.skipped for dep in node.deps):
+                                del waiting[name]
+                                self.skipped.append(name)
+                                emit("node_skipped", name)
+                                progressed = True
+                            elif all(dep in self.results for dep in node.deps) and all(
+                                dep in self.results or dep in self.failed or dep in self.skipped
+                                for dep in node.after
+                            ):
+                                del waiting[name]
+                                inputs = {dep: self.results[dep] for dep in node.deps + node.after if dep in self.results}
+                                running[asyncio.ensure_future(self._run_node(node, inputs))] = name
+                                emit("node_start", name)
+
+                    if not running:
+                        break
+                    done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        name = running.pop(task)
+                        try:
+                            self.results[name] = task.result()
+                        except Exception as e:
+                            self.failed[name] = e
+                            emit("node_failed", name, e)
+                        else:
+                            emit("node_complete", name, self.results[name])
+            finally:
+                # Cancelled run (e.g. the client went away): stop everything still in flight
+                for task in running:
+                    task.cancel()
+
+        return self.results
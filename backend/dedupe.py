@@ -0,0 +1,115 @@
+"""Clustering of near-identical stage 1 answers.
+
+Council members often give nearly the same answer. Each such group is
+reviewed once, under one label, and shown to the chairman once. The
+cluster's representative is its longest answer. Membership is kept so that
+every member gets the representative's ranking in the aggregate. The UI
+still shows every member's own answer.
+
+Similarity is the Jaccard similarity of word shingles (runs of
+DEDUPE_SHINGLE_SIZE words, lowercased). A council has at most a few dozen
+answers, so exact pairwise comparison is cheap and no MinHash sketch is
+needed. Clustering is greedy: each answer joins the first cluster whose
+first answer is similar enough, or starts a new one.
+"""
+
+import re
+from typing import List, Dict, Any, FrozenSet
+
+from .config import DEDUPE_ENABLED, DEDUPE_THRESHOLD, DEDUPE_SHINGLE_SIZE
+from .tracing import span
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def shingles(text: str, size: int = DEDUPE_SHINGLE_SIZE) -> FrozenSet[str]:
+    """Set of lowercased word n-grams (the words themselves for very short texts)."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return frozenset(words)
+    return frozenset(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """Jaccard similarity of two shingle sets (0 when both are empty)."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def cluster_answers(
+    stage1_results: List[Dict[str, Any]],
+    threshold: float = DEDUPE_THRESHOLD
+) -> List[List[int]]:
+    """
+    Group near-identical stage 1 answers.
+
+    Args:
+        stage1_results: Results from Stage 1
+        threshold: Minimum shingle Jaccard similarity to join a cluster
+
+    Returns:
+        Clusters as lists of answer indices, representative (longest answer)
+        first, in order of first appearance; every answer is in exactly one
+    """
+    if not DEDUPE_ENABLED:
+        return [[index] for index in range(len(stage1_results))]
+
+    with span("council.dedupe", answers=len(stage1_results)) as dedupe_span:
+        sets = [shingles(result.get('response') or '') for result in stage1_results]
+        clusters: List[List[int]] = []
+        for index, answer_set in enumerate(sets):
+            for cluster in clusters:
+                if jaccard(sets[cluster[0]], answer_set) >= threshold:
+                    cluster.append(index)
+                    break
+            else:
+                clusters.append([index])
+        dedupe_span.set_attribute("clusters", len(clusters))
+
+    lengths = [len(result.get('response') or '') for result in stage1_results]
+    return [sorted(cluster, key=lambda index: -lengths[index]) for cluster in clusters]
+
+
+def review_set(stage1_results: List[Dict[str, Any]], clusters: List[List[int]]) -> Dict[str, Any]:
+    """
+    The answers to review, one per cluster, and who else gave them.
+
+    Args:
+        stage1_results: Results from Stage 1
+        clusters: Output of cluster_answers
+
+    Returns:
+        Dict with 'answers' (representative stage 1 results) and 'members'
+        (representative model -> models whose answers it stands for;
+        multi-answer clusters only)
+    """
+    answers = [stage1_results[cluster[0]] for cluster in clusters]
+    members = {
+        stage1_results[cluster[0]]['model']: [stage1_results[index]['model'] for index in cluster[1:]]
+        for cluster in clusters
+        if len(cluster) > 1
+    }
+    return {"answers": answers, "members": members}
+
+
+def expand_aggregate(aggregate: List[Dict[str, Any]], members: Dict[str, List[str]]) -> List[Dict[str, Any]]:
+    """
+    Give each cluster member its representative's aggregate ranking.
+
+    Args:
+        aggregate: Aggregate rankings over representatives, best first
+        members: Representative model -> other member models
+
+    Returns:
+        Aggregate with member entries (marked 'clustered_with') right after
+        their representative
+    """
+    if not members:
+        return aggregate
+    expanded = []
+    for entry in aggregate:
+        expanded.append(entry)
+        for model in members.get(entry["model"], []):
+            expanded.append({**entry, "model": model, "clustered_with": entry["model"]})
+    return expanded
@@ -0,0 +1,142 @@
+"""Load-aware graceful degradation of council runs.
+
+When the council is overloaded, every request still gets an answer within the
+latency SLO, at a lower but explicitly reported quality level. Two signals
+are combined into one pressure value, the larger of:
+- queue pressure: councils running plus queued, over ADMISSION_MAX_CONCURRENT
+  (taken from the admission controller; 0 when admission is off)
+- latency pressure: EWMA of recent stage 1 answer times over
+  DEGRADATION_LATENCY_TARGET (0 once the last sample is stale)
+
+Each DEGRADATION_LEVELS entry caps the council size, caps or skips stage 2
+review, and may swap in a faster chairman. The level rises as soon as
+pressure crosses a threshold. It falls only when pressure is clearly below
+it (DEGRADATION_RECOVERY), so it does not flap around a threshold.
+
+Degraded runs report the level in their metadata and are not written to the
+semantic cache.
+"""
+
+import time
+from typing import List, Dict, Any, Optional
+
+from .config import (
+    CHAIRMAN_MODEL,
+    DEGRADATION_ENABLED,
+    DEGRADATION_THRESHOLDS,
+    DEGRADATION_RECOVERY,
+    DEGRADATION_LATENCY_TARGET,
+    DEGRADATION_LATENCY_STALE_SECONDS,
+    DEGRADATION_LEVELS,
+)
+from . import admission, stats
+
+# Weight of the newest sample in the latency EWMA
+_LATENCY_EWMA_ALPHA = 0.2
+
+_latency: Optional[float] = None
+_latency_at = 0.0
+_level = 0
+
+
+def record_latency(seconds: float):
+    """
+    Fold one stage 1 answer time (successful or not) into the latency signal.
+
+    Args:
+        seconds: How long the model call ran
+    """
+    global _latency, _latency_at
+    if _latency is None or time.monotonic() - _latency_at > DEGRADATION_LATENCY_STALE_SECONDS:
+        _latency = seconds
+    else:
+        _latency += _LATENCY_EWMA_ALPHA * (seconds - _latency)
+    _latency_at = time.monotonic()
+
+
+def signals() -> Dict[str, float]:
+    """Current queue, latency and combined pressure (1.0 = at capacity / at target)."""
+    controller = admission.get_controller()
+    queue = 0.0
+    if controller is not None:
+        queue = (len(controller.running) + len(controller.waiting)) / controller.max_concurrent
+    latency = 0.0
+    if _latency is not None and time.monotonic() - _latency_at <= DEGRADATION_LATENCY_STALE_SECONDS:
+        latency = _latency / DEGRADATION_LATENCY_TARGET
+    return {"queue": round(queue, 2), "latency": round(latency, 2), "pressure": round(max(queue, latency), 2)}
+
+
+def current_level(pressure: float) -> int:
+    """
+    Degradation level for a pressure value, with hysteresis on the way down.
+
+    Args:
+        pressure: Combined pressure from signals()
+
+    Returns:
+        Index into DEGRADATION_LEVELS
+    """
+    global _level
+    target = min(sum(1 for threshold in DEGRADATION_THRESHOLDS if pressure > threshold), len(DEGRADATION_LEVELS) - 1)
+    if target >= _level:
+        _level = target
+    else:
+        while _level > target and pressure < DEGRADATION_THRESHOLDS[_level - 1] * DEGRADATION_RECOVERY:
+            _level -= 1
+    return _level
+
+
+def plan(
+    council_models: List[str],
+    chairman_model: Optional[str],
+    review_sample_size: Optional[int]
+) -> Dict[str, Any]:
+    """
+    Fit one council run to the current load.
+
+    Args:
+        council_models: Requested council models
+        chairman_model: Requested chairman (None for CHAIRMAN_MODEL)
+        review_sample_size: Requested stage 2 sample size (None for all answers)
+
+    Returns:
+        Dict with the 'council_models', 'chairman_model', 'review_sample_size'
+        and 'skip_review' to run with, and 'report' (the metadata entry)
+    """
+    if not DEGRADATION_ENABLED:
+        level, current = 0, {"pressure": 0.0}
+    else:
+        current = signals()
+        level = current_level(current["pressure"])
+    policy = DEGRADATION_LEVELS[level]
+
+    models = council_models
+    if policy["max_models"] is not None and len(models) > policy["max_models"]:
+        # Best-ranked models that meet the fast-council SLO, topped up with the fastest
+        models = stats.select_fast_council(models, min_models=policy["max_models"], max_models=policy["max_models"])
+
+    sample_size = review_sample_size
+    if policy["review_sample_size"] is not None:
+        sample_size = min(sample_size or policy["review_sample_size"], policy["review_sample_size"])
+    skip_review = sample_size == 0
+
+    chairman = policy["chairman"] or chairman_model
+
+    report = {"level": level, "name": policy["name"], **current}
+    if level:
+        report["council_size"] = len(models)
+        report["review"] = "skipped" if skip_review else f"sample of {sample_size}"
+        report["chairman"] = chairman or CHAIRMAN_MODEL
+    return {
+        "council_models": models,
+        "chairman_model": chairman,
+        "review_sample_size": None if skip_review else sample_size,
+        "skip_review": skip_review,
+        "report": report,
+    }
+
+
+def status() -> Dict[str, Any]:
+    """Current signals and level (without changing the level)."""
+    current = signals()
+    return {"enabled": DEGRADATION_ENABLED, "level": _level, "name": DEGRADATION_LEVELS[_level]["name"], **current}
@@ -0,0 +1,224 @@
+"""Per-stage generation profiles and their telemetry.
+
+A profile caps what one model call may generate:
+- max_tokens: output token limit
+- reasoning_effort ("minimal", "low", "medium", "high") or reasoning_max_tokens:
+  how much the model may think before answering
+- include_reasoning: whether reasoning_details are returned at all
+- stop: stop sequences
+
+Each stage ("stage1", "stage2", "stage3", "title") has a default profile
+in GENERATION_PROFILES. A request may override any field per stage.
+
+Telemetry groups calls by stage and by profile. For each profile it
+reports mean latency and mean completion and reasoning tokens, and the
+savings against the same stage's uncapped calls. Most default profiles are
+capped, so GENERATION_BASELINE_SAMPLE_RATE of council runs use the uncapped
+profile for their default stages to provide that baseline.
+"""
+
+import random
+from typing import List, Dict, Any, Optional
+
+from .config import GENERATION_PROFILES, GENERATION_BASELINE_SAMPLE_RATE
+
+REASONING_EFFORTS = ("minimal", "low", "medium", "high")
+
+# Field -> accepted type(s) (None always allowed: "no limit")
+_FIELDS = {
+    "max_tokens": int,
+    "reasoning_effort": str,
+    "reasoning_max_tokens": int,
+    "include_reasoning": bool,
+    "stop": list,
+}
+
+# Profile with no limits at all: the baseline savings are measured against
+UNCAPPED = "uncapped"
+
+
+def _validate(stage: str, profile: Dict[str, Any]):
+    for field, value in profile.items():
+        if field not in _FIELDS:
+            raise ValueError(f"Unknown generation field for {stage}: {field}")
+        if value is None:
+            continue
+        if not isinstance(value, _FIELDS[field]) or (_FIELDS[field] is int and isinstance(value, bool)):
+            raise ValueError(f"{stage}.{field} must be {_FIELDS[field].__name__}")
+        if field in ("max_tokens", "reasoning_max_tokens") and value < 1:
+            raise ValueError(f"{stage}.{field} must be positive")
+    if profile.get("reasoning_effort") not in (None, *REASONING_EFFORTS):
+        raise ValueError(f"{stage}.reasoning_effort must be one of {', '.join(REASONING_EFFORTS)}")
+    if profile.get("reasoning_effort") and profile.get("reasoning_max_tokens"):
+        raise ValueError(f"{stage}: set reasoning_effort or reasoning_max_tokens, not both")
+
+
+def resolve_profiles(overrides: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Per-stage profiles for one request: the configured defaults plus overrides.
+
+    Args:
+        overrides: Optional {stage: {field: value}}; a None value lifts that limit
+
+    Returns:
+        {stage: profile} for every stage
+
+    Raises:
+        ValueError: Unknown stage or field, or an invalid value
+    """
+    overrides = overrides or {}
+    for stage in overrides:
+        if stage not in GENERATION_PROFILES:
+            raise ValueError(f"Unknown generation stage: {stage}")
+
+    profiles = {}
+    for stage, defaults in GENERATION_PROFILES.items():
+        override = overrides.get(stage) or {}
+        profile = {**defaults, **override}
+        # Overriding one kind of reasoning limit replaces the default of the other
+        if "reasoning_max_tokens" in override and "reasoning_effort" not in override:
+            profile["reasoning_effort"] = None
+        if "reasoning_effort" in override and "reasoning_max_tokens" not in override:
+            profile["reasoning_max_tokens"] = None
+        _validate(stage, profile)
+        profiles[stage] = {"stage": stage, **profile}
+    return profiles
+
+
+def sample_baseline(profiles: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Occasionally run a request's default-profile stages uncapped.
+
+    Each stage still on its configured default is swapped for a profile without
+    limits with probability GENERATION_BASELINE_SAMPLE_RATE. Stages a request
+    overrode are left alone.
+
+    Args:
+        profiles: Resolved {stage: profile} for one request
+
+    Returns:
+        Profiles to run with
+    """
+    if GENERATION_BASELINE_SAMPLE_RATE <= 0:
+        return profiles
+    defaults = resolve_profiles()
+    sampled = dict(profiles)
+    for stage, profile in profiles.items():
+        if profile == defaults.get(stage) and profile_label(profile) != UNCAPPED \
+                and random.random() < GENERATION_BASELINE_SAMPLE_RATE:
+            sampled[stage] = {"stage": stage, **{field: None for field in _FIELDS}}
+    return sampled
+
+
+def payload_params(profile: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Chat completion fields for a profile (OpenRouter request format).
+
+    Args:
+        profile: Resolved profile, or None for no limits
+
+    Returns:
+        Dict to merge into the request payload
+    """
+    if not profile:
+        return {}
+    params = {}
+    if profile.get("max_tokens"):
+        params["max_tokens"] = profile["max_tokens"]
+    if profile.get("stop"):
+        params["stop"] = profile["stop"]
+
+    reasoning = {}
+    if profile.get("reasoning_effort"):
+        reasoning["effort"] = profile["reasoning_effort"]
+    elif profile.get("reasoning_max_tokens"):
+        reasoning["max_tokens"] = profile["reasoning_max_tokens"]
+    if profile.get("include_reasoning") is False:
+        reasoning["exclude"] = True
+    if reasoning:
+        params["reasoning"] = reasoning
+    return params
+
+
+def profile_label(profile: Optional[Dict[str, Any]]) -> str:
+    """Short name of a profile's limits, e.g. "max_tokens=1500,effort=low"."""
+    params = payload_params(profile)
+    parts = []
+    if "max_tokens" in params:
+        parts.append(f"max_tokens={params['max_tokens']}")
+    reasoning = params.get("reasoning", {})
+    if "effort" in reasoning:
+        parts.append(f"effort={reasoning['effort']}")
+    if "max_tokens" in reasoning:
+        parts.append(f"reasoning_tokens={reasoning['max_tokens']}")
+    if reasoning.get("exclude"):
+        parts.append("no_reasoning_details")
+    if "stop" in params:
+        parts.append("stop")
+    return ",".join(parts) or UNCAPPED
+
+
+# (stage, profile label) -> running totals
+_telemetry: Dict[tuple, Dict[str, float]] = {}
+
+
+def record_call(profile: Optional[Dict[str, Any]], latency: float, usage: Dict[str, Any], truncated: bool = False):
+    """
+    Fold one successful call into its profile's telemetry.
+
+    Args:
+        profile: Resolved profile the call used (calls without one are not tracked)
+        latency: Seconds the call took
+        usage: The response's 'usage' object
+        truncated: Whether generation stopped at max_tokens (finish_reason "length")
+    """
+    if not profile:
+        return
+    key = (profile.get("stage", "unknown"), profile_label(profile))
+    totals = _telemetry.setdefault(key, {
+        "calls": 0, "latency": 0.0, "completion_tokens": 0, "reasoning_tokens": 0, "truncated": 0
+    })
+    details = usage.get("completion_tokens_details") or {}
+    totals["calls"] += 1
+    totals["latency"] += latency
+    totals["completion_tokens"] += usage.get("completion_tokens") or 0
+    totals["reasoning_tokens"] += details.get("reasoning_tokens") or 0
+    totals["truncated"] += int(truncated)
+
+
+def _saving(value: float, baseline: Optional[float]) -> Optional[float]:
+    if not baseline:
+        return None
+    return round(100 * (baseline - value) / baseline, 1)
+
+
+def get_profile_stats() -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Mean latency and tokens per profile, and savings against uncapped calls.
+
+    Returns:
+        {stage: [per-profile dicts]}; 'latency_saved_pct' and
+        'tokens_saved_pct' compare with the stage's uncapped calls and are
+        None until one has been sampled (see sample_baseline)
+    """
+    summary: Dict[str, List[Dict[str, Any]]] = {}
+    for (stage, label), totals in sorted(_telemetry.items()):
+        calls = totals["calls"]
+        summary.setdefault(stage, []).append({
+            "profile": label,
+            "calls": calls,
+            "mean_latency": round(totals["latency"] / calls, 3),
+            "mean_completion_tokens": round(totals["completion_tokens"] / calls, 1),
+            "mean_reasoning_tokens": round(totals["reasoning_tokens"] / calls, 1),
+            "truncated": totals["truncated"],
+        })
+
+    for stage, entries in summary.items():
+        baseline = next((e for e in entries if e["profile"] == UNCAPPED), None)
+        for entry in entries:
+            entry["latency_saved_pct"] = _saving(entry["mean_latency"], baseline and baseline["mean_latency"])
+            # Completion tokens include reasoning tokens
+            entry["tokens_saved_pct"] = _saving(
+                entry["mean_completion_tokens"], baseline and baseline["mean_completion_tokens"]
+            )
+    return summary
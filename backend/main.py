@@ -1,17 +1,20 @@
 """FastAPI backend for LLM Council."""
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
-import uuid
-import json
 import asyncio
+import uuid
+import time
 
-from . import storage
-from .council import run_full_council, generate_conversation_title, stage1_collect_responses, stage2_collect_rankings, stage3_synthesize_final, calculate_aggregate_rankings
-from .config import AVAILABLE_MODELS, COUNCIL_MODELS, CHAIRMAN_MODEL
+from . import storage, stats, profiling, titles, admission, providers, search, generation, degradation, aggregation
+from .serialization import dumps, sse_event
+from .compression import negotiate_encoding, encode_body
+from .tracing import start_trace, span
+from .council import RANKING_MODES, run_full_council, run_council_graph, resolve_council_models, lookup_cached_council, store_cached_council
+from .config import AVAILABLE_MODELS, COUNCIL_MODELS, CHAIRMAN_MODEL, RESPONSE_COMPRESSION_MIN_SIZE, ADMIN_TOKEN, AGGREGATION_METHOD
 
 app = FastAPI(title="LLM Council API")
 
@@ -22,6 +25,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Retry-After"],
 )
 
 
@@ -35,6 +39,14 @@ class SendMessageRequest(BaseModel):
     content: str
     council_models: Optional[List[str]] = None
     chairman_model: Optional[str] = None
+    fast_council: bool = False
+    ranking_mode: Optional[str] = None
+    aggregation_method: Optional[str] = None
+    use_cache: bool = True
+    review_sample_size: Optional[int] = None
+    priority: Optional[str] = None
+    # Per-stage generation limits, e.g. {"stage2": {"max_tokens": 800, "reasoning_effort": "low"}}
+    generation: Optional[Dict[str, Dict[str, Any]]] = None
 
 
 class ConversationMetadata(BaseModel):
@@ -53,6 +65,53 @@ class Conversation(BaseModel):
     messages: List[Dict[str, Any]]
 
 
+def json_response(http_request: Request, content: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Serialize content with the fast serializer and negotiate gzip/br encoding.
+
+    Args:
+        http_request: Incoming request (for Accept-Encoding)
+        content: JSON-serializable response body
+        headers: Extra response headers
+
+    Returns:
+        Pre-serialized JSON response
+    """
+    body = dumps(content)
+    headers = {**(headers or {}), "Vary": "Accept-Encoding"}
+    if len(body) >= RESPONSE_COMPRESSION_MIN_SIZE:
+        encoding = negotiate_encoding(http_request.headers.get("accept-encoding", ""))
+        if encoding:
+            body = encode_body(body, encoding)
+            headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def make_etag(*parts: Any) -> str:
+    """Build a weak ETag from version components."""
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+
+def is_not_modified(http_request: Request, etag: str) -> bool:
+    """Check whether the client's If-None-Match already covers the ETag."""
+    if_none_match = http_request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def not_modified(etag: str) -> Response:
+    """Empty 304 response for a matching conditional GET."""
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+@app.on_event("shutdown")
+def flush_stats():
+    """Write model statistics still held in memory."""
+    stats.flush()
+
+
 @app.get("/")
 async def root():
     """Health check endpoint."""
@@ -69,9 +128,164 @@ async def get_available_models():
     }
 
 
+@app.get("/api/stats/models")
+async def get_model_stats():
+    """Get historical latency, failure rate and peer rank per model."""
+    return {"models": stats.get_model_stats()}
+
+
+@app.get("/api/stats/providers")
+async def get_provider_stats():
+    """Get live latency and error-rate estimates of each model's provider routes."""
+    return {"routes": providers.get_route_stats()}
+
+
+@app.get("/api/stats/generation")
+async def get_generation_stats():
+    """Get mean latency and tokens per stage generation profile, and savings against uncapped calls."""
+    return {"profiles": generation.get_profile_stats()}
+
+
+def generation_profiles(request: SendMessageRequest) -> Dict[str, Dict[str, Any]]:
+    """Resolve a request's generation overrides (400 if invalid)."""
+    try:
+        return generation.resolve_profiles(request.generation)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def validate_ranking_options(request: SendMessageRequest):
+    """Reject unknown ranking modes and aggregation methods, or ones needing numpy without it (400)."""
+    if request.ranking_mode is not None and request.ranking_mode not in RANKING_MODES:
+        raise HTTPException(
+            status_code=400, detail=f"ranking_mode must be one of {', '.join(RANKING_MODES)}"
+        )
+    method = request.aggregation_method or AGGREGATION_METHOD
+    if method not in aggregation.AGGREGATION_METHODS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"aggregation_method must be one of {', '.join(aggregation.AGGREGATION_METHODS)}"
+        )
+    if method != "average" and not aggregation.NUMPY_AVAILABLE:
+        raise HTTPException(status_code=400, detail=f"aggregation_method {method} requires numpy")
+
+
+def require_admin(http_request: Request):
+    """Reject admin requests without the configured X-Admin-Token (404 when none is configured)."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+    if http_request.headers.get("x-admin-token") != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+def client_identity(http_request: Request) -> str:
+    """
+    Caller identity for per-user admission limits: the client address.
+
+    The backend has no user authentication, and a client-supplied header
+    could be rotated to get unlimited slots.
+    """
+    return http_request.client.host if http_request.client else "anonymous"
+
+
+def too_busy(error: admission.AdmissionRejected) -> HTTPException:
+    """429 response for a council request the admission controller turned away."""
+    return HTTPException(
+        status_code=429,
+        detail=f"Council is at capacity ({error.reason}), retry later",
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+def admit(http_request: Request, priority: Optional[str]) -> Optional[admission.Ticket]:
+    """
+    Enqueue a council request with the admission controller.
+
+    Args:
+        http_request: Incoming request (for the caller identity)
+        priority: Priority lane ("interactive" by default, or "batch")
+
+    Returns:
+        Admission ticket to wait on and release, or None if admission is disabled
+    """
+    controller = admission.get_controller()
+    if controller is None:
+        return None
+    lane = priority or admission.DEFAULT_LANE
+    if lane not in admission.LANES:
+        raise HTTPException(status_code=400, detail=f"Unknown priority: {lane}")
+    try:
+        return controller.enqueue(client_identity(http_request), lane)
+    except admission.AdmissionRejected as e:
+        raise too_busy(e)
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    Streaming response that holds an admission ticket until it is sent.
+
+    The ticket is taken before the response is returned, so a full council can
+    still answer 429. Releasing it only inside the stream's generator would
+    leak the slot when the client goes away before the generator first runs.
+    """
+
+    def __init__(self, content: Any, ticket: Optional[admission.Ticket], **kwargs):
+        super().__init__(content, **kwargs)
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.ticket is not None:
+                self.ticket.release()
+
+
+@app.get("/api/admin/admission")
+async def get_admission_status(http_request: Request):
+    """Get running and queued councils per lane, rejection counts and the degradation level."""
+    require_admin(http_request)
+    controller = admission.get_controller()
+    return {
+        "enabled": controller is not None,
+        **(controller.snapshot() if controller else {}),
+        "degradation": degradation.status()
+    }
+
+
+@app.get("/api/admin/slow-requests")
+async def list_slow_requests(http_request: Request):
+    """List recorded slow council requests (requires profiling to be enabled)."""
+    require_admin(http_request)
+    return {"enabled": profiling.PROFILING_ENABLED, "requests": profiling.get_slow_requests()}
+
+
+@app.get("/api/admin/slow-requests/{recording_id}")
+async def get_slow_request(recording_id: str, http_request: Request, format: str = "json"):
+    """
+    Get one slow request's stage timings, CPU profile and asyncio task dumps.
+
+    format=folded returns the CPU profile as collapsed stacks for flamegraph tools.
+    """
+    require_admin(http_request)
+    if format == "folded":
+        folded = profiling.folded_profile(recording_id)
+        if folded is None:
+            raise HTTPException(status_code=404, detail="Recording not found")
+        return PlainTextResponse(folded)
+    recording = profiling.get_slow_request(recording_id)
+    if recording is None:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    return json_response(http_request, recording)
+
+
 @app.get("/api/conversations", response_model=List[ConversationMetadata])
-async def list_conversations():
-    """List all conversations (metadata only)."""
+async def list_conversations(http_request: Request, response: Response):
+    """List all conversations (metadata only). Supports If-None-Match."""
+    etag = make_etag("list", storage.get_list_version())
+    if is_not_modified(http_request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
     return storage.list_conversations()
 
 
@@ -83,17 +297,79 @@ async def create_conversation(request: CreateConversationRequest):
     return conversation
 
 
-@app.get("/api/conversations/{conversation_id}", response_model=Conversation)
-async def get_conversation(conversation_id: str):
-    """Get a specific conversation with all its messages."""
-    conversation = storage.get_conversation(conversation_id)
+@app.get("/api/search")
+async def search_conversations(q: str, limit: int = 20, stage1: bool = True):
+    """
+    Search past queries and council answers.
+
+    Results are ranked by relevance, with highlighted snippets.
+    stage1=false leaves out individual council members' answers.
+    """
+    start = time.monotonic()
+    results = search.search(q, limit=max(1, min(limit, 100)), include_stage1=stage1)
+    return {
+        "query": q,
+        "results": results,
+        "took_ms": round((time.monotonic() - start) * 1000, 2)
+    }
+
+
+@app.get("/api/conversations/{conversation_id}")
+async def get_conversation(
+    conversation_id: str,
+    http_request: Request,
+    view: str = "full",
+    offset: int = 0,
+    limit: Optional[int] = None
+):
+    """
+    Get a specific conversation with its messages.
+
+    view=slim omits Stage 1 / Stage 2 payloads (fetch them per message from
+    /messages/{index}/details); offset/limit select a message range.
+    The stored dict is returned as-is, without response_model revalidation.
+    Supports If-None-Match against the conversation version.
+    """
+    if view not in ("full", "slim"):
+        raise HTTPException(status_code=400, detail="view must be 'full' or 'slim'")
+    conversation = storage.get_conversation_view(conversation_id, view=view, offset=offset, limit=limit)
     if conversation is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    return conversation
+
+    etag = make_etag("conv", conversation_id, conversation.get("version", 0))
+    if is_not_modified(http_request, etag):
+        return not_modified(etag)
+    return json_response(http_request, conversation, headers={"ETag": etag})
+
+
+@app.get("/api/conversations/{conversation_id}/delta")
+async def get_conversation_delta(conversation_id: str, since_version: int, http_request: Request):
+    """
+    Get the title and messages appended after a known conversation version.
+
+    Returns 304 when nothing changed since since_version.
+    """
+    delta = storage.get_conversation_delta(conversation_id, since_version)
+    if delta is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    etag = make_etag("conv", conversation_id, delta["version"])
+    if delta["version"] == since_version or is_not_modified(http_request, etag):
+        return not_modified(etag)
+    return json_response(http_request, delta, headers={"ETag": etag})
+
+
+@app.get("/api/conversations/{conversation_id}/messages/{message_index}/details")
+async def get_message_details(conversation_id: str, message_index: int, http_request: Request):
+    """Get the Stage 1 / Stage 2 details of one assistant message."""
+    details = storage.get_message_details(conversation_id, message_index)
+    if details is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return json_response(http_request, details)
 
 
 @app.post("/api/conversations/{conversation_id}/message")
-async def send_message(conversation_id: str, request: SendMessageRequest):
+async def send_message(conversation_id: str, request: SendMessageRequest, http_request: Request):
     """
     Send a message and run the 3-stage council process.
     Returns the complete response with all stages.
@@ -103,43 +379,66 @@ async def send_message(conversation_id: str, request: SendMessageRequest):
     if conversation is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    # Check if this is the first message
-    is_first_message = len(conversation["messages"]) == 0
+    generation_profiles(request)
+    validate_ranking_options(request)
+    ticket = admit(http_request, request.priority)
+    try:
+        with start_trace("council.request", conversation_id=conversation_id), \
+                profiling.record("council", conversation_id=conversation_id, streaming=False):
+            if ticket is not None:
+                with span("admission.wait", lane=ticket.lane):
+                    try:
+                        async for _ in ticket.wait():
+                            pass
+                    except admission.AdmissionRejected as e:
+                        raise too_busy(e)
+
+            # Check if this is the first message
+            is_first_message = len(conversation["messages"]) == 0
 
-    # Add user message
-    storage.add_user_message(conversation_id, request.content)
-
-    # If this is the first message, generate a title
-    if is_first_message:
-        title = await generate_conversation_title(request.content)
-        storage.update_conversation_title(conversation_id, title)
+            # Add user message
+            storage.add_user_message(conversation_id, request.content)
 
-    # Run the 3-stage council process
-    stage1_results, stage2_results, stage3_result, metadata = await run_full_council(
-        request.content,
-        council_models=request.council_models,
-        chairman_model=request.chairman_model
-    )
+            # If this is the first message, title it locally (refined in the background)
+            if is_first_message:
+                titles.assign_initial_title(conversation_id, request.content)
+
+            # Run the 3-stage council process
+            stage1_results, stage2_results, stage3_result, metadata = await run_full_council(
+                request.content,
+                council_models=request.council_models,
+                chairman_model=request.chairman_model,
+                fast_council=request.fast_council,
+                ranking_mode=request.ranking_mode,
+                aggregation_method=request.aggregation_method,
+                use_cache=request.use_cache,
+                review_sample_size=request.review_sample_size,
+                generation_overrides=request.generation
+            )
 
-    # Add assistant message with all stages
-    storage.add_assistant_message(
-        conversation_id,
-        stage1_results,
-        stage2_results,
-        stage3_result
-    )
+            # Add assistant message with all stages
+            storage.add_assistant_message(
+                conversation_id,
+                stage1_results,
+                stage2_results,
+                stage3_result,
+                metadata
+            )
 
-    # Return the complete response with metadata
-    return {
-        "stage1": stage1_results,
-        "stage2": stage2_results,
-        "stage3": stage3_result,
-        "metadata": metadata
-    }
+            # Return the complete response with metadata
+            return {
+                "stage1": stage1_results,
+                "stage2": stage2_results,
+                "stage3": stage3_result,
+                "metadata": metadata
+            }
+    finally:
+        if ticket is not None:
+            ticket.release()
 
 
 @app.post("/api/conversations/{conversation_id}/message/stream")
-async def send_message_stream(conversation_id: str, request: SendMessageRequest):
+async def send_message_stream(conversation_id: str, request: SendMessageRequest, http_request: Request):
     """
     Send a message and stream the 3-stage council process.
     Returns Server-Sent Events as each stage completes.
@@ -152,55 +451,95 @@ async def send_message_stream(conversation_id: str, request: SendMessageRequest)
     # Check if this is the first message
     is_first_message = len(conversation["messages"]) == 0
 
-    async def event_generator():
-        try:
-            # Add user message
-            storage.add_user_message(conversation_id, request.content)
+    council_models = resolve_council_models(request.council_models, request.fast_council)
+    profiles = generation_profiles(request)
+    validate_ranking_options(request)
 
-            # Start title generation in parallel (don't await yet)
-            title_task = None
-            if is_first_message:
-                title_task = asyncio.create_task(generate_conversation_title(request.content))
-
-            # Stage 1: Collect responses
-            yield f"data: {json.dumps({'type': 'stage1_start'})}\n\n"
-            stage1_results = await stage1_collect_responses(request.content, models=request.council_models)
-            yield f"data: {json.dumps({'type': 'stage1_complete', 'data': stage1_results})}\n\n"
-
-            # Stage 2: Collect rankings
-            yield f"data: {json.dumps({'type': 'stage2_start'})}\n\n"
-            stage2_results, label_to_model = await stage2_collect_rankings(request.content, stage1_results, models=request.council_models)
-            aggregate_rankings = calculate_aggregate_rankings(stage2_results, label_to_model)
-            yield f"data: {json.dumps({'type': 'stage2_complete', 'data': stage2_results, 'metadata': {'label_to_model': label_to_model, 'aggregate_rankings': aggregate_rankings}})}\n\n"
-
-            # Stage 3: Synthesize final answer
-            yield f"data: {json.dumps({'type': 'stage3_start'})}\n\n"
-            stage3_result = await stage3_synthesize_final(request.content, stage1_results, stage2_results, chairman_model=request.chairman_model)
-            yield f"data: {json.dumps({'type': 'stage3_complete', 'data': stage3_result})}\n\n"
-
-            # Wait for title generation if it was started
-            if title_task:
-                title = await title_task
-                storage.update_conversation_title(conversation_id, title)
-                yield f"data: {json.dumps({'type': 'title_complete', 'data': {'title': title}})}\n\n"
-
-            # Save complete assistant message
-            storage.add_assistant_message(
-                conversation_id,
-                stage1_results,
-                stage2_results,
-                stage3_result
-            )
+    # Turned away with a 429 before the stream starts; queue position is streamed.
+    # The response releases the ticket even if the stream never runs
+    ticket = admit(http_request, request.priority)
 
-            # Send completion event
-            yield f"data: {json.dumps({'type': 'complete'})}\n\n"
-
-        except Exception as e:
-            # Send error event
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
-
-    return StreamingResponse(
+    async def event_generator():
+        with start_trace("council.request", conversation_id=conversation_id, streaming=True), \
+                profiling.record("council", conversation_id=conversation_id, streaming=True):
+            try:
+                if ticket is not None:
+                    with span("admission.wait", lane=ticket.lane):
+                        async for status in ticket.wait():
+                            yield sse_event({'type': 'queued', 'data': status})
+
+                started_at = time.monotonic()
+
+                # Add user message
+                storage.add_user_message(conversation_id, request.content)
+
+                # Title it locally right away (refined in the background)
+                if is_first_message:
+                    title = titles.assign_initial_title(conversation_id, request.content)
+                    yield sse_event({'type': 'title_complete', 'data': {'title': title}})
+
+                # A near-duplicate earlier query answers without running any stage
+                cached = None
+                if request.use_cache:
+                    cached = lookup_cached_council(
+                        request.content, council_models, request.chairman_model, request.ranking_mode,
+                        request.aggregation_method, request.review_sample_size, profiles
+                    )
+
+                if cached is not None:
+                    stage1_results, stage2_results, stage3_result, metadata = cached
+                    yield sse_event({'type': 'stage1_complete', 'data': stage1_results})
+                    yield sse_event({'type': 'stage2_complete', 'data': stage2_results, 'metadata': metadata})
+                    yield sse_event({'type': 'stage3_complete', 'data': stage3_result})
+                else:
+                    # Run the council graph, streaming its progress events as they arrive
+                    events: asyncio.Queue = asyncio.Queue()
+                    council = asyncio.ensure_future(run_council_graph(
+                        request.content, council_models, request.chairman_model, request.ranking_mode,
+                        request.aggregation_method, request.review_sample_size, started_at,
+                        on_progress=events.put_nowait, profiles=profiles
+                    ))
+                    council.add_done_callback(lambda _: events.put_nowait(None))
+                    try:
+                        while (event := await events.get()) is not None:
+                            yield sse_event(event)
+                        stage1_results, stage2_results, stage3_result, metadata = council.result()
+                    finally:
+                        # Client gone mid-run: stop the model calls still in flight
+                        council.cancel()
+
+                    store_cached_council(
+                        request.content, council_models, request.chairman_model,
+                        stage1_results, stage2_results, stage3_result, metadata,
+                        request.ranking_mode, request.aggregation_method, request.review_sample_size, profiles
+                    )
+
+                # Save complete assistant message
+                storage.add_assistant_message(
+                    conversation_id,
+                    stage1_results,
+                    stage2_results,
+                    stage3_result,
+                    metadata
+                )
+
+                # Send completion event
+                yield sse_event({'type': 'complete'})
+
+            except admission.AdmissionRejected as e:
+                yield sse_event({'type': 'error', 'message': 'Council is at capacity, retry later', 'retry_after': e.retry_after})
+
+            except Exception as e:
+                # Send error event
+                yield sse_event({'type': 'error', 'message': str(e)})
+
+            finally:
+                if ticket is not None:
+                    ticket.release()
+
+    return AdmittedStreamingResponse(
         event_generator(),
+        ticket,
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
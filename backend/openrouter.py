@@ -1,79 +1,145 @@
-"""OpenRouter API client for making LLM requests."""
+"""Client for making LLM requests (OpenRouter and other OpenAI-compatible providers)."""
 
+import asyncio
+import hashlib
+import json
+import time
 import httpx
 from typing import List, Dict, Any, Optional
-from .config import OPENROUTER_API_KEY, OPENROUTER_API_URL
+from . import stats, providers, generation
+from .cassette import get_cassette
+from .tracing import span
+
+# In-flight upstream requests keyed by (model, messages, options), shared by
+# concurrent identical calls (single-flight)
+_inflight: Dict[str, "asyncio.Task"] = {}
 
 
 async def query_model(
     model: str,
     messages: List[Dict[str, str]],
-    timeout: float = 120.0
+    timeout: float = 120.0,
+    response_format: Optional[Dict[str, Any]] = None,
+    profile: Optional[Dict[str, Any]] = None,
+    plugins: Optional[List[Dict[str, Any]]] = None
 ) -> Optional[Dict[str, Any]]:
     """
-    Query a single model via OpenRouter API.
+    Query a single model via its providers (OpenRouter unless MODEL_ROUTES says otherwise).
 
     Args:
-        model: OpenRouter model identifier (e.g., "openai/gpt-4o")
+        model: Council model identifier (e.g., "openai/gpt-4o")
         messages: List of message dicts with 'role' and 'content'
-        timeout: Request timeout in seconds
+        timeout: Request timeout in seconds, shared by all provider attempts
+        response_format: Optional OpenRouter response_format (e.g. a JSON schema)
+        profile: Optional generation profile (output and reasoning limits)
+        plugins: Optional OpenRouter plugins (e.g. [{"id": "web"}])
 
     Returns:
-        Response dict with 'content' and optional 'reasoning_details', or None if failed
+        Response dict with 'content', optional 'reasoning_details' and, when
+        the reply cites sources, 'annotations'; None if failed
     """
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-    }
-
     payload = {
         "model": model,
         "messages": messages,
     }
-
-    try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            response = await client.post(
-                OPENROUTER_API_URL,
-                headers=headers,
-                json=payload
-            )
-            response.raise_for_status()
-
-            data = response.json()
-            message = data['choices'][0]['message']
-
-            return {
-                'content': message.get('content'),
-                'reasoning_details': message.get('reasoning_details')
-            }
-
-    except Exception as e:
-        print(f"Error querying model {model}: {e}")
-        return None
-
-
-async def query_models_parallel(
-    models: List[str],
-    messages: List[Dict[str, str]]
-) -> Dict[str, Optional[Dict[str, Any]]]:
+    if response_format is not None:
+        payload["response_format"] = response_format
+    if plugins:
+        payload["plugins"] = plugins
+    payload.update(generation.payload_params(profile))
+
+    prompt_chars = sum(len(message.get('content') or '') for message in messages)
+    with span("openrouter.call", model=model, prompt_chars=prompt_chars) as call_span:
+        cassette = get_cassette()
+        if cassette is not None and cassette.mode == "replay":
+            call_span.set_attribute("replayed", True)
+            return await cassette.replay(payload)
+
+        start = time.monotonic()
+        try:
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                data, route = await providers.post_chat_completion(client, model, payload, timeout)
+
+                choice = data['choices'][0]
+                message = choice['message']
+                usage = data.get('usage') or {}
+                call_span.set_attributes(
+                    provider=route.provider,
+                    prompt_tokens=usage.get('prompt_tokens'),
+                    completion_tokens=usage.get('completion_tokens'),
+                    response_chars=len(message.get('content') or ''),
+                    profile=generation.profile_label(profile) if profile else None
+                )
+
+                latency = time.monotonic() - start
+                stats.record_model_call(model, latency, success=True)
+                generation.record_call(profile, latency, usage, truncated=choice.get('finish_reason') == 'length')
+
+                result = {
+                    'content': message.get('content'),
+                    'reasoning_details': message.get('reasoning_details')
+                }
+                if message.get('annotations'):
+                    result['annotations'] = message['annotations']
+                if cassette is not None:
+                    cassette.record(payload, result, latency)
+                return result
+
+        except Exception as e:
+            print(f"Error querying model {model}: {e}")
+            call_span.record_error(e)
+            latency = time.monotonic() - start
+            stats.record_model_call(model, latency, success=False)
+            if cassette is not None:
+                cassette.record(payload, None, latency, error=f"{type(e).__name__}: {e}")
+            return None
+
+
+def _request_key(model: str, messages: List[Dict[str, str]], options: Dict[str, Any]) -> str:
+    """Stable key identifying an upstream request."""
+    canonical = json.dumps([model, messages, options], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+async def query_model_coalesced(
+    model: str,
+    messages: List[Dict[str, str]],
+    timeout: float = 120.0,
+    response_format: Optional[Dict[str, Any]] = None,
+    profile: Optional[Dict[str, Any]] = None
+) -> Optional[Dict[str, Any]]:
     """
-    Query multiple models in parallel.
+    Query a model, sharing one upstream request among identical concurrent calls.
+
+    If an identical request (same model, messages and options) is already in
+    flight, this awaits its result instead of sending another request. The
+    shared request runs as its own task, so a cancelled caller does not
+    cancel it for the others.
 
     Args:
-        models: List of OpenRouter model identifiers
-        messages: List of message dicts to send to each model
+        model: OpenRouter model identifier
+        messages: List of message dicts with 'role' and 'content'
+        timeout: Request timeout in seconds (used by the first caller only)
+        response_format: Optional OpenRouter response_format
+        profile: Optional generation profile
 
     Returns:
-        Dict mapping model identifier to response dict (or None if failed)
+        Response dict (shared between callers, treat as read-only), or None if failed
     """
-    import asyncio
-
-    # Create tasks for all models
-    tasks = [query_model(model, messages) for model in models]
-
-    # Wait for all to complete
-    responses = await asyncio.gather(*tasks)
-
-    # Map models to their responses
-    return {model: response for model, response in zip(models, responses)}
+    key = _request_key(model, messages, {
+        "response_format": response_format, **generation.payload_params(profile)
+    })
+
+    task = _inflight.get(key)
+    if task is not None:
+        # Joining a request another caller already sent
+        with span("openrouter.coalesced_wait", model=model):
+            return await asyncio.shield(task)
+
+    task = asyncio.ensure_future(
+        query_model(model, messages, timeout=timeout, response_format=response_format, profile=profile)
+    )
+    _inflight[key] = task
+    task.add_done_callback(lambda _: _inflight.pop(key, None))
+
+    return await asyncio.shield(task)
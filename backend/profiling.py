@@ -0,0 +1,228 @@
+"""Opt-in profiling and slow-request flight recorder.
+
+While a council request is in flight, a background thread samples the stack
+of the thread running the event loop every PROFILING_SAMPLE_INTERVAL
+seconds. Samples are kept as collapsed ("folded") stacks, the input format
+of flamegraph.pl and speedscope. Once a request exceeds PROFILING_SLOW_SECONDS,
+the sampler also asks the event loop for a dump of all pending asyncio tasks
+and measures how long that callback waited to run. That delay is the
+event-loop lag, which is high when something blocks the loop.
+
+When a slow request finishes, its CPU profile, task dumps, loop lag and
+per-stage timings go into a bounded ring buffer of the last
+PROFILING_RING_SIZE slow councils. Fast requests are discarded. The buffer
+is served by the admin endpoints in main.py.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+from .config import (
+    PROFILING_ENABLED,
+    PROFILING_SLOW_SECONDS,
+    PROFILING_SAMPLE_INTERVAL,
+    PROFILING_RING_SIZE,
+)
+
+# Deepest stack kept per sample (innermost frames are kept)
+_MAX_STACK_DEPTH = 64
+
+
+class Recording:
+    """Profiling state of one in-flight request."""
+
+    def __init__(self, name: str, attributes: Dict[str, Any], loop: asyncio.AbstractEventLoop):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.attributes = attributes
+        self.loop = loop
+        self.thread_id = threading.get_ident()
+        self.started_at = datetime.utcnow().isoformat()
+        self.start = time.monotonic()
+        self.end: Optional[float] = None
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.stages: List[Dict[str, Any]] = []
+        self.task_dumps: List[Dict[str, Any]] = []
+        self.dump_requested = False
+
+    def elapsed(self) -> float:
+        return (self.end or time.monotonic()) - self.start
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration": round(self.elapsed(), 3),
+            "attributes": self.attributes,
+            "stages": self.stages,
+            "samples": self.sample_count,
+            "max_loop_lag": max((dump["loop_lag"] for dump in self.task_dumps), default=None),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            **self.summary(),
+            "sample_interval": PROFILING_SAMPLE_INTERVAL,
+            "profile": [
+                {"stack": stack, "count": count}
+                for stack, count in self.samples.most_common(200)
+            ],
+            "task_dumps": self.task_dumps,
+        }
+
+
+_active: Dict[str, Recording] = {}
+_active_lock = threading.Lock()
+_slow: "deque[Dict[str, Any]]" = deque(maxlen=PROFILING_RING_SIZE)
+_sampler: Optional[threading.Thread] = None
+_current: ContextVar[Optional[Recording]] = ContextVar("profiling_recording", default=None)
+
+
+def _fold(frame) -> str:
+    """Collapse a frame chain into "outer;...;inner" function names."""
+    names = []
+    while frame is not None and len(names) < _MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _dump_tasks(recording: Recording, requested_at: float):
+    """Runs on the event loop: snapshot every pending task's stack."""
+    lag = time.monotonic() - requested_at
+    tasks = []
+    for task in asyncio.all_tasks(recording.loop):
+        stack = task.get_stack(limit=8)
+        tasks.append({
+            "task": task.get_name(),
+            "coroutine": getattr(task.get_coro(), "__qualname__", repr(task.get_coro())),
+            "stack": [f"{f.f_code.co_name} ({f.f_code.co_filename.rsplit('/', 1)[-1]}:{f.f_lineno})" for f in stack],
+        })
+    recording.task_dumps.append({
+        "at": round(recording.elapsed(), 3),
+        "loop_lag": round(lag, 4),
+        "tasks": tasks,
+    })
+
+
+def _sample_loop():
+    while True:
+        time.sleep(PROFILING_SAMPLE_INTERVAL)
+        with _active_lock:
+            recordings = list(_active.values())
+        if not recordings:
+            continue
+
+        frames = sys._current_frames()
+        for recording in recordings:
+            frame = frames.get(recording.thread_id)
+            if frame is not None:
+                recording.samples[_fold(frame)] += 1
+                recording.sample_count += 1
+
+            if not recording.dump_requested and recording.elapsed() >= PROFILING_SLOW_SECONDS:
+                recording.dump_requested = True
+                try:
+                    recording.loop.call_soon_threadsafe(_dump_tasks, recording, time.monotonic())
+                except RuntimeError:
+                    pass
+
+
+def _ensure_sampler():
+    global _sampler
+    if _sampler is None:
+        _sampler = threading.Thread(target=_sample_loop, name="profiling-sampler", daemon=True)
+        _sampler.start()
+
+
+@contextmanager
+def record(name: str, **attributes: Any):
+    """
+    Profile a request; keep the recording in the ring buffer if it turns out slow.
+
+    Must be entered from a coroutine running on the event loop. Does nothing
+    unless PROFILING_ENABLED.
+
+    Args:
+        name: Request kind (e.g. "council")
+        **attributes: Request attributes stored with the recording
+    """
+    if not PROFILING_ENABLED:
+        yield None
+        return
+
+    recording = Recording(name, attributes, asyncio.get_running_loop())
+    _ensure_sampler()
+    with _active_lock:
+        _active[recording.id] = recording
+    token = _current.set(recording)
+    try:
+        yield recording
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            _current.set(None)
+        with _active_lock:
+            _active.pop(recording.id, None)
+        recording.end = time.monotonic()
+        if recording.elapsed() >= PROFILING_SLOW_SECONDS:
+            _slow.appendleft(recording.to_dict())
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time one stage of the current recording (no-op when not profiling).
+
+    Args:
+        name: Stage name (e.g. "stage1")
+    """
+    recording = _current.get()
+    if recording is None:
+        yield
+        return
+    start = recording.elapsed()
+    try:
+        yield
+    finally:
+        recording.stages.append({
+            "stage": name,
+            "start": round(start, 3),
+            "duration": round(recording.elapsed() - start, 3),
+        })
+
+
+def get_slow_requests() -> List[Dict[str, Any]]:
+    """Summaries of the recorded slow requests, newest first."""
+    return [
+        {key: value for key, value in entry.items() if key not in ("profile", "task_dumps", "sample_interval")}
+        for entry in _slow
+    ]
+
+
+def get_slow_request(recording_id: str) -> Optional[Dict[str, Any]]:
+    """Full recording (profile, task dumps, stage timings) of one slow request."""
+    for entry in _slow:
+        if entry["id"] == recording_id:
+            return entry
+    return None
+
+
+def folded_profile(recording_id: str) -> Optional[str]:
+    """A slow request's CPU profile in collapsed-stack text format."""
+    entry = get_slow_request(recording_id)
+    if entry is None:
+        return None
+    return "\n".join(f"{sample['stack']} {sample['count']}" for sample in entry["profile"])
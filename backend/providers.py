@@ -0,0 +1,213 @@
+"""Routing of model calls across OpenAI-compatible providers.
+
+Each council model maps to one or more routes (MODEL_ROUTES). A route is a
+provider endpoint (OpenRouter, a vendor API, a self-hosted server) plus the
+model id that endpoint expects. Models without an entry go to OpenRouter
+under their own id. Routes whose provider has no API key configured are
+skipped.
+
+For every route we keep an EWMA of latency and of the error rate. A call
+tries routes in order of expected cost: latency inflated by the error rate.
+Untried routes use the default latency, and routes listed earlier win ties.
+When a route fails, the call moves on to the next one while time remains.
+After several failures in a row a route is benched for a cooldown. Now and
+then a call goes to the second-best route first, so that route's latency
+estimate stays current.
+"""
+
+import os
+import random
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+import httpx
+
+from .config import (
+    PROVIDERS,
+    MODEL_ROUTES,
+    PROVIDER_DEFAULT_LATENCY,
+    PROVIDER_ERROR_PENALTY,
+    PROVIDER_FAILURE_THRESHOLD,
+    PROVIDER_COOLDOWN_SECONDS,
+    PROVIDER_EXPLORE_RATE,
+)
+from .tracing import span
+
+# Weight of the newest observation in the latency and error EWMAs
+_EWMA_ALPHA = 0.3
+
+
+class Route:
+    """One way of serving a council model: a provider endpoint and its model id."""
+
+    def __init__(self, provider: str, model: str, url: str, api_key: Optional[str], reasoning: Optional[str] = None):
+        self.provider = provider
+        self.model = model
+        self.url = url
+        self.api_key = api_key
+        self.reasoning = reasoning
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.calls = 0
+        self.failures = 0
+
+    def expected_cost(self) -> float:
+        """Expected seconds per successful call."""
+        latency = PROVIDER_DEFAULT_LATENCY if self.latency_ewma is None else self.latency_ewma
+        return latency * (1 + PROVIDER_ERROR_PENALTY * self.error_ewma)
+
+    def cooling_down(self, now: float) -> bool:
+        return now < self.cooldown_until
+
+    def record(self, latency: float, success: bool):
+        """Fold one call's outcome into the route's EWMAs."""
+        self.calls += 1
+        self.error_ewma += _EWMA_ALPHA * ((0.0 if success else 1.0) - self.error_ewma)
+        if success:
+            self.consecutive_failures = 0
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma += _EWMA_ALPHA * (latency - self.latency_ewma)
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= PROVIDER_FAILURE_THRESHOLD:
+                self.cooldown_until = time.monotonic() + PROVIDER_COOLDOWN_SECONDS
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "calls": self.calls,
+            "failures": self.failures,
+            "latency_ewma": None if self.latency_ewma is None else round(self.latency_ewma, 3),
+            "error_ewma": round(self.error_ewma, 3),
+            "cooling_down": self.cooling_down(time.monotonic()),
+        }
+
+
+# Council model -> its routes, built on first use
+_routes: Dict[str, List[Route]] = {}
+
+
+def _make_route(provider: str, model: str) -> Optional[Route]:
+    config = PROVIDERS.get(provider)
+    if config is None:
+        print(f"Unknown provider {provider!r} in MODEL_ROUTES")
+        return None
+    key_env = config.get("api_key_env")
+    api_key = os.getenv(key_env) if key_env else None
+    if key_env and not api_key and not config.get("key_optional"):
+        return None
+    return Route(provider, model, config["url"], api_key, config.get("reasoning"))
+
+
+def get_routes(model: str) -> List[Route]:
+    """
+    Routes configured for a council model, in configuration order.
+
+    Args:
+        model: Council model identifier (e.g. "openai/gpt-5.2")
+
+    Returns:
+        Usable routes; OpenRouter under the same id if none are configured
+    """
+    routes = _routes.get(model)
+    if routes is None:
+        configured = MODEL_ROUTES.get(model) or [("openrouter", model)]
+        routes = [r for r in (_make_route(p, m) for p, m in configured) if r is not None]
+        if not routes:
+            routes = [Route("openrouter", model, PROVIDERS["openrouter"]["url"], os.getenv("OPENROUTER_API_KEY"),
+                            PROVIDERS["openrouter"].get("reasoning"))]
+        _routes[model] = routes
+    return routes
+
+
+def ranked_routes(model: str) -> List[Route]:
+    """A council model's routes in the order to try them."""
+    now = time.monotonic()
+    routes = get_routes(model)
+    order = sorted(
+        range(len(routes)),
+        key=lambda i: (routes[i].cooling_down(now), routes[i].expected_cost(), i)
+    )
+    ranked = [routes[i] for i in order]
+    if len(ranked) > 1 and not ranked[1].cooling_down(now) and random.random() < PROVIDER_EXPLORE_RATE:
+        ranked[0], ranked[1] = ranked[1], ranked[0]
+    return ranked
+
+
+def route_payload(route: Route, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """The request body for one route: its model id, and reasoning limits in its dialect."""
+    body = {**payload, "model": route.model}
+    reasoning = body.pop("reasoning", None)
+    if reasoning and route.reasoning == "openrouter":
+        body["reasoning"] = reasoning
+    elif reasoning and route.reasoning == "effort" and reasoning.get("effort"):
+        body["reasoning_effort"] = reasoning["effort"]
+    return body
+
+
+async def post_chat_completion(
+    client: httpx.AsyncClient,
+    model: str,
+    payload: Dict[str, Any],
+    timeout: float
+) -> Tuple[Dict[str, Any], Route]:
+    """
+    Send a chat completion, failing over across the model's routes.
+
+    Args:
+        client: HTTP client to send with
+        model: Council model identifier
+        payload: OpenAI-style request body (its 'model' is replaced per route)
+        timeout: Overall budget in seconds across all attempts
+
+    Returns:
+        (parsed response body, route that served it)
+
+    Raises:
+        Exception: The last route's error if every route failed
+    """
+    deadline = time.monotonic() + timeout
+    last_error: Optional[Exception] = None
+
+    for attempt, route in enumerate(ranked_routes(model), start=1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        headers = {"Content-Type": "application/json"}
+        if route.api_key:
+            headers["Authorization"] = f"Bearer {route.api_key}"
+
+        with span("provider.attempt", provider=route.provider, model=route.model, attempt=attempt) as attempt_span:
+            start = time.monotonic()
+            try:
+                response = await client.post(
+                    route.url,
+                    headers=headers,
+                    json=route_payload(route, payload),
+                    timeout=remaining
+                )
+                response.raise_for_status()
+                data = response.json()
+                if not data.get('choices'):
+                    raise ValueError(f"Response without choices: {str(data)[:200]}")
+            except Exception as e:
+                route.record(time.monotonic() - start, success=False)
+                attempt_span.record_error(e)
+                print(f"Provider {route.provider} failed for {model}: {e}")
+                last_error = e
+                continue
+            route.record(time.monotonic() - start, success=True)
+            return data, route
+
+    raise last_error or TimeoutError(f"No route for {model} within {timeout}s")
+
+
+def get_route_stats() -> Dict[str, List[Dict[str, Any]]]:
+    """Live latency/error estimates of every route used so far, per council model."""
+    return {model: [route.to_dict() for route in routes] for model, routes in _routes.items()}
@@ -0,0 +1,219 @@
+"""Shared web retrieval for stage 1.
+
+A council query is searched once, not once per council member. The top
+sources go into one compact context block, and every member's stage 1
+prompt gets that same block, so all members reason from identical sources.
+
+Search backends are async functions (query, max_results) -> sources, where
+each source is {'title', 'url', 'snippet'}. They are registered by name and
+selected with RETRIEVAL_BACKEND:
+- "openrouter": one query_model call to RETRIEVAL_MODEL with OpenRouter's
+  web plugin (so it is routed, recorded by the cassette and counted in the
+  model and generation statistics like any model call). The sources are the
+  url_citation annotations of its reply.
+- "local": word-overlap search of a JSON list of {'title', 'url', 'text'}
+  documents at RETRIEVAL_LOCAL_PATH. Use it for tests and offline runs.
+- "none": no retrieval.
+
+Results are cached in process by normalized query (lowercased, punctuation
+and extra whitespace removed) for RETRIEVAL_CACHE_TTL seconds. Identical
+searches in flight at the same time share one backend call.
+"""
+
+import asyncio
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Any, Optional
+
+from .config import (
+    RETRIEVAL_BACKEND,
+    RETRIEVAL_MODEL,
+    RETRIEVAL_MAX_RESULTS,
+    RETRIEVAL_SNIPPET_CHARS,
+    RETRIEVAL_TIMEOUT,
+    RETRIEVAL_CACHE_TTL,
+    RETRIEVAL_CACHE_MAX_ENTRIES,
+    RETRIEVAL_LOCAL_PATH,
+)
+from .openrouter import query_model
+from .tracing import span
+from . import generation
+
+SearchBackend = Callable[[str, int], Awaitable[List[Dict[str, str]]]]
+
+_backends: Dict[str, SearchBackend] = {}
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def register_backend(name: str, backend: SearchBackend):
+    """
+    Make a search backend selectable as RETRIEVAL_BACKEND (or per call).
+
+    Args:
+        name: Backend name
+        backend: async (query, max_results) -> [{'title', 'url', 'snippet'}]
+    """
+    _backends[name] = backend
+
+
+def normalize_query(query: str) -> str:
+    """Cache key form of a query: lowercased words separated by single spaces."""
+    return " ".join(_WORD_RE.findall(query.lower()))
+
+
+def _snippet(text: str) -> str:
+    text = " ".join((text or "").split())
+    if len(text) <= RETRIEVAL_SNIPPET_CHARS:
+        return text
+    return text[:RETRIEVAL_SNIPPET_CHARS].rsplit(" ", 1)[0] + "..."
+
+
+async def _openrouter_search(query: str, max_results: int) -> List[Dict[str, str]]:
+    """One web-plugin call; its url_citation annotations are the sources."""
+    message = await query_model(
+        RETRIEVAL_MODEL,
+        [{"role": "user", "content": f"Search the web for: {query}\n\nSummarize what you find in two sentences."}],
+        timeout=RETRIEVAL_TIMEOUT,
+        profile=generation.resolve_profiles()["retrieval"],
+        plugins=[{"id": "web", "max_results": max_results}]
+    )
+    if message is None:
+        raise RuntimeError(f"Search call to {RETRIEVAL_MODEL} failed")
+
+    sources, seen = [], set()
+    for annotation in message.get('annotations') or []:
+        citation = annotation.get('url_citation') or {}
+        url = citation.get('url')
+        if annotation.get('type') != 'url_citation' or not url or url in seen:
+            continue
+        seen.add(url)
+        sources.append({"title": citation.get('title') or url, "url": url, "snippet": citation.get('content') or ''})
+    if sources and not any(source["snippet"] for source in sources):
+        # Some engines cite without excerpts: keep the model's summary as context
+        sources[0]["snippet"] = message.get('content') or ''
+    return sources[:max_results]
+
+
+_local_documents: Optional[List[Dict[str, Any]]] = None
+
+
+async def _local_search(query: str, max_results: int) -> List[Dict[str, str]]:
+    """Documents sharing the most words with the query (RETRIEVAL_LOCAL_PATH)."""
+    global _local_documents
+    if _local_documents is None:
+        with open(RETRIEVAL_LOCAL_PATH, encoding="utf-8") as f:
+            _local_documents = [
+                {**document, "words": set(_WORD_RE.findall(f"{document.get('title', '')} {document['text']}".lower()))}
+                for document in json.load(f)
+            ]
+    words = set(normalize_query(query).split())
+    scored = sorted(
+        ((len(words & document["words"]), position) for position, document in enumerate(_local_documents)),
+        key=lambda item: (-item[0], item[1])
+    )
+    return [
+        {
+            "title": _local_documents[position].get("title", ""),
+            "url": _local_documents[position].get("url", ""),
+            "snippet": _local_documents[position]["text"],
+        }
+        for score, position in scored[:max_results]
+        if score > 0
+    ]
+
+
+register_backend("openrouter", _openrouter_search)
+register_backend("local", _local_search)
+
+# (backend, normalized query) -> (expiry time, sources)
+_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_in_flight: Dict[tuple, "asyncio.Future"] = {}
+
+
+async def _search(backend: str, query: str) -> List[Dict[str, str]]:
+    sources = await _backends[backend](query, RETRIEVAL_MAX_RESULTS)
+    return [{**source, "snippet": _snippet(source.get("snippet", ""))} for source in sources]
+
+
+async def retrieve(query: str, backend: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Search once for a council query (cached).
+
+    Args:
+        query: The user's question
+        backend: Registered backend name (defaults to RETRIEVAL_BACKEND)
+
+    Returns:
+        Dict with 'backend', 'sources' and 'cached', or None when retrieval
+        is off ("none")
+
+    Raises:
+        ValueError: Unknown backend
+        Exception: The backend's error (nothing is cached then)
+    """
+    backend = backend or RETRIEVAL_BACKEND
+    if backend == "none":
+        return None
+    if backend not in _backends:
+        raise ValueError(f"Unknown retrieval backend: {backend}")
+
+    key = (backend, normalize_query(query))
+    now = time.monotonic()
+    cached = _cache.get(key)
+    if cached is not None and cached[0] > now:
+        _cache.move_to_end(key)
+        return {"backend": backend, "sources": cached[1], "cached": True}
+
+    with span("retrieval.search", backend=backend) as search_span:
+        future = _in_flight.get(key)
+        if future is None:
+            future = _in_flight[key] = asyncio.ensure_future(_search(backend, query))
+            future.add_done_callback(lambda _: _in_flight.pop(key, None))
+        # Shielded: one caller giving up must not cancel the search for the others
+        sources = await asyncio.shield(future)
+        search_span.set_attribute("sources", len(sources))
+
+    _cache[key] = (time.monotonic() + RETRIEVAL_CACHE_TTL, sources)
+    _cache.move_to_end(key)
+    while len(_cache) > RETRIEVAL_CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+    return {"backend": backend, "sources": sources, "cached": False}
+
+
+def format_context(sources: List[Dict[str, str]]) -> str:
+    """Numbered source list for the stage 1 prompt."""
+    return "\n\n".join(
+        f"[{number}] {source['title']} ({source['url']})\n{source['snippet']}"
+        for number, source in enumerate(sources, start=1)
+    )
+
+
+def stage1_messages(user_query: str, retrieval: Optional[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """
+    Stage 1 messages: the question, preceded by the shared sources if any.
+
+    Args:
+        user_query: The user's question
+        retrieval: Output of retrieve(), or None
+
+    Returns:
+        Messages for every council member
+    """
+    messages = [{"role": "user", "content": user_query}]
+    if retrieval and retrieval["sources"]:
+        messages.insert(0, {
+            "role": "system",
+            "content": "Web search results for the user's question (cite them as [n] where you use them; "
+                       "they may be incomplete or wrong):\n\n" + format_context(retrieval["sources"])
+        })
+    return messages
+
+
+def source_list(retrieval: Optional[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Title and URL of each source, for the client."""
+    if not retrieval:
+        return []
+    return [{"title": source["title"], "url": source["url"]} for source in retrieval["sources"]]
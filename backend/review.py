@@ -0,0 +1,105 @@
+"""Review assignment for subsampled stage 2 peer review.
+
+With full peer review every council model ranks every stage 1 answer, so
+stage 2 prompt tokens grow quadratically with council size. Instead, each
+reviewer can be given a balanced subset of k answers: every answer receives
+the same number of reviews (within one), nobody reviews their own answer,
+and per-reviewer prompt size stays constant however large the council is.
+The resulting incomplete rankings are combined by calculate_aggregate_rankings.
+"""
+
+from typing import List, Dict, Any, Optional
+
+from .config import REVIEW_SAMPLE_SIZE
+
+
+def resolve_sample_size(sample_size: Optional[int], answer_count: int) -> Optional[int]:
+    """
+    Decide how many answers each reviewer ranks.
+
+    Args:
+        sample_size: Requested answers per reviewer (defaults to REVIEW_SAMPLE_SIZE)
+        answer_count: Number of stage 1 answers
+
+    Returns:
+        Answers per reviewer, or None when every reviewer should rank every answer
+    """
+    k = sample_size if sample_size is not None else REVIEW_SAMPLE_SIZE
+    if not k or k >= answer_count:
+        return None
+    # A ranking needs at least two answers to carry any information
+    return max(k, 2)
+
+
+def assign_reviews(
+    reviewers: List[str],
+    authors: List[str],
+    k: int
+) -> Dict[str, List[int]]:
+    """
+    Assign each reviewer a balanced subset of answers to rank.
+
+    Reviewers are processed in turn and each picks the k least-reviewed
+    answers it did not write, breaking ties by cyclic distance from its own
+    position so neighbouring reviewers see different subsets. The result is
+    deterministic for a given council.
+
+    Args:
+        reviewers: Reviewer model identifiers
+        authors: Author model of each stage 1 answer (by answer index)
+        k: Answers per reviewer
+
+    Returns:
+        Dict mapping reviewer to the sorted answer indices it should rank
+    """
+    answer_count = len(authors)
+    load = [0] * answer_count
+    assignments = {}
+
+    for position, reviewer in enumerate(reviewers):
+        eligible = [index for index in range(answer_count) if authors[index] != reviewer]
+        start = (position + 1) % answer_count if answer_count else 0
+        eligible.sort(key=lambda index: (load[index], (index - start) % answer_count))
+        chosen = sorted(eligible[:k])
+        for index in chosen:
+            load[index] += 1
+        assignments[reviewer] = chosen
+
+    return assignments
+
+
+def review_coverage(assignments: Dict[str, List[int]], answer_count: int) -> List[int]:
+    """Number of reviews each answer receives under an assignment."""
+    coverage = [0] * answer_count
+    for indices in assignments.values():
+        for index in indices:
+            coverage[index] += 1
+    return coverage
+
+
+def scaled_position(position: int, ranked_count: int, candidate_count: int) -> float:
+    """
+    Map a position in a partial ranking onto the full 1..candidate_count scale.
+
+    Being first of three means the same as being first of ten, so partial
+    rankings are stretched before positions are averaged.
+
+    Args:
+        position: 1-based position in the reviewer's ranking
+        ranked_count: Number of answers the reviewer ranked
+        candidate_count: Number of answers in the run
+
+    Returns:
+        Equivalent position among all candidates
+    """
+    if ranked_count >= candidate_count or ranked_count <= 1:
+        return float(position)
+    return 1 + (position - 1) * (candidate_count - 1) / (ranked_count - 1)
+
+
+def subset_responses_text(labels: List[str], stage1_results: List[Dict[str, Any]], indices: List[int]) -> str:
+    """Render the assigned answers under their run-wide labels."""
+    return "\n\n".join(
+        f"Response {labels[index]}:\n{stage1_results[index]['response']}"
+        for index in indices
+    )
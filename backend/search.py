@@ -0,0 +1,192 @@
+"""Full-text search over conversation history (SQLite FTS5).
+
+Every message is indexed when storage appends it: user queries, stage 3
+answers and (if SEARCH_INDEX_STAGE1) each stage 1 response. The index is
+never rebuilt by scanning conversations, except by the one-off backfill in
+scripts/build_search_index.py for conversations stored before it existed.
+
+Results are ranked by BM25, with stage 1 responses weighted below queries
+and final answers. Each comes with a snippet in which matches are
+**bold** (Markdown, as the UI renders answers).
+"""
+
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from .config import SEARCH_ENABLED, SEARCH_INDEX_PATH, SEARCH_INDEX_STAGE1
+from .tracing import span
+
+# BM25 multiplier per message kind (BM25 scores are negative: lower is better)
+KIND_WEIGHTS = {"query": 1.0, "answer": 1.0, "stage1": 0.5}
+
+_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(
+    conversation_id UNINDEXED,
+    message_index UNINDEXED,
+    kind UNINDEXED,
+    model UNINDEXED,
+    content,
+    tokenize = 'porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    created_at TEXT
+);
+"""
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_conn: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+
+
+def _connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        Path(SEARCH_INDEX_PATH).parent.mkdir(parents=True, exist_ok=True)
+        _conn = sqlite3.connect(SEARCH_INDEX_PATH, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.executescript(_SCHEMA)
+    return _conn
+
+
+def _write(sql_rows: List[tuple]):
+    """Run (sql, params) statements in one transaction; indexing errors never fail a write."""
+    if not SEARCH_ENABLED or not sql_rows:
+        return
+    try:
+        with _lock, span("search.index", statements=len(sql_rows)):
+            conn = _connection()
+            with conn:
+                for sql, params in sql_rows:
+                    conn.execute(sql, params)
+    except sqlite3.Error as e:
+        print(f"Search indexing failed: {e}")
+
+
+def _message_rows(conversation_id: str, message_index: int, message: Dict[str, Any]) -> List[tuple]:
+    insert = "INSERT INTO messages (conversation_id, message_index, kind, model, content) VALUES (?, ?, ?, ?, ?)"
+    if message.get("role") == "user":
+        return [(insert, (conversation_id, message_index, "query", None, message.get("content") or ""))]
+
+    rows = []
+    stage3 = message.get("stage3") or {}
+    if stage3.get("response"):
+        rows.append((insert, (conversation_id, message_index, "answer", stage3.get("model"), stage3["response"])))
+    if SEARCH_INDEX_STAGE1:
+        for result in message.get("stage1") or []:
+            if result.get("response"):
+                rows.append((insert, (conversation_id, message_index, "stage1", result.get("model"), result["response"])))
+    return rows
+
+
+def index_conversation_meta(conversation_id: str, title: str, created_at: str):
+    """
+    Record (or update) the title and creation time shown with results.
+
+    Args:
+        conversation_id: Conversation identifier
+        title: Current title
+        created_at: ISO creation timestamp
+    """
+    _write([(
+        "INSERT INTO conversations (id, title, created_at) VALUES (?, ?, ?) "
+        "ON CONFLICT(id) DO UPDATE SET title = excluded.title",
+        (conversation_id, title, created_at)
+    )])
+
+
+def index_message(conversation_id: str, message_index: int, message: Dict[str, Any]):
+    """
+    Index one newly appended message.
+
+    Args:
+        conversation_id: Conversation identifier
+        message_index: Position of the message in the conversation
+        message: Stored message dict (user, or assistant with stages)
+    """
+    _write(_message_rows(conversation_id, message_index, message))
+
+
+def index_conversation(conversation: Dict[str, Any]):
+    """
+    (Re)index a whole stored conversation; used only for backfilling.
+
+    Args:
+        conversation: Conversation dict as stored
+    """
+    conversation_id = conversation["id"]
+    rows = [("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))]
+    for index, message in enumerate(conversation.get("messages", [])):
+        rows.extend(_message_rows(conversation_id, index, message))
+    _write(rows)
+    index_conversation_meta(conversation_id, conversation.get("title", "New Conversation"), conversation.get("created_at", ""))
+
+
+def _match_expression(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 query: every word must match, the last as a prefix."""
+    tokens = _TOKEN_RE.findall(query)
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search(query: str, limit: int = 20, include_stage1: bool = True) -> List[Dict[str, Any]]:
+    """
+    Search past queries and answers.
+
+    Args:
+        query: Free-text search (all words must match; the last may be a prefix)
+        limit: Maximum number of results
+        include_stage1: Whether to include individual stage 1 responses
+
+    Returns:
+        Ranked hits with 'conversation_id', 'title', 'created_at',
+        'message_index', 'kind', 'model', 'snippet' and 'score'
+    """
+    expression = _match_expression(query)
+    if not SEARCH_ENABLED or expression is None:
+        return []
+
+    kinds = [kind for kind in KIND_WEIGHTS if include_stage1 or kind != "stage1"]
+    sql = f"""
+        SELECT messages.conversation_id, c.title, c.created_at, message_index, kind, model,
+               snippet(messages, 4, '**', '**', '…', 16),
+               bm25(messages) * CASE kind {' '.join(f"WHEN '{k}' THEN {w}" for k, w in KIND_WEIGHTS.items())} END AS score
+        FROM messages
+        LEFT JOIN conversations AS c ON c.id = messages.conversation_id
+        WHERE messages MATCH ? AND kind IN ({','.join('?' * len(kinds))})
+        ORDER BY score
+        LIMIT ?
+    """
+    with _lock, span("search.query", terms=expression.count('"') // 2) as query_span:
+        start = time.monotonic()
+        try:
+            rows = _connection().execute(sql, (expression, *kinds, limit)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Search failed: {e}")
+            return []
+        query_span.set_attribute("results", len(rows))
+        query_span.set_attribute("ms", round((time.monotonic() - start) * 1000, 2))
+
+    return [
+        {
+            "conversation_id": conversation_id,
+            "title": title or "New Conversation",
+            "created_at": created_at,
+            "message_index": int(message_index),
+            "kind": kind,
+            "model": model,
+            "snippet": snippet,
+            "score": round(-score, 4),
+        }
+        for conversation_id, title, created_at, message_index, kind, model, snippet, score in rows
+    ]
@@ -0,0 +1,285 @@
+"""Semantic near-duplicate cache for complete council runs.
+
+Queries are embedded as hashed word + character n-gram vectors (CPU only, no
+model download) and matched by cosine similarity. Candidate neighbours come
+from an inverted index over the query's content words, so a lookup only
+scores entries that share vocabulary with the incoming query instead of the
+whole cache. Entries are kept in LRU order, bounded in number and persisted
+as an append-only JSON-lines log that is compacted when it grows.
+"""
+
+import json
+import math
+import os
+import re
+import zlib
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Set
+from .serialization import dumps_str, loads
+from .config import (
+    SEMANTIC_CACHE_PATH,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+)
+
+# Number of hashed feature dimensions
+EMBEDDING_DIM = 1 << 18
+
+# Maximum number of candidates scored exactly per lookup
+MAX_CANDIDATES = 256
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Phrasing words that do not change what is being asked
+_STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "to", "of", "in", "on",
+    "for", "and", "or", "it", "its", "this", "that", "me", "i", "you", "your",
+    "my", "we", "do", "does", "did", "can", "could", "would", "should", "please",
+    "what", "whats", "s", "how", "why", "explain", "describe", "tell", "about",
+    "give", "show", "define", "definition", "meaning", "mean", "means",
+}
+
+
+def _tokens(text: str) -> List[str]:
+    """Lowercased content words of a query."""
+    words = _WORD_RE.findall(text.lower().replace("'", ""))
+    return [w for w in words if w not in _STOPWORDS]
+
+
+def _feature_index(feature: str) -> int:
+    """Stable (process independent) hash of a feature into EMBEDDING_DIM buckets."""
+    return zlib.crc32(feature.encode()) % EMBEDDING_DIM
+
+
+def embed(text: str) -> Dict[int, float]:
+    """
+    Embed a query as an L2-normalized sparse hashed n-gram vector.
+
+    Features are content words, word bigrams and character trigrams of each
+    word, which makes the vector robust to re-phrasing and small typos.
+
+    Args:
+        text: Query text
+
+    Returns:
+        Sparse vector as a dict of dimension -> weight
+    """
+    words = _tokens(text)
+    features = defaultdict(float)
+    for word in words:
+        features[_feature_index(f"w:{word}")] += 1.0
+        padded = f"#{word}#"
+        for i in range(len(padded) - 2):
+            features[_feature_index(f"c:{padded[i:i + 3]}")] += 0.3
+    for first, second in zip(words, words[1:]):
+        features[_feature_index(f"b:{first} {second}")] += 0.5
+
+    norm = math.sqrt(sum(w * w for w in features.values()))
+    if norm == 0:
+        return {}
+    return {index: weight / norm for index, weight in features.items()}
+
+
+def cosine(a: Dict[int, float], b: Dict[int, float]) -> float:
+    """Cosine similarity of two normalized sparse vectors."""
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(index, 0.0) for index, weight in a.items())
+
+
+class SemanticCache:
+    """Bounded, persistent nearest-neighbour cache of council results."""
+
+    def __init__(
+        self,
+        path: str = SEMANTIC_CACHE_PATH,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES
+    ):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+        self._log_records = 0
+        self._load()
+
+    @staticmethod
+    def _key(namespace: str, query: str) -> str:
+        return f"{namespace}\n{query.strip().lower()}"
+
+    def _index(self, key: str, entry: Dict[str, Any]):
+        entry["vector"] = embed(entry["query"])
+        self._entries[key] = entry
+        for token in set(_tokens(entry["query"])):
+            self._postings[token].add(key)
+
+    def _unindex(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for token in set(_tokens(entry["query"])):
+            self._postings[token].discard(key)
+            if not self._postings[token]:
+                del self._postings[token]
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._unindex(oldest)
+            self._append({"op": "evict", "key": oldest})
+
+    def _load(self):
+        """Replay the on-disk log into memory."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = loads(line)
+                except ValueError:
+                    # Ignore a torn final line from an interrupted write
+                    continue
+                self._log_records += 1
+                if record.get("op") == "evict":
+                    self._unindex(record["key"])
+                elif record.get("op") == "hit":
+                    if record["key"] in self._entries:
+                        self._entries.move_to_end(record["key"])
+                else:
+                    self._unindex(record["key"])
+                    self._index(record["key"], {
+                        "query": record["query"],
+                        "namespace": record["namespace"],
+                        "result": record["result"],
+                    })
+        while len(self._entries) > self.max_entries:
+            self._unindex(next(iter(self._entries)))
+
+    def _append(self, record: Dict[str, Any]):
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(dumps_str(record) + "\n")
+        self._log_records += 1
+        if self._log_records > 2 * self.max_entries + 100:
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the log so it only contains live entries, in LRU order."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for key, entry in self._entries.items():
+                f.write(dumps_str({
+                    "op": "set",
+                    "key": key,
+                    "query": entry["query"],
+                    "namespace": entry["namespace"],
+                    "result": entry["result"],
+                }) + "\n")
+        os.replace(tmp_path, self.path)
+        self._log_records = len(self._entries)
+
+    def lookup(self, query: str, namespace: str = "") -> Optional[Dict[str, Any]]:
+        """
+        Find the most similar cached query above the similarity threshold.
+
+        Args:
+            query: Incoming user query
+            namespace: Council configuration the result must belong to
+
+        Returns:
+            Dict with 'query', 'similarity' and 'result', or None on a miss
+        """
+        vector = embed(query)
+        if not vector:
+            return None
+
+        # Candidate generation: entries sharing the most content words
+        overlap = defaultdict(int)
+        for token in set(_tokens(query)):
+            for key in self._postings.get(token, ()):
+                overlap[key] += 1
+        candidates = sorted(overlap, key=overlap.get, reverse=True)[:MAX_CANDIDATES]
+
+        best_key, best_similarity = None, 0.0
+        for key in candidates:
+            entry = self._entries[key]
+            if entry["namespace"] != namespace:
+                continue
+            similarity = cosine(vector, entry["vector"])
+            if similarity > best_similarity:
+                best_key, best_similarity = key, similarity
+
+        if best_key is None or best_similarity < self.threshold:
+            return None
+
+        self._entries.move_to_end(best_key)
+        self._append({"op": "hit", "key": best_key})
+        entry = self._entries[best_key]
+        return {
+            "query": entry["query"],
+            "similarity": round(best_similarity, 4),
+            "result": entry["result"],
+        }
+
+    def store(self, query: str, result: Dict[str, Any], namespace: str = ""):
+        """
+        Add (or refresh) a council result for a query.
+
+        Args:
+            query: User query the result answers
+            result: JSON-serializable council result
+            namespace: Council configuration the result belongs to
+        """
+        key = self._key(namespace, query)
+        self._unindex(key)
+        self._index(key, {"query": query, "namespace": namespace, "result": result})
+        self._append({
+            "op": "set",
+            "key": key,
+            "query": query,
+            "namespace": namespace,
+            "result": result,
+        })
+        self._evict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_cache: Optional[SemanticCache] = None
+
+
+def get_cache() -> SemanticCache:
+    """Get the process-wide semantic cache, loading it on first use."""
+    global _cache
+    if _cache is None:
+        _cache = SemanticCache()
+    return _cache
+
+
+def council_namespace(
+    council_models: List[str],
+    chairman_model: str,
+    settings: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Cache namespace for a council configuration (member order does not matter).
+
+    Args:
+        council_models: Council models
+        chairman_model: Chairman model
+        settings: Other run settings that change the result (ranking mode,
+            aggregation, review sample size, generation profiles, ...)
+
+    Returns:
+        Namespace string; runs only share entries when all of it matches
+    """
+    namespace = "|".join(sorted(council_models)) + "=>" + chairman_model
+    if settings:
+        namespace += "?" + json.dumps(settings, sort_keys=True, separators=(",", ":"))
+    return namespace
@@ -0,0 +1,65 @@
+"""JSON serialization used for SSE events, storage and API responses.
+
+Uses orjson when it is installed and falls back to the standard library
+otherwise. Both paths produce compact UTF-8 output.
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Serialize an object to compact UTF-8 JSON bytes.
+
+    Args:
+        obj: JSON-serializable object
+
+    Returns:
+        Encoded JSON
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumps_str(obj: Any) -> str:
+    """Serialize an object to a compact JSON string."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """
+    Parse JSON from bytes or a string.
+
+    Args:
+        data: Encoded JSON
+
+    Returns:
+        Decoded object
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def sse_event(payload: Any) -> str:
+    """
+    Format a payload as a Server-Sent Events data frame.
+
+    Args:
+        payload: JSON-serializable event (typically with a 'type' key)
+
+    Returns:
+        "data: <json>\\n\\n"
+    """
+    return f"data: {dumps_str(payload)}\n\n"
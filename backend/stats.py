@@ -0,0 +1,278 @@
+"""Persistent per-model statistics used for adaptive council composition."""
+
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+from .config import (
+    STATS_PATH,
+    STATS_LATENCY_WINDOW,
+    STATS_FLUSH_INTERVAL,
+    FAST_COUNCIL_LATENCY_SLO,
+    FAST_COUNCIL_MIN_MODELS,
+    FAST_COUNCIL_MAX_MODELS,
+    FAST_COUNCIL_MAX_FAILURE_RATE,
+    FAST_COUNCIL_MAX_RELATIVE_RANK,
+    FAST_COUNCIL_MIN_RANKED_RUNS,
+)
+
+# Loaded lazily from STATS_PATH and kept in memory afterwards
+_stats: Optional[Dict[str, Dict[str, Any]]] = None
+# Changes not yet written, and whether a delayed write is pending
+_dirty = False
+_flush_scheduled = False
+
+
+def _load() -> Dict[str, Dict[str, Any]]:
+    """Load the statistics file into the in-memory cache."""
+    global _stats
+    if _stats is None:
+        if os.path.exists(STATS_PATH):
+            with open(STATS_PATH, 'r') as f:
+                _stats = json.load(f)
+        else:
+            _stats = {}
+    return _stats
+
+
+def _write(data: str):
+    """Atomically replace the statistics file."""
+    Path(STATS_PATH).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{STATS_PATH}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(data)
+    os.replace(tmp_path, STATS_PATH)
+
+
+def flush():
+    """Write pending statistics now (blocking; used at shutdown and outside an event loop)."""
+    global _dirty
+    if _dirty:
+        _dirty = False
+        _write(json.dumps(_load()))
+
+
+async def _flush_later():
+    """Write pending statistics after STATS_FLUSH_INTERVAL, off the event loop."""
+    global _dirty, _flush_scheduled
+    try:
+        await asyncio.sleep(STATS_FLUSH_INTERVAL)
+        if _dirty:
+            _dirty = False
+            # Serialized on the loop (no concurrent mutation), written in a thread
+            await asyncio.to_thread(_write, json.dumps(_load()))
+    finally:
+        _flush_scheduled = False
+    if _dirty:
+        _save()
+
+
+def _save():
+    """Mark the statistics changed; they are written by a delayed background flush."""
+    global _dirty, _flush_scheduled
+    _dirty = True
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        # Scripts without an event loop: nothing to block, write now
+        flush()
+        return
+    if not _flush_scheduled:
+        _flush_scheduled = True
+        asyncio.ensure_future(_flush_later())
+
+
+def _entry(model: str) -> Dict[str, Any]:
+    """Get (or create) the raw statistics entry for a model."""
+    stats = _load()
+    if model not in stats:
+        stats[model] = {
+            "calls": 0,
+            "failures": 0,
+            "latencies": [],
+            "rank_sum": 0.0,
+            "rank_count": 0,
+            "relative_rank_sum": 0.0,
+            "relative_rank_count": 0,
+        }
+    # Files written before relative ranks were recorded
+    stats[model].setdefault("relative_rank_sum", 0.0)
+    stats[model].setdefault("relative_rank_count", 0)
+    return stats[model]
+
+
+def record_model_call(model: str, latency: float, success: bool):
+    """
+    Record the outcome of a single model call.
+
+    Args:
+        model: OpenRouter model identifier
+        latency: Wall time of the call in seconds
+        success: Whether the call returned a usable response
+    """
+    entry = _entry(model)
+    entry["calls"] += 1
+    if success:
+        entry["latencies"].append(round(latency, 3))
+        # Keep a bounded window so percentiles follow recent behaviour
+        del entry["latencies"][:-STATS_LATENCY_WINDOW]
+    else:
+        entry["failures"] += 1
+    _save()
+
+
+def record_rankings(aggregate_rankings: List[Dict[str, Any]], candidate_count: int):
+    """
+    Record the peer-review outcome of one council run.
+
+    Besides the raw average rank, the rank relative to the council size is
+    recorded ((rank - 1) / (candidates - 1): 0 is best, 1 is worst), so runs
+    of different sizes can be compared.
+
+    Args:
+        aggregate_rankings: Output of calculate_aggregate_rankings
+        candidate_count: Number of answers that were ranked in the run
+    """
+    if not aggregate_rankings:
+        return
+    for item in aggregate_rankings:
+        entry = _entry(item["model"])
+        entry["rank_sum"] += item["average_rank"]
+        entry["rank_count"] += 1
+        if candidate_count > 1:
+            relative = (item["average_rank"] - 1) / (candidate_count - 1)
+            entry["relative_rank_sum"] += min(max(relative, 0.0), 1.0)
+            entry["relative_rank_count"] += 1
+    _save()
+
+
+def _percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize_model(model: str) -> Dict[str, Any]:
+    """
+    Summarize the statistics of a single model.
+
+    Args:
+        model: OpenRouter model identifier
+
+    Returns:
+        Dict with call counts, latency percentiles, failure rate, average rank
+        and relative rank (0 = always best, 1 = always worst)
+    """
+    entry = _load().get(model)
+    if entry is None:
+        return {
+            "model": model,
+            "calls": 0,
+            "failure_rate": None,
+            "latency_p50": None,
+            "latency_p90": None,
+            "latency_p99": None,
+            "average_rank": None,
+            "relative_rank": None,
+            "runs_ranked": 0,
+        }
+
+    latencies = sorted(entry["latencies"])
+    return {
+        "model": model,
+        "calls": entry["calls"],
+        "failure_rate": round(entry["failures"] / entry["calls"], 3) if entry["calls"] else None,
+        "latency_p50": _percentile(latencies, 50),
+        "latency_p90": _percentile(latencies, 90),
+        "latency_p99": _percentile(latencies, 99),
+        "average_rank": round(entry["rank_sum"] / entry["rank_count"], 2) if entry["rank_count"] else None,
+        "relative_rank": (
+            round(entry.get("relative_rank_sum", 0.0) / entry["relative_rank_count"], 3)
+            if entry.get("relative_rank_count") else None
+        ),
+        "runs_ranked": entry.get("relative_rank_count", 0),
+    }
+
+
+def get_model_stats() -> List[Dict[str, Any]]:
+    """
+    Summarize the statistics of every model seen so far.
+
+    Returns:
+        List of per-model summaries, sorted by relative rank (unranked last)
+    """
+    summaries = [summarize_model(model) for model in _load()]
+    summaries.sort(key=lambda s: (s["relative_rank"] is None, s["relative_rank"] or 0))
+    return summaries
+
+
+def _rank_key(summary: Dict[str, Any]):
+    """Sort key preferring models that historically win peer review (unranked last)."""
+    return (summary["relative_rank"] is None, summary["relative_rank"] or 0)
+
+
+def select_fast_council(
+    models: List[str],
+    latency_slo: float = FAST_COUNCIL_LATENCY_SLO,
+    min_models: int = FAST_COUNCIL_MIN_MODELS,
+    max_models: Optional[int] = FAST_COUNCIL_MAX_MODELS
+) -> List[str]:
+    """
+    Pick the subset of models expected to answer well within the latency SLO.
+
+    Models without any calls are kept so that statistics can be gathered.
+    A model is dropped when it fails too often (a model with calls but no
+    successful one counts as failing), when its p90 latency misses the SLO,
+    or when, over at least FAST_COUNCIL_MIN_RANKED_RUNS runs, its relative
+    rank is worse than FAST_COUNCIL_MAX_RELATIVE_RANK. The best-ranked
+    models are preferred when capping; if fewer than min_models remain,
+    the best-ranked of the dropped models that have answered are added back,
+    fastest first among equals, and models that never answered last.
+
+    Args:
+        models: Candidate council models
+        latency_slo: Target p90 latency in seconds
+        min_models: Minimum council size to keep
+        max_models: Optional cap on the council size (best-ranked models win)
+
+    Returns:
+        Selected models, in their original order
+    """
+    summaries = {model: summarize_model(model) for model in models}
+
+    eligible = []
+    for model in models:
+        s = summaries[model]
+        if not s["calls"]:
+            eligible.append(model)
+            continue
+        if s["latency_p90"] is None:
+            # Calls recorded but none succeeded
+            continue
+        if s["failure_rate"] > FAST_COUNCIL_MAX_FAILURE_RATE:
+            continue
+        if s["latency_p90"] > latency_slo:
+            continue
+        if (s["runs_ranked"] >= FAST_COUNCIL_MIN_RANKED_RUNS
+                and s["relative_rank"] > FAST_COUNCIL_MAX_RELATIVE_RANK):
+            continue
+        eligible.append(model)
+
+    if max_models is not None and len(eligible) > max_models:
+        eligible.sort(key=lambda m: _rank_key(summaries[m]))
+        eligible = eligible[:max_models]
+
+    if len(eligible) < min_models:
+        rejected = [m for m in models if m not in eligible]
+        rejected.sort(key=lambda m: (
+            summaries[m]["latency_p90"] is None,
+            *_rank_key(summaries[m]),
+            summaries[m]["latency_p90"] or 0
+        ))
+        eligible.extend(rejected[:min_models - len(eligible)])
+
+    selected = set(eligible)
+    return [model for model in models if model in selected]
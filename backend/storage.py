@@ -1,11 +1,14 @@
-"""JSON-based storage for conversations."""
+"""JSON-based storage for conversations (compact, compressed encoding)."""
 
-import json
 import os
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 from pathlib import Path
-from .config import DATA_DIR
+from .config import DATA_DIR, LIST_VERSION_PATH
+from .serialization import dumps, loads
+from .compression import pack, unpack
+from .tracing import span
+from . import search, archive
 
 
 def ensure_data_dir():
@@ -18,6 +21,30 @@ def get_conversation_path(conversation_id: str) -> str:
     return os.path.join(DATA_DIR, f"{conversation_id}.json")
 
 
+def get_list_version() -> int:
+    """
+    Get the version of the conversation list.
+
+    Returns:
+        Counter that changes whenever any conversation is created or modified
+    """
+    try:
+        with open(LIST_VERSION_PATH, 'r') as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def bump_list_version():
+    """Increment the conversation list version."""
+    version = get_list_version() + 1
+    Path(LIST_VERSION_PATH).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{LIST_VERSION_PATH}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(str(version))
+    os.replace(tmp_path, LIST_VERSION_PATH)
+
+
 def create_conversation(conversation_id: str) -> Dict[str, Any]:
     """
     Create a new conversation.
@@ -34,23 +61,30 @@ def create_conversation(conversation_id: str) -> Dict[str, Any]:
         "id": conversation_id,
         "created_at": datetime.utcnow().isoformat(),
         "title": "New Conversation",
+        "version": 1,
         "messages": []
     }
 
     # Save to file
     path = get_conversation_path(conversation_id)
-    with open(path, 'w') as f:
-        json.dump(conversation, f, indent=2)
+    with open(path, 'wb') as f:
+        f.write(pack(dumps(conversation)))
+    bump_list_version()
+    search.index_conversation_meta(conversation_id, conversation["title"], conversation["created_at"])
 
     return conversation
 
 
-def get_conversation(conversation_id: str) -> Optional[Dict[str, Any]]:
+def get_conversation(conversation_id: str, restore: bool = True) -> Optional[Dict[str, Any]]:
     """
     Load a conversation from storage.
 
+    Archived conversations are restored to the hot tier first, unless
+    restore is False (e.g. for bulk scans such as index backfills).
+
     Args:
         conversation_id: Unique identifier for the conversation
+        restore: Whether reading an archived conversation moves it back to DATA_DIR
 
     Returns:
         Conversation dict or None if not found
@@ -58,24 +92,37 @@ def get_conversation(conversation_id: str) -> Optional[Dict[str, Any]]:
     path = get_conversation_path(conversation_id)
 
     if not os.path.exists(path):
-        return None
+        if not restore:
+            blob = archive.read(conversation_id)
+            return loads(unpack(blob)) if blob is not None else None
+        if not archive.restore(conversation_id):
+            return None
 
-    with open(path, 'r') as f:
-        return json.load(f)
+    with span("storage.read", conversation_id=conversation_id) as read_span:
+        with open(path, 'rb') as f:
+            data = f.read()
+        read_span.set_attribute("bytes", len(data))
+        return loads(unpack(data))
 
 
 def save_conversation(conversation: Dict[str, Any]):
     """
-    Save a conversation to storage.
+    Save a conversation to storage, bumping its version.
 
     Args:
         conversation: Conversation dict to save
     """
     ensure_data_dir()
 
+    conversation["version"] = conversation.get("version", 0) + 1
+
     path = get_conversation_path(conversation['id'])
-    with open(path, 'w') as f:
-        json.dump(conversation, f, indent=2)
+    with span("storage.write", conversation_id=conversation['id']) as write_span:
+        data = pack(dumps(conversation))
+        with open(path, 'wb') as f:
+            f.write(data)
+        write_span.set_attribute("bytes", len(data))
+        bump_list_version()
 
 
 def list_conversations() -> List[Dict[str, Any]]:
@@ -91,8 +138,8 @@ def list_conversations() -> List[Dict[str, Any]]:
     for filename in os.listdir(DATA_DIR):
         if filename.endswith('.json'):
             path = os.path.join(DATA_DIR, filename)
-            with open(path, 'r') as f:
-                data = json.load(f)
+            with open(path, 'rb') as f:
+                data = loads(unpack(f.read()))
                 # Return metadata only
                 conversations.append({
                     "id": data["id"],
@@ -101,6 +148,10 @@ def list_conversations() -> List[Dict[str, Any]]:
                     "message_count": len(data["messages"])
                 })
 
+    # Archived conversations, listed from the archive index
+    hot = {conversation["id"] for conversation in conversations}
+    conversations.extend(c for c in archive.list_archived() if c["id"] not in hot)
+
     # Sort by creation time, newest first
     conversations.sort(key=lambda x: x["created_at"], reverse=True)
 
@@ -119,19 +170,23 @@ def add_user_message(conversation_id: str, content: str):
     if conversation is None:
         raise ValueError(f"Conversation {conversation_id} not found")
 
-    conversation["messages"].append({
+    message = {
         "role": "user",
-        "content": content
-    })
+        "content": content,
+        "version": conversation.get("version", 0) + 1
+    }
+    conversation["messages"].append(message)
 
     save_conversation(conversation)
+    search.index_message(conversation_id, len(conversation["messages"]) - 1, message)
 
 
 def add_assistant_message(
     conversation_id: str,
     stage1: List[Dict[str, Any]],
     stage2: List[Dict[str, Any]],
-    stage3: Dict[str, Any]
+    stage3: Dict[str, Any],
+    metadata: Optional[Dict[str, Any]] = None
 ):
     """
     Add an assistant message with all 3 stages to a conversation.
@@ -141,19 +196,163 @@ def add_assistant_message(
         stage1: List of individual model responses
         stage2: List of model rankings
         stage3: Final synthesized response
+        metadata: Optional run metadata (label mapping, aggregate rankings, ...)
     """
     conversation = get_conversation(conversation_id)
     if conversation is None:
         raise ValueError(f"Conversation {conversation_id} not found")
 
-    conversation["messages"].append({
+    message = {
         "role": "assistant",
         "stage1": stage1,
         "stage2": stage2,
-        "stage3": stage3
-    })
+        "stage3": stage3,
+        "version": conversation.get("version", 0) + 1
+    }
+    if metadata is not None:
+        message["metadata"] = metadata
+    conversation["messages"].append(message)
 
     save_conversation(conversation)
+    search.index_message(conversation_id, len(conversation["messages"]) - 1, message)
+
+
+def slim_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Strip the Stage 1 / Stage 2 payloads from an assistant message.
+
+    Args:
+        message: Stored message dict
+
+    Returns:
+        Message with the final answer, metadata and stage counts only
+    """
+    if message.get("role") != "assistant":
+        return message
+
+    slim = {
+        "role": "assistant",
+        "stage3": message.get("stage3"),
+        "stage1_count": len(message.get("stage1") or []),
+        "stage2_count": len(message.get("stage2") or []),
+        "details_omitted": True
+    }
+    if "version" in message:
+        slim["version"] = message["version"]
+    if "metadata" in message:
+        slim["metadata"] = message["metadata"]
+    return slim
+
+
+def get_conversation_view(
+    conversation_id: str,
+    view: str = "full",
+    offset: int = 0,
+    limit: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Load a conversation, optionally slimmed and limited to a message range.
+
+    Args:
+        conversation_id: Unique identifier for the conversation
+        view: "full" for complete messages, "slim" to omit Stage 1 / Stage 2
+        offset: Index of the first message; negative values count from the end
+        limit: Maximum number of messages (None for all remaining)
+
+    Returns:
+        Conversation dict (with 'total_messages' and 'offset') or None if not found
+    """
+    conversation = get_conversation(conversation_id)
+    if conversation is None:
+        return None
+
+    messages = conversation["messages"]
+    total = len(messages)
+    start = max(0, total + offset) if offset < 0 else min(offset, total)
+    end = total if limit is None else min(total, start + max(0, limit))
+    selected = messages[start:end]
+    if view == "slim":
+        selected = [slim_message(m) for m in selected]
+
+    conversation["messages"] = selected
+    conversation["total_messages"] = total
+    conversation["offset"] = start
+    return conversation
+
+
+def get_conversation_delta(conversation_id: str, since_version: int) -> Optional[Dict[str, Any]]:
+    """
+    Get the changes to a conversation after a known version.
+
+    Messages are append-only and stamped with the version that added them,
+    so the delta is the title plus every message newer than since_version.
+    Messages stored before versioning have no stamp; if the client's version
+    is unknown (newer than the current one) the full message list is returned
+    with 'reset' set.
+
+    Args:
+        conversation_id: Unique identifier for the conversation
+        since_version: Version the client already has
+
+    Returns:
+        Dict with 'id', 'version', 'title', 'messages', 'message_offset' and
+        'reset', or None if not found
+    """
+    conversation = get_conversation(conversation_id)
+    if conversation is None:
+        return None
+
+    version = conversation.get("version", 0)
+    messages = conversation["messages"]
+    reset = since_version > version
+
+    offset = 0 if reset else len(messages)
+    if not reset:
+        for index, message in enumerate(messages):
+            if message.get("version", 0) > since_version:
+                offset = index
+                break
+
+    return {
+        "id": conversation["id"],
+        "version": version,
+        "since_version": since_version,
+        "title": conversation.get("title", "New Conversation"),
+        "message_offset": offset,
+        "messages": messages[offset:],
+        "reset": reset
+    }
+
+
+def get_message_details(conversation_id: str, message_index: int) -> Optional[Dict[str, Any]]:
+    """
+    Load the Stage 1 / Stage 2 details of a single assistant message.
+
+    Args:
+        conversation_id: Unique identifier for the conversation
+        message_index: Index of the message within the conversation
+
+    Returns:
+        Dict with 'index', 'stage1', 'stage2' and 'metadata', or None if the
+        conversation or assistant message does not exist
+    """
+    conversation = get_conversation(conversation_id)
+    if conversation is None:
+        return None
+
+    messages = conversation["messages"]
+    if not 0 <= message_index < len(messages):
+        return None
+    message = messages[message_index]
+    if message.get("role") != "assistant":
+        return None
+
+    return {
+        "index": message_index,
+        "stage1": message.get("stage1", []),
+        "stage2": message.get("stage2", []),
+        "metadata": message.get("metadata", {})
+    }
 
 
 def update_conversation_title(conversation_id: str, title: str):
@@ -170,3 +369,4 @@ def update_conversation_title(conversation_id: str, title: str):
 
     conversation["title"] = title
     save_conversation(conversation)
+    search.index_conversation_meta(conversation_id, title, conversation["created_at"])
@@ -0,0 +1,188 @@
+"""Conversation titles without a model call on the critical path.
+
+A new conversation gets an extractive title straight away: the first
+message's key words, without question phrasing or filler. If refinement is
+enabled, the conversation is then queued for a model-written title. A single
+background worker collects queued conversations for TITLE_BATCH_WINDOW
+seconds and titles all of them with one cheap model call. The turn never
+waits for it.
+"""
+
+import asyncio
+import re
+from typing import List, Dict, Optional
+
+from .openrouter import query_model
+from .config import (
+    TITLE_MODEL,
+    TITLE_REFINEMENT_ENABLED,
+    TITLE_BATCH_WINDOW,
+    TITLE_BATCH_MAX,
+)
+from . import storage, generation
+
+MAX_TITLE_LENGTH = 50
+MAX_TITLE_WORDS = 5
+
+# Leading phrasing that says how something is asked, not what
+_LEADING_PHRASES = re.compile(
+    r"^(?:(?:hi|hey|hello|please|ok|okay|so)[,!.]?\s+)*"
+    r"(?:(?:can|could|would|will) you\s+(?:please\s+)?|i (?:want|need|would like) (?:you )?to\s+|"
+    r"help me\s+(?:to\s+)?|tell me\s+|explain\s+(?:to me\s+)?|describe\s+|"
+    r"what(?:'s| is| are| was| were)\s+|how (?:do|does|can|should|would|to)\s+(?:i\s+|you\s+|we\s+)?|"
+    r"why (?:do|does|is|are)\s+|when (?:did|does|is)\s+|who (?:is|was)\s+)?",
+    re.IGNORECASE
+)
+
+_WORD_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9+#.'-]*")
+
+_FILLER = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "to", "of", "in", "on", "at",
+    "for", "and", "or", "it", "its", "this", "that", "these", "those", "me", "i", "you",
+    "my", "your", "we", "our", "do", "does", "did", "can", "could", "would", "should",
+    "please", "about", "some", "any", "with", "between", "into", "from", "by", "as",
+    "there", "their", "them", "they", "what", "which", "how", "why", "really", "just",
+}
+
+_LINE_RE = re.compile(r"^\s*(\d+)[.):]\s*(.+?)\s*$")
+
+
+def extractive_title(text: str) -> str:
+    """
+    Build a short title from a message locally (no network).
+
+    Args:
+        text: The first user message
+
+    Returns:
+        Title of up to MAX_TITLE_WORDS key words, or "New Conversation"
+    """
+    first_sentence = re.split(r"(?<=[.?!])\s+|\n", text.strip(), maxsplit=1)[0]
+    stripped = _LEADING_PHRASES.sub("", first_sentence, count=1)
+
+    words = []
+    for word in _WORD_RE.findall(stripped):
+        word = word.strip(".'-")
+        if not word or word.lower() in _FILLER:
+            continue
+        # Keep acronyms and mixed-case identifiers (API, iOS, PyTorch) as typed
+        if not (word.isupper() or any(c.isupper() for c in word[1:])):
+            word = word[0].upper() + word[1:]
+        words.append(word)
+        if len(words) == MAX_TITLE_WORDS:
+            break
+
+    title = " ".join(words)
+    if not title:
+        return "New Conversation"
+    if len(title) > MAX_TITLE_LENGTH:
+        title = title[:MAX_TITLE_LENGTH - 3].rstrip() + "..."
+    return title
+
+
+def _clean_title(title: str) -> Optional[str]:
+    title = title.strip().strip('"\'*').strip()
+    if not title:
+        return None
+    if len(title) > MAX_TITLE_LENGTH:
+        title = title[:MAX_TITLE_LENGTH - 3] + "..."
+    return title
+
+
+async def refine_titles(queries: List[str]) -> List[Optional[str]]:
+    """
+    Title several conversations with one model call.
+
+    Args:
+        queries: First user message of each conversation
+
+    Returns:
+        Title per query (None where the model gave no usable title)
+    """
+    numbered = "\n".join(f"{i}. {query[:500]}" for i, query in enumerate(queries, start=1))
+    prompt = f"""Generate a very short title (3-5 words maximum) for each of the following questions.
+Titles should be concise and descriptive, without quotes or punctuation.
+Reply with one line per question, in the same order, formatted as "N. Title".
+
+{numbered}
+
+Titles:"""
+
+    response = await query_model(
+        TITLE_MODEL, [{"role": "user", "content": prompt}], timeout=30.0,
+        profile=generation.resolve_profiles()["title"]
+    )
+    titles: List[Optional[str]] = [None] * len(queries)
+    if response is None:
+        return titles
+
+    for line in (response.get('content') or '').splitlines():
+        match = _LINE_RE.match(line)
+        if match and 1 <= int(match.group(1)) <= len(queries):
+            titles[int(match.group(1)) - 1] = _clean_title(match.group(2))
+    return titles
+
+
+# conversation_id -> (first message, title it currently has)
+_pending: Dict[str, tuple] = {}
+_worker: Optional["asyncio.Task"] = None
+
+
+async def _refinement_worker():
+    """Drain pending refinements in batches until the queue is empty."""
+    global _worker
+    try:
+        while _pending:
+            await asyncio.sleep(TITLE_BATCH_WINDOW)
+            batch = list(_pending.items())[:TITLE_BATCH_MAX]
+            for conversation_id, _ in batch:
+                _pending.pop(conversation_id, None)
+
+            titles = await refine_titles([query for _, (query, _) in batch])
+            for (conversation_id, (_, provisional)), title in zip(batch, titles):
+                if not title:
+                    continue
+                conversation = storage.get_conversation(conversation_id)
+                # Leave titles that changed in the meantime alone
+                if conversation is not None and conversation.get("title") == provisional:
+                    storage.update_conversation_title(conversation_id, title)
+    except Exception as e:
+        print(f"Title refinement failed: {e}")
+    finally:
+        _worker = None
+
+
+def schedule_refinement(conversation_id: str, query: str, provisional_title: str):
+    """
+    Queue a conversation for a model-written title (no-op when disabled).
+
+    Must be called from the event loop; returns immediately.
+
+    Args:
+        conversation_id: Conversation to retitle
+        query: Its first user message
+        provisional_title: The extractive title it has now
+    """
+    global _worker
+    if not TITLE_REFINEMENT_ENABLED:
+        return
+    _pending[conversation_id] = (query, provisional_title)
+    if _worker is None:
+        _worker = asyncio.get_running_loop().create_task(_refinement_worker())
+
+
+def assign_initial_title(conversation_id: str, query: str) -> str:
+    """
+    Give a new conversation its extractive title and queue refinement.
+
+    Args:
+        conversation_id: Conversation identifier
+        query: Its first user message
+
+    Returns:
+        The title that was stored
+    """
+    title = extractive_title(query)
+    storage.update_conversation_title(conversation_id, title)
+    schedule_refinement(conversation_id, query, title)
+    return title
@@ -0,0 +1,296 @@
+"""Span-based tracing of council runs.
+
+One trace is started per council request (start_trace) and child spans are
+opened around stages, model calls and storage operations (span). The active
+span lives in a context variable, so spans opened inside tasks created by
+asyncio.gather nest under the span that created them.
+
+Sampling is decided once per trace. Unsampled traces cost one random() call
+and a no-op context manager per span. When TRACING_SLOW_TRACE_SECONDS is set,
+every trace is recorded and slow ones are exported even if not sampled.
+Finished traces are handed to a background thread that runs the exporter
+(a local JSON-lines file, or OTLP/HTTP JSON for any OpenTelemetry collector),
+so exporting never blocks the event loop.
+"""
+
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from .serialization import dumps
+from .config import (
+    TRACING_ENABLED,
+    TRACING_SAMPLE_RATE,
+    TRACING_SLOW_TRACE_SECONDS,
+    TRACING_EXPORTER,
+    TRACING_PATH,
+    TRACING_OTLP_ENDPOINT,
+)
+
+
+class _Trace:
+    """Spans recorded for one council run."""
+
+    __slots__ = ("trace_id", "sampled", "spans")
+
+    def __init__(self, sampled: bool):
+        self.trace_id = os.urandom(16).hex()
+        self.sampled = sampled
+        self.spans: List["Span"] = []
+
+
+class Span:
+    """A timed operation within a trace."""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, trace: _Trace, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+        trace.spans.append(self)
+
+    def set_attribute(self, key: str, value: Any):
+        """Attach an attribute (str, int, float or bool) to the span."""
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any):
+        """Attach several attributes to the span."""
+        self.attributes.update(attributes)
+
+    def record_error(self, error: BaseException):
+        """Mark the span as failed."""
+        self.error = f"{type(error).__name__}: {error}"
+
+    @property
+    def duration(self) -> float:
+        """Duration in seconds (up to now if the span is still open)."""
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Stand-in span used when there is no sampled trace."""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, **attributes: Any):
+        pass
+
+    def record_error(self, error: BaseException):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    """The innermost open span of the current task, if any."""
+    return _current_span.get()
+
+
+@contextmanager
+def _activate(span_: Span, parent: Optional[Span] = None):
+    token = _current_span.set(span_)
+    try:
+        yield span_
+    except BaseException as e:
+        span_.record_error(e)
+        raise
+    finally:
+        span_.end_ns = time.time_ns()
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Closed from another context (e.g. a streamed response generator)
+            _current_span.set(parent)
+
+
+@contextmanager
+def span(name: str, **attributes: Any):
+    """
+    Open a child span of the current span.
+
+    Does nothing (yields NOOP_SPAN) outside a recorded trace.
+
+    Args:
+        name: Operation name (e.g. "council.stage1")
+        **attributes: Initial span attributes
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+    with _activate(Span(parent.trace, name, parent.span_id, attributes), parent) as child:
+        yield child
+
+
+@contextmanager
+def start_trace(name: str, **attributes: Any):
+    """
+    Start a trace for one council run (or a child span if one is already active).
+
+    Args:
+        name: Root operation name (e.g. "council.run")
+        **attributes: Initial root span attributes
+    """
+    if _current_span.get() is not None:
+        with span(name, **attributes) as child:
+            yield child
+        return
+
+    if not TRACING_ENABLED:
+        yield NOOP_SPAN
+        return
+    sampled = random.random() < TRACING_SAMPLE_RATE
+    if not sampled and TRACING_SLOW_TRACE_SECONDS is None:
+        yield NOOP_SPAN
+        return
+
+    trace = _Trace(sampled)
+    root = Span(trace, name, None, attributes)
+    try:
+        with _activate(root):
+            yield root
+    finally:
+        if trace.sampled or root.duration >= TRACING_SLOW_TRACE_SECONDS:
+            _export(trace.spans)
+
+
+class JsonFileExporter:
+    """Appends finished spans to a JSON-lines file, one span per line."""
+
+    def __init__(self, path: str = TRACING_PATH):
+        self.path = path
+
+    def export(self, spans: List[Span]):
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'ab') as f:
+            for span_ in spans:
+                f.write(dumps(span_.to_dict()) + b"\n")
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPExporter:
+    """Sends spans to an OpenTelemetry collector over OTLP/HTTP (JSON encoding)."""
+
+    def __init__(self, endpoint: str = TRACING_OTLP_ENDPOINT, service_name: str = "llm-council"):
+        self.endpoint = endpoint
+        self.service_name = service_name
+
+    def payload(self, spans: List[Span]) -> Dict[str, Any]:
+        """Build an ExportTraceServiceRequest body."""
+        otlp_spans = []
+        for span_ in spans:
+            otlp_span = {
+                "traceId": span_.trace.trace_id,
+                "spanId": span_.span_id,
+                "name": span_.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span_.start_ns),
+                "endTimeUnixNano": str(span_.end_ns or span_.start_ns),
+                "attributes": [
+                    {"key": key, "value": _otlp_value(value)}
+                    for key, value in span_.attributes.items() if value is not None
+                ],
+                "status": {"code": 2, "message": span_.error} if span_.error else {"code": 1},
+            }
+            if span_.parent_id:
+                otlp_span["parentSpanId"] = span_.parent_id
+            otlp_spans.append(otlp_span)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": self.service_name}}
+            ]},
+            "scopeSpans": [{"scope": {"name": "llm-council"}, "spans": otlp_spans}],
+        }]}
+
+    def export(self, spans: List[Span]):
+        import httpx
+
+        httpx.post(
+            self.endpoint,
+            content=dumps(self.payload(spans)),
+            headers={"Content-Type": "application/json"},
+            timeout=5.0
+        )
+
+
+_exporter = None
+_queue: "queue.Queue[List[Span]]" = queue.Queue(maxsize=1000)
+_worker: Optional[threading.Thread] = None
+
+
+def set_exporter(exporter):
+    """
+    Replace the trace exporter.
+
+    Args:
+        exporter: Any object with an export(spans) method
+    """
+    global _exporter
+    _exporter = exporter
+
+
+def get_exporter():
+    """The configured exporter (TRACING_EXPORTER), created on first use."""
+    global _exporter
+    if _exporter is None:
+        _exporter = OTLPExporter() if TRACING_EXPORTER == "otlp" else JsonFileExporter()
+    return _exporter
+
+
+def _export_loop():
+    while True:
+        spans = _queue.get()
+        try:
+            get_exporter().export(spans)
+        except Exception as e:
+            print(f"Trace export failed: {e}")
+
+
+def _export(spans: List[Span]):
+    """Queue a finished trace for the background exporter (dropped if the queue is full)."""
+    global _worker
+    if _worker is None:
+        _worker = threading.Thread(target=_export_loop, name="trace-exporter", daemon=True)
+        _worker.start()
+    try:
+        _queue.put_nowait(spans)
+    except queue.Full:
+        pass
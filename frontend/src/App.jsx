@@ -187,10 +187,20 @@ function App() {
 
       await api.runCouncilStream(content, modelConfig, sessionId, (eventType, event) => {
         switch (eventType) {
+          case 'queued':
+            setMessages((prev) => {
+              const messages = [...prev];
+              const lastMsg = messages[messages.length - 1];
+              lastMsg.queue = event.data;
+              return messages;
+            });
+            break;
+
           case 'stage1_start':
             setMessages((prev) => {
               const messages = [...prev];
               const lastMsg = messages[messages.length - 1];
+              lastMsg.queue = null;
               lastMsg.loading.stage1 = true;
               // Initialize all models as pending
               if (event.data?.models) {
@@ -291,6 +301,7 @@ function App() {
               const messages = [...prev];
               const lastMsg = messages[messages.length - 1];
               lastMsg.error = event.message || event.data?.message || 'Unknown error';
+              lastMsg.queue = null;
               lastMsg.loading = { stage1: false, stage2: false, stage3: false };
               return messages;
             });
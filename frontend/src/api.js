@@ -65,6 +65,10 @@ export const api = {
       if (response.status === 401) {
         throw new Error('Unauthorized');
       }
+      if (response.status === 429) {
+        const retryAfter = response.headers.get('Retry-After');
+        throw new Error(`Council is busy, retry in ${retryAfter || 'a few'} seconds`);
+      }
       throw new Error('Failed to run council');
     }
 
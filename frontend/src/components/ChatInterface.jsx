@@ -112,6 +112,18 @@ export default function ChatInterface({
                 <div className="assistant-message">
                   <div className="message-label">LLM Council</div>
 
+                  {/* Waiting for a council slot */}
+                  {msg.queue && (
+                    <div className="stage-loading">
+                      <div className="stage-loading-header">
+                        <div className="spinner"></div>
+                        <span>
+                          Queued: position {msg.queue.position} (about {Math.ceil(msg.queue.estimated_wait)}s)
+                        </span>
+                      </div>
+                    </div>
+                  )}
+
                   {/* Stage 1 */}
                   {msg.loading?.stage1 && (
                     <div className="stage-loading">
@@ -0,0 +1,46 @@
+"""Move idle conversations into the archive tier (append-only segment files).
+
+Run it periodically (e.g. daily from cron). Conversations not written for
+the given number of days leave DATA_DIR. They still show up in the list
+and in search, and are restored automatically when opened.
+
+Usage:
+    uv run python scripts/archive_conversations.py [--days 30]
+    uv run python scripts/archive_conversations.py --rebuild-index
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend import archive  # noqa: E402
+from backend.config import ARCHIVE_AFTER_DAYS  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=float, default=ARCHIVE_AFTER_DAYS,
+                        help=f"archive conversations idle this long (default {ARCHIVE_AFTER_DAYS:g})")
+    parser.add_argument("--rebuild-index", action="store_true",
+                        help="recreate the archive index from the segment files and exit")
+    args = parser.parse_args()
+
+    if args.rebuild_index:
+        print(f"Indexed {archive.rebuild_index()} archived conversations")
+        return
+
+    start = time.perf_counter()
+    result = archive.archive_idle(args.days)
+    saved = result["loose_bytes"] - result["archived_bytes"]
+    print(f"Archived {result['archived']} conversations in {time.perf_counter() - start:.2f}s "
+          f"({result['loose_bytes']:,} bytes on disk -> {result['archived_bytes']:,} in segments, {saved:,} saved)")
+    stats = archive.archive_stats()
+    print(f"Archive: {stats['archived']} conversations in {stats['segments']} segments, "
+          f"{stats['live_bytes']:,} of {stats['segment_bytes']:,} bytes live")
+
+
+if __name__ == "__main__":
+    main()
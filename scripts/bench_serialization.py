@@ -0,0 +1,117 @@
+"""Micro-benchmark: JSON serialization cost of one council turn, before and after.
+
+"Before" reproduces the original encoding path: json.dumps per SSE event,
+json.dump(indent=2) plus json.load for every conversation save, and a
+response_model (pydantic) validation + jsonable_encoder pass on reads.
+"After" uses backend.serialization (orjson when installed) for SSE events
+and compact storage, and returns pre-serialized conversation bodies.
+
+Usage:
+    uv run python scripts/bench_serialization.py [messages_in_conversation]
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from backend import serialization  # noqa: E402
+from backend.main import Conversation  # noqa: E402
+
+MODELS = ["anthropic/claude-opus-4.5", "openai/gpt-5.2", "x-ai/grok-4", "google/gemini-3-pro-preview"]
+PARAGRAPH = (
+    "The council considered the question carefully, weighing trade-offs in accuracy, "
+    "clarity and depth. Several answers agreed on the core facts but differed in emphasis. "
+)
+
+
+def make_turn():
+    """Synthetic stage payloads sized like a typical 4-model council turn."""
+    stage1 = [{"model": m, "response": PARAGRAPH * 40} for m in MODELS]
+    stage2 = [
+        {
+            "model": m,
+            "ranking": PARAGRAPH * 15 + "\nFINAL RANKING:\n1. Response A\n2. Response B\n3. Response C\n4. Response D",
+            "parsed_ranking": ["Response A", "Response B", "Response C", "Response D"],
+        }
+        for m in MODELS
+    ]
+    stage3 = {"model": MODELS[-1], "response": PARAGRAPH * 30}
+    metadata = {
+        "label_to_model": {f"Response {l}": m for l, m in zip("ABCD", MODELS)},
+        "aggregate_rankings": [{"model": m, "average_rank": i + 1.0, "rankings_count": 4} for i, m in enumerate(MODELS)],
+    }
+    return stage1, stage2, stage3, metadata
+
+
+def make_conversation(turns, stage1, stage2, stage3):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"Question {i}"})
+        messages.append({"role": "assistant", "stage1": stage1, "stage2": stage2, "stage3": stage3})
+    return {"id": "bench", "created_at": "2025-01-01T00:00:00", "title": "Bench", "messages": messages}
+
+
+def before(conversation, stage1, stage2, stage3, metadata):
+    events = [
+        {"type": "stage1_start"}, {"type": "stage1_complete", "data": stage1},
+        {"type": "stage2_start"}, {"type": "stage2_complete", "data": stage2, "metadata": metadata},
+        {"type": "stage3_start"}, {"type": "stage3_complete", "data": stage3},
+        {"type": "complete"},
+    ]
+    for event in events:
+        f"data: {json.dumps(event)}\n\n".encode()
+    # add_user_message + add_assistant_message: load + save each
+    for _ in range(2):
+        json.loads(json.dumps(conversation, indent=2))
+    # GET /api/conversations/{id} with response_model=Conversation
+    validated = Conversation.model_validate(conversation)
+    json.dumps(jsonable_encoder(validated)).encode()
+
+
+def after(conversation, stage1, stage2, stage3, metadata):
+    events = [
+        {"type": "stage1_start"}, {"type": "stage1_complete", "data": stage1},
+        {"type": "stage2_start"}, {"type": "stage2_complete", "data": stage2, "metadata": metadata},
+        {"type": "stage3_start"}, {"type": "stage3_complete", "data": stage3},
+        {"type": "complete"},
+    ]
+    for event in events:
+        serialization.sse_event(event).encode()
+    for _ in range(2):
+        serialization.loads(serialization.dumps(conversation))
+    serialization.dumps(conversation)
+
+
+def measure(fn, args, repeat=20):
+    fn(*args)  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    stage1, stage2, stage3, metadata = make_turn()
+    conversation = make_conversation(turns, stage1, stage2, stage3)
+    args = (conversation, stage1, stage2, stage3, metadata)
+
+    stored_before = len(json.dumps(conversation, indent=2).encode())
+    stored_after = len(serialization.dumps(conversation))
+
+    t_before = measure(before, args)
+    t_after = measure(after, args)
+
+    print(f"serializer: {'orjson' if serialization.ORJSON_AVAILABLE else 'stdlib (compact)'}")
+    print(f"conversation: {turns} turns, stored size {stored_before / 1024:.0f} KiB -> {stored_after / 1024:.0f} KiB")
+    print(f"per-turn serialization: before {t_before * 1000:.2f} ms, after {t_after * 1000:.2f} ms "
+          f"({t_before / t_after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""Backfill the search index with conversations stored before it existed.
+
+New messages are indexed as they are appended, so this only needs to run
+once after enabling search (or after deleting data/search.db).
+
+Usage:
+    uv run python scripts/build_search_index.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend import storage, search  # noqa: E402
+
+
+def main():
+    start = time.perf_counter()
+    conversations = storage.list_conversations()
+    for meta in conversations:
+        # Archived conversations stay archived
+        conversation = storage.get_conversation(meta["id"], restore=False)
+        if conversation is not None:
+            search.index_conversation(conversation)
+    print(f"Indexed {len(conversations)} conversations in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
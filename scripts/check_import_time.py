@@ -0,0 +1,59 @@
+"""Cold-import budget check for the Vercel entry point (api/index.py).
+
+Imports the handler module in fresh interpreters (best of N runs) and fails
+if the import takes longer than the budget, or if a heavy dependency that
+should only load on first use (httpx, brotli) is imported eagerly.
+
+Usage:
+    uv run python scripts/check_import_time.py [budget_ms] [runs]
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+# Imported lazily by api/index.py; pulling them in at import time is a regression
+LAZY_MODULES = ("httpx", "brotli")
+
+PROBE = f"""
+import sys, time
+start = time.perf_counter()
+import api.index
+elapsed = time.perf_counter() - start
+eager = [name for name in {LAZY_MODULES!r} if name in sys.modules]
+print(elapsed, ",".join(eager))
+"""
+
+
+def measure() -> tuple:
+    """Import api.index in a fresh interpreter; returns (seconds, eagerly imported modules)."""
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout.split()
+    return float(output[0]), output[1].split(",") if len(output) > 1 else []
+
+
+def main():
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 150.0
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    results = [measure() for _ in range(runs)]
+    best_ms = min(seconds for seconds, _ in results) * 1000
+    eager = sorted({name for _, names in results for name in names})
+
+    print(f"api.index cold import: best {best_ms:.1f} ms of {runs} runs (budget {budget_ms:.0f} ms)")
+    failed = False
+    if best_ms > budget_ms:
+        print("FAIL: import time over budget")
+        failed = True
+    if eager:
+        print(f"FAIL: imported eagerly: {', '.join(eager)}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
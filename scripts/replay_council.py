@@ -0,0 +1,71 @@
+"""Replay recorded council runs offline and report wall time per run.
+
+Record real traffic first (LLM_COUNCIL_CASSETTE=record while using the app),
+then re-run the same queries through run_full_council with every upstream
+call served from the cassette. Recorded latencies are preserved unless
+--speed is given, so the timings reflect production traffic shapes while
+the orchestration code under test is the current one.
+
+Usage:
+    uv run python scripts/replay_council.py [cassette_path] [--speed N] [--no-latency]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+os.environ["LLM_COUNCIL_CASSETTE"] = "replay"
+if args:
+    os.environ["LLM_COUNCIL_CASSETTE_PATH"] = args[0]
+if "--no-latency" in sys.argv:
+    os.environ["LLM_COUNCIL_CASSETTE_LATENCY"] = "0"
+if "--speed" in sys.argv:
+    os.environ["LLM_COUNCIL_CASSETTE_SPEED"] = sys.argv[sys.argv.index("--speed") + 1]
+
+from backend.cassette import get_cassette  # noqa: E402
+from backend.council import run_full_council  # noqa: E402
+
+# Prompts the council itself builds; anything else sent as a lone user message is a stage 1 query
+INTERNAL_PROMPTS = (
+    "You are evaluating different responses",
+    "You are the Chairman of an LLM Council",
+    "Generate a very short title",
+)
+
+
+def recorded_runs():
+    """(query, council models) of every stage 1 fan-out on the cassette, in order."""
+    runs = {}
+    for interaction in get_cassette().interactions():
+        messages = interaction["request"]["messages"]
+        if len(messages) != 1 or messages[0]["role"] != "user":
+            continue
+        content = messages[0]["content"]
+        if content.startswith(INTERNAL_PROMPTS):
+            continue
+        runs.setdefault(content, []).append(interaction["model"])
+    return list(runs.items())
+
+
+async def main():
+    runs = recorded_runs()
+    if not runs:
+        print("No recorded council runs found on the cassette")
+        return
+
+    total = 0.0
+    for query, models in runs:
+        start = time.perf_counter()
+        stage1, stage2, stage3, _ = await run_full_council(query, council_models=models, use_cache=False)
+        elapsed = time.perf_counter() - start
+        total += elapsed
+        print(f"{elapsed:7.2f}s  stage1={len(stage1)} stage2={len(stage2)}  {query[:60]!r}")
+    print(f"{len(runs)} runs, {total:.2f}s total, {total / len(runs):.2f}s mean")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())